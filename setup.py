@@ -8,7 +8,7 @@ setup(
     version = "1.0",
     packages = find_packages(),
     scripts = ['bin/twiki_to_moin'],
-    test_suite = "twiki_to_moin.tests.test_conversion.suite",
+    test_suite = "twiki_to_moin.tests",
 
     package_data = {
         # If any package contains *.txt or *.rst files, include them:
@@ -18,12 +18,27 @@
 TWiki to MoinMoin conversion
 
 """
+import collections
+import functools
+import itertools
 import logging 
+import multiprocessing
 from optparse import OptionParser
 import os
 from os.path import isdir, join 
-import re
+import shutil
+import signal
 import sys
+import tempfile
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        # the scandir backport, for Python 2
+        from scandir import scandir
+    except ImportError:
+        scandir = None
 
 __version__ = '1.0'
 
@@ -34,12 +49,21 @@ console_handler = logging.StreamHandler()
 console_formatter = logging.Formatter('%(levelname)s - %(message)s')
 console_handler.setFormatter(console_formatter)
 log.addHandler(console_handler)
+# the messages for every page, which --progress replaces with a summary
+page_log = logging.getLogger('twiki_to_moin.pages')
 
 # constants used by Moin when mapping URL's to file names
 moinslash = '(2f)'
 moindash = '(2d)'
 moinspace = '(2d)'
 
+# topics sent to a worker process at a time, and the chunks of topics 
+# sent ahead, per worker, of the results the conversion loop has taken
+CHUNK_SIZE = 8
+CHUNKS_PER_JOB = 2
+# seconds between checks for a worker process that died
+WORKER_POLL = 1.0
+
 def run(args):
     """"entry point for command line driver
 
@@ -47,11 +71,14 @@ def run(args):
     """
 
     usage_msg = """%prog [options] <twiki_page_dir> <twiki_data_dir> <moin_page_dir>
+       %prog [options] --config <webs.ini> <moin_page_dir>
 
 examples:
 
     %prog awiki/data/Main awiki/pub/Main moin-1.3.5/wiki/data/pages 
 
+    %prog --config webs.ini moin-1.3.5/wiki/data/pages 
+
     %prog --help 
 
     """
@@ -62,18 +89,267 @@ examples:
                   action="store", type="string", dest="prefix", default="",
                   help="not sure; historical and weird ")
 
+    parser.add_option("-c", "--config", 
+                  action="store", type="string", dest="config", default=None,
+                  help="convert the TWiki webs listed in this INI or JSON "
+                       "file in one run (see the README), instead of "
+                       "the web given as arguments")
+
     parser.add_option("-l", "--logfile", 
                   action="store", type="string", dest="logfile", default=None,
                   help="optional log file ")
 
+    parser.add_option("--log-format", 
+                  action="store", type="choice", dest="log_format", 
+                  choices=['text', 'json'], default='text',
+                  help="format of the log messages: text (default), or "
+                       "json, a JSON object per line")
+
+    parser.add_option("--progress", 
+                  action="store", type="int", dest="progress", default=0,
+                  help="log a progress summary every this many pages (and "
+                       "every --progress-interval seconds), instead of a "
+                       "message per page and attachment; warnings and "
+                       "errors are still logged")
+
+    parser.add_option("--progress-interval", 
+                  action="store", type="float", dest="progress_interval", 
+                  default=30.0,
+                  help="seconds between --progress summaries [default: "
+                       "%default]")
+
+    parser.add_option("-e", "--engine", 
+                  action="store", type="choice", dest="engine",
+                  choices=["multipass", "singlepass"], default="multipass",
+                  help="conversion engine: multipass (default) or singlepass")
+
+    parser.add_option("-j", "--jobs", 
+                  action="store", type="int", dest="jobs", default=1,
+                  help="number of worker processes used for conversion")
+
+    parser.add_option("-a", "--attachment-mode", 
+                  action="store", type="choice", dest="attachment_mode",
+                  choices=["copy", "hardlink", "reflink", "symlink"], 
+                  default="copy",
+                  help="how attachments are transferred: copy (default), "
+                       "hardlink, reflink or symlink; falls back to "
+                       "copying when the method is not possible")
+
+    parser.add_option("-d", "--dedup", 
+                  action="store_true", dest="dedup", default=False,
+                  help="hardlink attachments with identical content to "
+                       "the first copy")
+
+    parser.add_option("-m", "--manifest", 
+                  action="store", type="string", dest="manifest", default=None,
+                  help="source manifest file; only topics changed since the "
+                       "last run using it are converted")
+
+    parser.add_option("--resume", 
+                  action="store_true", dest="resume", default=False,
+                  help="continue an interrupted run, skipping the topics "
+                       "it converted, and the topic it stopped on")
+
+    parser.add_option("--journal", 
+                  action="store", type="string", dest="journal", default=None,
+                  help="journal of the topics converted, used by --resume "
+                       "(default twiki_to_moin-journal in the MoinMoin data "
+                       "directory)")
+
+    parser.add_option("--delete-removed", 
+                  action="store_true", dest="delete_removed", default=False,
+                  help="with --manifest, remove Moin pages and attachments "
+                       "whose TWiki source no longer exists")
+
+    parser.add_option("--charset", 
+                  action="store", type="string", dest="charset", 
+                  default="auto",
+                  help="character set of the TWiki pages; auto (default) "
+                       "reads pages that are valid UTF-8 as UTF-8, and "
+                       "others as ISO-8859-1")
+
+    parser.add_option("--cache", 
+                  action="store", type="string", dest="cache", default=None,
+                  help="keep converted pages in this directory, and reuse "
+                       "them for identical TWiki pages, in this run and "
+                       "later ones")
+
+    parser.add_option("--cache-size", 
+                  action="store", type="int", dest="cache_size", 
+                  default=256,
+                  help="size limit of the --cache directory, in MB "
+                       "[default: %default]")
+
+    parser.add_option("--history", 
+                  action="store_true", dest="history", default=False,
+                  help="convert the earlier revisions of each topic from "
+                       "it's TWiki RCS (,v) file")
+
+    parser.add_option("--output-archive", 
+                  action="store", type="string", dest="output_archive", 
+                  default=None,
+                  help="write the converted wiki to this tar (.tar, .tar.gz, "
+                       ".tar.bz2, .tar.xz) or zip file, instead of the "
+                       "MoinMoin data directory")
+
+    parser.add_option("--fsync", 
+                  action="store", type="choice", dest="fsync",
+                  choices=["none", "batch", "each"], default="none",
+                  help="when converted pages are flushed to disk: none "
+                       "(default, left to the operating system), batch "
+                       "or each")
+
+    parser.add_option("--writer-threads", 
+                  action="store", type="int", dest="writer_threads", 
+                  default=4,
+                  help="number of threads writing the Moin pages")
+
+    parser.add_option("--link-report", 
+                  action="store", type="string", dest="link_report", 
+                  default=None,
+                  help="check the links in the converted pages, and write "
+                       "the links to missing topics to this file")
+
+    parser.add_option("--mark-dangling", 
+                  action="store_true", dest="mark_dangling", default=False,
+                  help="check the links in the converted pages, and mark "
+                       "the links to missing topics with /!\\")
+
+    parser.add_option("--topic-index", 
+                  action="store", type="string", dest="topic_index", 
+                  default=None,
+                  help="topic index file used to check links; it is loaded "
+                       "instead of scanning the TWiki directories, and "
+                       "saved at the end of the run")
+
+    parser.add_option("--watch", 
+                  action="store_true", dest="watch", default=False,
+                  help="after converting, keep polling the TWiki web and "
+                       "convert changed topics as new Moin revisions, "
+                       "until interrupted")
+
+    parser.add_option("--watch-interval", 
+                  action="store", type="float", dest="watch_interval", 
+                  default=10.0,
+                  help="seconds between polls with --watch [default: "
+                       "%default]")
+
+    parser.add_option("--plan", 
+                  action="store_true", dest="plan", default=False,
+                  help="estimate the work, disk space and time of the "
+                       "conversion, without converting anything")
+
+    parser.add_option("--verify-against", 
+                  action="store", type="string", dest="verify_against", 
+                  default=None,
+                  help="convert the topics again without writing them, "
+                       "compare the pages with the current revisions in "
+                       "this earlier MoinMoin page directory, and report "
+                       "the differences by conversion stage")
+
+    parser.add_option("--verify-report", 
+                  action="store", type="string", dest="verify_report", 
+                  default=None,
+                  help="file the --verify-against report is written to "
+                       "[default: twiki_to_moin-verify.txt next to the "
+                       "MoinMoin page directory]")
+
+    parser.add_option("--profile", 
+                  action="store_true", dest="profile", default=False,
+                  help="time each conversion stage, and log a report of "
+                       "the totals and the slowest pages")
+
+    parser.add_option("--profile-json", 
+                  action="store", type="string", dest="profile_json", 
+                  default=None,
+                  help="write the --profile report to this JSON file")
+
+    parser.add_option("--metrics-json", 
+                  action="store", type="string", dest="metrics_json", 
+                  default=None,
+                  help="write the run's counters, histograms and stage "
+                       "times to this JSON file, during and after the run")
+
+    parser.add_option("--metrics-prom", 
+                  action="store", type="string", dest="metrics_prom", 
+                  default=None,
+                  help="write the same metrics to this Prometheus text "
+                       "file, for the node exporter's textfile collector")
+
     parser.add_option("-v", "--verbose", 
                   action="count", dest="debug", default=0,
                   help="log additional detail during conversion")
 
     (options, arguments) = parser.parse_args(args[1:])
-    if len(arguments) != 3:
+    if options.config:
+        if len(arguments) != 1:
+            parser.error("With --config, the only argument is the MoinMoin "
+                         "page directory.")
+        # each web has it's own prefix, and the others work on one web
+        for option, value in [('--prefix', options.prefix), 
+                              ('--plan', options.plan),
+                              ('--watch', options.watch)]:
+            if value:
+                parser.error("--config can't be used with {0}.".format(
+                    option))
+    elif len(arguments) != 3:
         parser.error("Three arguments are required.")
         # parser.error() will exit 
+    if options.jobs < 1:
+        parser.error("--jobs must be at least 1.")
+    if options.writer_threads < 1:
+        parser.error("--writer-threads must be at least 1.")
+    if options.progress < 0:
+        parser.error("--progress must be at least 0.")
+    if options.progress_interval <= 0:
+        parser.error("--progress-interval must be more than 0.")
+    if options.cache_size < 1:
+        parser.error("--cache-size must be at least 1.")
+    if options.delete_removed and not options.manifest:
+        parser.error("--delete-removed requires --manifest.")
+    if options.output_archive:
+        from twiki_to_moin.archive import archive_mode
+        if archive_mode(options.output_archive) is None:
+            parser.error("Unknown archive format {0}.".format(
+                options.output_archive))
+        # the archive is written from scratch, with copies of the 
+        # attachments
+        for option, value in [('--manifest', options.manifest), 
+                              ('--resume', options.resume),
+                              ('--dedup', options.dedup), 
+                              ('--attachment-mode', 
+                               options.attachment_mode != 'copy')]:
+            if value:
+                parser.error("--output-archive can't be used with "
+                             "{0}.".format(option))
+    if options.watch:
+        if options.output_archive:
+            parser.error("--watch can't be used with --output-archive.")
+        if options.watch_interval <= 0:
+            parser.error("--watch-interval must be more than 0.")
+    if options.verify_against:
+        # nothing is written but the report
+        for option, value in [('--plan', options.plan), 
+                              ('--watch', options.watch),
+                              ('--output-archive', options.output_archive)]:
+            if value:
+                parser.error("--verify-against can't be used with "
+                             "{0}.".format(option))
+    elif options.verify_report:
+        parser.error("--verify-report requires --verify-against.")
+    from twiki_to_moin.charset import check_charset
+    try:
+        charset = check_charset(options.charset)
+    except LookupError:
+        parser.error("Unknown character set {0}.".format(options.charset))
+    from twiki_to_moin.config import read_config, single_web
+    if options.config:
+        try:
+            webs = read_config(options.config)
+        except ValueError as detail:
+            parser.error(str(detail))
+    else:
+        webs = [single_web(arguments[0], arguments[1], options.prefix)]
 
     # adjust log level, set up file logging
     if options.debug == 1:
@@ -85,32 +361,54 @@ examples:
         formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
         fh.setFormatter(formatter)
         log.addHandler(fh)
+    from twiki_to_moin.logqueue import JsonFormatter, Progress, start_logging
+    if options.log_format == 'json':
+        for handler in log.handlers:
+            handler.setFormatter(JsonFormatter())
+    # the console and log file are written by a background thread
+    start_logging(log)
+    if options.logfile:
         msg = "Enabled logging to file: " + options.logfile
         log.info(msg)
+    progress = None
+    if options.progress:
+        page_log.setLevel(logging.WARNING)
+        progress = Progress(options.progress, options.progress_interval)
 
     log.info("Beginning conversion run")
 
-    twiki_page_dir = arguments[0]
-    twiki_data_dir = arguments[1]
-    moin_page_dir = arguments[2]
-    prefix = options.prefix
+    # with --config, the webs other than the first are only passed to
+    # convert_directory()
+    twiki_page_dir = webs[0].page_dir
+    twiki_data_dir = webs[0].data_dir
+    moin_page_dir = arguments[-1]
+    prefix = webs[0].prefix
+    engine = options.engine
 
     log.info("Running with arguments:")
-    msg = "TWiki page dir: {0} Twiki data dir: {1} Destination dir: {2}".format(
-        twiki_page_dir, twiki_data_dir, moin_page_dir)
+    for web in webs:
+        msg = ("TWiki page dir: {0} Twiki data dir: {1} Destination dir: "
+               "{2}").format(web.page_dir, web.data_dir, moin_page_dir)
+        if options.config:
+            msg += " Prefix: {0}".format(web.prefix)
+        if web.charset:
+            msg += " Charset: {0}".format(web.charset)
+        log.info(msg)
+    msg = "Conversion engine: {0}".format(engine)
     log.info(msg)
 
     # validate arguments 
-    if not os.path.isdir(twiki_page_dir):
-        msg = "The TWiki page directory {0} does not exist.".format(
-            twiki_page_dir)
-        log.error(msg)
-        log_exit(1)
-    if not os.path.isdir(twiki_data_dir):
-        msg = "The TWiki data directory {0} does not exist.".format(
-            twiki_data_dir)
-        log.error(msg)
-        log_exit(1)
+    for web in webs:
+        if not os.path.isdir(web.page_dir):
+            msg = "The TWiki page directory {0} does not exist.".format(
+                web.page_dir)
+            log.error(msg)
+            log_exit(1)
+        if not os.path.isdir(web.data_dir):
+            msg = "The TWiki data directory {0} does not exist.".format(
+                web.data_dir)
+            log.error(msg)
+            log_exit(1)
     if not os.path.isdir(moin_page_dir):
         msg = "The MoinMoin data directory {0} does not exist.".format(
             moin_page_dir)
@@ -119,59 +417,1089 @@ examples:
         log.info(msg)
 
     # validate source and targets are different !
-    if os.path.abspath(twiki_page_dir) == os.path.abspath(moin_page_dir):
-        msg = "The target directory is the same as the twiki page directory."
-        log.error(msg)
-        log_exit(1)
-    if os.path.abspath(twiki_data_dir) == os.path.abspath(moin_page_dir):
-        msg = "The target directory is the same as the twiki data directory."
+    for web in webs:
+        if os.path.abspath(web.page_dir) == os.path.abspath(moin_page_dir):
+            msg = ("The target directory is the same as the twiki page "
+                   "directory.")
+            log.error(msg)
+            log_exit(1)
+        if os.path.abspath(web.data_dir) == os.path.abspath(moin_page_dir):
+            msg = ("The target directory is the same as the twiki data "
+                   "directory.")
+            log.error(msg)
+            log_exit(1)
+        
+    if options.plan:
+        from twiki_to_moin.plan import plan_conversion, log_plan
+        plan = plan_conversion(twiki_page_dir, twiki_data_dir, moin_page_dir,
+            prefix, engine, options.jobs, options.attachment_mode, charset)
+        log_plan(plan)
+        log_exit(0 if plan['enough_space'] else 1)
+
+    if options.verify_against:
+        from twiki_to_moin.verify import verify_conversion, SAME
+        if not os.path.isdir(options.verify_against):
+            msg = "The MoinMoin page directory {0} does not exist.".format(
+                options.verify_against)
+            log.error(msg)
+            log_exit(1)
+        report_path = options.verify_report or join(
+            os.path.dirname(os.path.abspath(moin_page_dir)), 
+            "twiki_to_moin-verify.txt")
+        report = verify_conversion(webs, options.verify_against, 
+            report_path, engine=engine, jobs=options.jobs, charset=charset)
+        counts = report['counts']
+        log_exit(0 if counts[SAME] == sum(counts.values()) else 1)
+
+    if options.watch and not options.manifest:
+        # the watch carries on from the state of the first run
+        options.manifest = join(
+            os.path.dirname(os.path.abspath(moin_page_dir)), 
+            "twiki_to_moin-manifest")
+        msg = "Using source manifest {0} for --watch".format(
+            options.manifest)
+        log.info(msg)
+    # a restarted watch converts the topics changed while it was stopped 
+    # as new revisions, like any other change, rather than replacing the 
+    # revisions it made before
+    restarted = options.watch and os.path.exists(options.manifest)
+
+    profile = None
+    if options.profile or options.profile_json:
+        from twiki_to_moin.profiling import Profile
+        profile = Profile()
+
+    metrics = None
+    if options.metrics_json or options.metrics_prom:
+        from twiki_to_moin.metrics import Metrics
+        metrics = Metrics(options.metrics_json, options.metrics_prom)
+
+    if restarted:
+        msg = "Restarting the watch from source manifest {0}".format(
+            options.manifest)
+        log.info(msg)
+        failures = 0
+    else:
+        try:
+            failures = convert_directory(webs, moin_page_dir, 
+                engine=engine, jobs=options.jobs, 
+                manifest=options.manifest, 
+                delete_removed=options.delete_removed, 
+                attachment_mode=options.attachment_mode, 
+                dedup=options.dedup, profile=profile, fsync=options.fsync,
+                writer_threads=options.writer_threads, 
+                history=options.history, link_report=options.link_report,
+                mark_dangling=options.mark_dangling, 
+                topic_index=options.topic_index, charset=charset, 
+                resume=options.resume, journal=options.journal, 
+                output_archive=options.output_archive, 
+                cache_dir=options.cache, 
+                cache_size=options.cache_size * 1024 * 1024, 
+                metrics=metrics, progress=progress)
+        except KeyboardInterrupt:
+            msg = "Conversion interrupted; use --resume to continue it."
+            log.error(msg)
+            log_exit(1)
+        except WorkerError as detail:
+            msg = "{0}; use --resume to continue without it.".format(detail)
+            log.error(msg)
+            log_exit(1)
+
+    if profile:
+        report = profile.report()
+        profile.log_report(report)
+        if options.profile_json:
+            profile.write_json(options.profile_json, report)
+            msg = "Wrote profile to {0}".format(options.profile_json)
+            log.info(msg)
+    if options.watch:
+        from twiki_to_moin.watch import watch_directory
+        if failures:
+            msg = "{0} TWiki pages could not be converted.".format(failures)
+            log.error(msg)
+        failures = watch_directory(twiki_page_dir, twiki_data_dir, 
+            moin_page_dir, options.manifest, prefix, options.watch_interval,
+            engine=engine, attachment_mode=options.attachment_mode, 
+            charset=charset, cache_dir=options.cache)
+    if failures:
+        msg = "{0} TWiki pages could not be converted.".format(failures)
         log.error(msg)
         log_exit(1)
-        
-    convert_directory(twiki_page_dir,twiki_data_dir, moin_page_dir, prefix)
 
     log_exit(0)
 
 def log_exit(code):
+    from twiki_to_moin.logqueue import stop_logging
     if code == 0:
         log.info("Successfully completed conversion run.")
+        stop_logging(log)
         sys.exit(0)
     else:
         log.info("Conversion completed with errors.")
+        stop_logging(log)
         sys.exit(code)
         
-def convert_directory(old_dir, data_dir, new_dir, prefix=''):
-    """Convert a directory of TWiki data to MoinMoin
+def convert_directory(webs, new_dir, engine='multipass', jobs=1, 
+                      manifest=None, 
+                      delete_removed=False, attachment_mode='copy',
+                      dedup=False, profile=None, fsync='none', 
+                      writer_threads=4, history=False, link_report=None,
+                      mark_dangling=False, topic_index=None, 
+                      charset='auto', resume=False, journal=None,
+                      output_archive=None, cache_dir=None, cache_size=None,
+                      metrics=None, progress=None):
+    """Convert directories of TWiki data to MoinMoin
+
+    webs is a list of config.Web, the TWiki webs to convert into the Moin
+    pages directory new_dir; several webs share the worker pool, the 
+    topic index and the caches, and the topics found and failed in each
+    are logged at the end.  Pass the options by keyword.
+    the topics found by find_topics() are converted in this process, or
+    spread over a pool of jobs worker processes.  Log messages from the
+    workers are passed back and logged here, in topic order.
+    engine selects the conversion function, see conversion.ENGINES
+    attachment_mode is one of copying.ATTACHMENT_MODES
+    dedup hardlinks attachments with the same content to the first copy
+    profile is a profiling.Profile, which collects per stage timings 
+    the converted pages are written by a writer.PageWriter, with 
+    writer_threads threads and the fsync policy (see writer.py)
+    with history, earlier revisions are converted from the RCS files
+    with link_report or mark_dangling, the links in each converted page
+    are looked up in a topicindex.TopicIndex of all the topics; the 
+    links to missing topics are written to the link_report file, and
+    marked in the page with mark_dangling.  topic_index is the index file
+    to load, rather than scanning the webs, and to save the index to.
+    charset is the character set of the TWiki pages, see charset.py, for
+    the webs that don't give their own
+    the topics converted are recorded in the journal file (see journal.py,
+    by default next to new_dir); with resume, the topics an interrupted
+    run converted, and the topic it stopped on, are skipped
+    with output_archive, the topics, their attachments and the global 
+    edit-log are written to that archive (see archive.py) instead of 
+    new_dir and it's parent; new_dir only names the pages directory in 
+    the archive
+    with cache_dir, converted pages are kept there and reused for the 
+    same TWiki text; the cache is then pruned to cache_size bytes (see
+    cache.py)
+    manifest is the path of a source manifest (see manifest.py); when it
+    is given, topics unchanged since the last run are skipped, and with
+    delete_removed, Moin pages whose TWiki source is gone are removed.
+    metrics is a metrics.Metrics, which is given each topic's result, and
+    written as the run goes on, and at the end
+    progress is a logqueue.Progress, which is told of each topic, and
+    logs a summary of the pages converted now and then
+    returns the number of topics that failed to convert
+
+    """
+    if manifest:
+        from twiki_to_moin.manifest import Manifest, conversion_settings
+        manifest = Manifest(manifest)
+        msg = "Using source manifest {0} with {1} entries".format(
+            manifest.path, len(manifest.entries))
+        log.info(msg)
+
+    if dedup:
+        # index of attachment hashes, shared by the worker processes; it 
+        # must be on the same file system as the Moin pages
+        parent = os.path.dirname(os.path.abspath(new_dir))
+        if not os.path.isdir(parent):
+            os.makedirs(parent)
+        dedup = tempfile.mkdtemp(prefix='twiki_to_moin-dedup-', dir=parent)
+
+
+    index = None
+    if link_report or mark_dangling:
+        index = _load_topic_index(webs, topic_index)
+
+    # passed on to convert_topic()
+    topic_options = dict(engine=engine, attachment_mode=attachment_mode,
+                         dedup_dir=dedup or None, 
+                         profile=bool(profile or metrics),
+                         history=history, mark_dangling=mark_dangling,
+                         cache_dir=cache_dir, sizes=bool(metrics))
+    # run totals, see convert_topic()
+    stats = {}
+    # (page, link target, suggestion) of the links to missing topics
+    dangling = []
+
+    from twiki_to_moin.copying import make_directories
+    from twiki_to_moin.editlog import GlobalEditLog
+    from twiki_to_moin.journal import (Journal, TopicMarker, journal_path,
+                                       marker_path)
+    from twiki_to_moin.writer import PageWriter
+    journal = Journal(journal or journal_path(output_archive or new_dir), 
+                      resume)
+    if output_archive:
+        from twiki_to_moin.archive import ArchiveWriter
+        writer = ArchiveWriter(output_archive, fsync)
+        make_topic = writer.make_directories
+        # written here, then added to the archive
+        edit_log_dir = tempfile.mkdtemp(prefix='twiki_to_moin-archive-',
+            dir=os.path.dirname(os.path.abspath(output_archive)))
+        edit_log = GlobalEditLog(join(edit_log_dir, "edit-log"))
+        topic_options['archive'] = True
+    else:
+        # topic directories are made as the topics are found, using one
+        # listing of new_dir to know which already exist
+        if not os.path.isdir(new_dir):
+            os.makedirs(new_dir)
+        existing = set(os.listdir(new_dir))
+        make_topic = functools.partial(make_directories, existing=existing)
+        writer = PageWriter(writer_threads, fsync)
+        edit_log = GlobalEditLog(join(
+            os.path.dirname(os.path.abspath(new_dir)), "edit-log"))
 
-    recursively calls itself to handle the TWiki directory structure
+    # topics found and failed, per web
+    web_stats = [{'found': 0, 'failed': 0} for web in webs]
+    topics = _changed_topics(_find_webs(webs, web_stats, charset), manifest,
+                             engine)
+    # topics skipped by resume, by reason
+    resumed = {'done': 0, 'stopped': 0}
+    if resume:
+        topics = _resumed_topics(topics, journal, manifest, resumed)
+    topics = _prepare_topics(topics, new_dir, make_topic)
+    if jobs > 1:
+        pool = multiprocessing.Pool(jobs, _init_worker, 
+                                    (index, page_log.level, journal.path))
+        marker = None
+        worker = functools.partial(_convert_in_worker, 
+                                   new_dir=new_dir, options=topic_options)
+        results = _imap_bounded(pool, worker, topics, 
+                                window=jobs * CHUNKS_PER_JOB,
+                                check=functools.partial(_check_workers, 
+                                                        journal))
+    else:
+        # topics are converted in the loop below, as they are found 
+        pool = None
+        results = ((task, None, None, None, None) for task in topics)
+        marker = TopicMarker(marker_path(journal.path))
+
+    if cache_dir:
+        from twiki_to_moin.cache import CACHE_PRUNE_ENTRIES
+        # the cache is pruned as it grows, see _prune_cache()
+        next_prune = CACHE_PRUNE_ENTRIES
+    failures = 0
+    current_dir = None
+    finished = interrupted = False
+    try:
+        for task, sources, records, topic_stats, pages in results:
+            item, known, topic_charset = task
+            twiki_dir = os.path.dirname(item[0])
+            if twiki_dir != current_dir:
+                current_dir = twiki_dir
+                msg = "Processing TWiki directory {0} using prefix {1}".format(
+                    twiki_dir, item[2])
+                log.info(msg)
+            if records is None:
+                topic_stats = {}
+                marker.start(item[0])
+                sources = convert_topic(item, new_dir, known, topic_stats, 
+                                        writer=writer, index=index,
+                                        charset=topic_charset, 
+                                        **topic_options)
+                marker.finish()
+            else:
+                for record in records:
+                    log.handle(record)
+                for method, args, kwargs in pages:
+                    getattr(writer, method)(new_dir, *args, key=item[0], 
+                                            **kwargs)
+            timings = topic_stats.pop('timings', None)
+            edit_log.add(topic_stats.pop('edits', ()))
+            dangling.extend(topic_stats.pop('dangling', ()))
+            if index is not None:
+                # topics new since a saved index was written
+                index.add(moin_page_name(item))
+            if timings and profile:
+                profile.add(item[3], timings)
+            if progress:
+                progress.add(sources is None)
+            if metrics:
+                metrics.add(topic_stats, timings, sources is None)
+                if metrics.due():
+                    metrics.write(_skipped(manifest, resumed))
+            add_stats(stats, topic_stats)
+            if cache_dir and stats.get('cache_misses', 0) >= next_prune:
+                _prune_cache(cache_dir, cache_size)
+                next_prune = stats['cache_misses'] + CACHE_PRUNE_ENTRIES
+            if sources is None:
+                failures += 1
+                _web_failed(webs, web_stats, item[0])
+                if manifest:
+                    manifest.mark_seen(item[0], known)
+            else:
+                if manifest:
+                    manifest.record(item[0], item[3], sources, 
+                                    conversion_settings(engine, item[2]))
+                writer.end(item[0])
+            _record_written(writer, journal)
+            if journal.due():
+                journal.flush()
+        finished = True
+    except KeyboardInterrupt:
+        interrupted = True
+        raise
+    finally:
+        # a process that crashed converting a topic leaves it's marker; 
+        # read before the workers are stopped, so their markers aren't.
+        # The topic is converted again after an interrupt.
+        if not (finished or interrupted):
+            journal.stop_crashed()
+        if pool:
+            pool.terminate()
+            pool.join()
+        if marker:
+            marker.close()
+        if finished:
+            unwritten = writer.close()
+            _record_written(writer, journal)
+            journal.flush()
+        else:
+            # the writer is left to the exit, since an interrupt can leave
+            # it's queue locked; the topics converted since the journal 
+            # was last flushed are converted again by --resume
+            if output_archive:
+                # the archive can't be completed
+                shutil.rmtree(edit_log_dir, ignore_errors=True)
+            else:
+                _write_edit_log(edit_log)
+        journal.close(remove=finished)
+        if dedup:
+            shutil.rmtree(dedup, ignore_errors=True)
+
+    if history:
+        msg = "Converted {0} earlier revisions.".format(
+            stats.get('history_revisions', 0))
+        log.info(msg)
+
+    if index is not None:
+        _report_links(dangling, link_report, index, topic_index, webs)
+
+    _write_edit_log(edit_log)
+    if output_archive:
+        if edit_log.entries:
+            writer.add_file("edit-log", edit_log.path)
+        shutil.rmtree(edit_log_dir, ignore_errors=True)
+        writer.finish()
+        msg = "Wrote the converted wiki to {0}".format(output_archive)
+        log.info(msg)
+
+    failures += len(unwritten)
+    if metrics:
+        metrics.unwritten(len(unwritten))
+    for path in unwritten:
+        _web_failed(webs, web_stats, path)
+    if resume:
+        msg = "Skipped {0} TWiki pages converted before resuming.".format(
+            resumed['done'])
+        log.info(msg)
+        failures += resumed['stopped']
+    if manifest and unwritten:
+        # convert them again on the next run
+        manifest.forget([os.path.abspath(path) for path in unwritten])
+
+    if dedup:
+        msg = "Linked {0} duplicate attachments, saving {1} bytes.".format(
+            stats.get('duplicate_attachments', 0), 
+            stats.get('duplicate_bytes', 0))
+        log.info(msg)
 
+    if cache_dir:
+        _report_cache(cache_dir, cache_size, stats)
+
+    if manifest:
+        msg = "Skipped {0} unchanged TWiki pages.".format(manifest.skipped)
+        log.info(msg)
+        for web in webs:
+            _remove_sources(manifest, web.page_dir, new_dir, 
+                            delete_removed, edit_log)
+        manifest.close()
+
+    if progress:
+        progress.finish()
+    if len(webs) > 1:
+        _report_webs(webs, web_stats)
+    if metrics:
+        metrics.write(_skipped(manifest, resumed), finished=True)
+    return failures
+
+def _skipped(manifest, resumed):
+    """the topics skipped so far, as unchanged or done before resuming"""
+    return (manifest.skipped if manifest else 0) + resumed['done']
+
+def _find_webs(webs, web_stats, charset='auto'):
+    """find_topics() for each web, counting the topics in web_stats
+
+    yields (item, character set), the web's own or charset
     """
-    from twiki_to_moin.conversion import twiki2moin
-    from twiki_to_moin.copying import make_page, copy_attachments
+    for web, counts in zip(webs, web_stats):
+        for item in find_topics(web.page_dir, web.data_dir, web.prefix):
+            counts['found'] += 1
+            yield item, web.charset or charset
+
+def _web_failed(webs, web_stats, twiki_path):
+    """count a failed topic against the web it is in"""
+    path = os.path.abspath(twiki_path)
+    best, best_root = None, ''
+    for counts, web in zip(web_stats, webs):
+        root = join(os.path.abspath(web.page_dir), '')
+        # the innermost, when one web is inside another
+        if path.startswith(root) and len(root) > len(best_root):
+            best, best_root = counts, root
+    if best is not None:
+        best['failed'] += 1
 
-    msg = "Processing TWiki directory {0} using prefix {1}".format(
-        old_dir, prefix)
+def _report_webs(webs, web_stats):
+    msg = "Converted {0} TWiki webs, {1} pages found, {2} failed:".format(
+        len(webs), sum(counts['found'] for counts in web_stats),
+        sum(counts['failed'] for counts in web_stats))
     log.info(msg)
-    # TODO - this really should use os.walk()
-    names = os.listdir(old_dir)
-    for name in names:
-        if name[-4:] == ".txt":
-             # convert filename from TWiki to moin format
-            topic = name[:-4]
-            if prefix:
-                topic = join(prefix, topic)
-            topic = re.compile(r"/").sub(moinslash, topic)
-            topic = re.compile(r"-").sub(moindash, topic)
-            topic = re.compile(r" ").sub(moinspace, topic)
-            msg = "Converting TWiki page {0} to Moin topic {1}".format(
-                name, topic)
+    for web, counts in zip(webs, web_stats):
+        msg = "  {0} (prefix '{1}'): {2} pages found, {3} failed".format(
+            web.page_dir, web.prefix, counts['found'], counts['failed'])
+        log.info(msg)
+
+def _write_edit_log(edit_log):
+    if edit_log.entries:
+        count = edit_log.write()
+        msg = "Wrote {0} entries to the global edit-log {1}".format(
+            count, edit_log.path)
+        log.info(msg)
+
+def _report_cache(cache_dir, cache_size, stats):
+    """log the cache hit rate, and prune the cache"""
+    hits = stats.get('cache_hits', 0)
+    lookups = hits + stats.get('cache_misses', 0)
+    msg = ("Conversion cache: {0} hits in {1} pages converted, {2:.1f}% hit "
+           "rate.").format(hits, lookups, 
+                           100.0 * hits / lookups if lookups else 0.0)
+    log.info(msg)
+    removed, kept, size = _prune_cache(cache_dir, cache_size)
+    msg = ("Conversion cache {0} holds {1} pages, {2} bytes; removed {3} "
+           "least recently used.").format(cache_dir, kept, size, removed)
+    log.info(msg)
+
+def _prune_cache(cache_dir, cache_size):
+    """prune the cache to cache_size bytes, see cache.prune_cache()"""
+    from twiki_to_moin.cache import CACHE_SIZE, prune_cache
+    if not os.path.isdir(cache_dir):
+        return 0, 0, 0
+    removed, kept, size = prune_cache(cache_dir, cache_size or CACHE_SIZE)
+    msg = ("Pruned the conversion cache {0} to {1} bytes, removing {2} "
+           "pages.").format(cache_dir, size, removed)
+    log.debug(msg)
+    return removed, kept, size
+
+def _changed_topics(topics, manifest, engine='multipass'):
+    """add each topic's manifest state, dropping unchanged topics
+
+    a topic converted with another engine or prefix has changed
+    yields (item, known, character set)
+    """
+    from twiki_to_moin.manifest import conversion_settings
+    for item, charset in topics:
+        if manifest:
+            known = manifest.known(item[0], 
+                                   conversion_settings(engine, item[2]))
+            if manifest.unchanged(known):
+                manifest.skip(known)
+                continue
+        else:
+            known = None
+        yield item, known, charset
+
+class WorkerError(Exception):
+    """a worker process died, see _check_workers()"""
+    pass
+
+def _check_workers(journal):
+    """raise WorkerError if a worker process has died
+
+    the pool replaces a worker that dies, but the topics it had are never
+    returned, so the run would wait for them forever
+    """
+    if journal.died():
+        raise WorkerError("A worker process died converting a TWiki page")
+
+def _imap_bounded(pool, function, tasks, chunk_size=CHUNK_SIZE, window=2,
+                  check=None):
+    """pool.imap(function, tasks), with at most window chunks in flight
+
+    pool.imap() reads the tasks as fast as the workers take them, and 
+    holds the results until they are used, so when the pages are written
+    slower than they are converted, the results pile up in memory.  Here
+    a chunk of tasks is only sent once the results of an earlier one are
+    taken, which keeps the pages held to window * chunk_size.
+    check is called every WORKER_POLL seconds while waiting for a chunk, 
+    see _check_workers()
+    """
+    tasks = iter(tasks)
+    pending = collections.deque()
+    while True:
+        while len(pending) < window:
+            chunk = list(itertools.islice(tasks, chunk_size))
+            if not chunk:
+                break
+            pending.append(pool.apply_async(_map_chunk, (function, chunk)))
+        if not pending:
+            return
+        result = pending.popleft()
+        while True:
+            try:
+                results = result.get(WORKER_POLL)
+                break
+            except multiprocessing.TimeoutError:
+                if check:
+                    check()
+        for result in results:
+            yield result
+
+def _map_chunk(function, chunk):
+    return [function(task) for task in chunk]
+
+def _resumed_topics(topics, journal, manifest, resumed):
+    """drop the topics done, or stopped on, by the run being resumed
+
+    resumed counts the topics dropped, by reason
+    """
+    for task in topics:
+        item, known = task[:2]
+        reason = journal.skip(item[0])
+        if reason is None:
+            yield task
+            continue
+        resumed[reason] += 1
+        if reason == 'stopped':
+            msg = ("Skipping TWiki page {0}, the conversion stopped on it "
+                   "before").format(item[0])
+            log.error(msg)
+        if manifest:
+            manifest.mark_seen(item[0], known or ())
+
+def _record_written(writer, journal):
+    """note the topics whose pages the writer has finished in the journal"""
+    for twiki_path, written in writer.take_finished():
+        journal.completed(twiki_path, written)
+
+def _prepare_topics(topics, new_dir, make_directories):
+    """make the Moin directories for each topic before it is converted
+
+    make_directories is copying.make_directories(), or the archive's
+    """
+    for task in topics:
+        item = task[0]
+        try:
+            make_directories(new_dir, item[3], bool(item[1]))
+        except OSError as detail:
+            # the topic fails when it is written
+            msg = "Could not create Moin topic {0}: {1}".format(
+                item[3], detail)
+            log.warning(msg)
+        yield task
+
+def _load_topic_index(webs, path=None):
+    """load the topic index from path, or build it by scanning the webs
+
+    webs is a list of config.Web
+    a saved index is only used when none of the directories it was made
+    from has changed since, since topics have been added or removed 
+    """
+    from twiki_to_moin.topicindex import TopicIndex
+    if path and os.path.exists(path):
+        index = TopicIndex.load(path)
+        if _index_current(index, webs):
+            msg = "Loaded topic index {0} with {1} topics".format(
+                path, len(index))
             log.info(msg)
+            return index
+        msg = "Topic index {0} is out of date, scanning the webs".format(
+            path)
+        log.info(msg)
+    index = TopicIndex()
+    for web in webs:
+        for item in find_topics(web.page_dir, None, web.prefix, 
+                                index.directories):
+            index.add(moin_page_name(item))
+    msg = "Indexed {0} TWiki topics".format(len(index))
+    log.info(msg)
+    return index
+
+def _index_current(index, webs):
+    """True if the TWiki directories of a saved index are unchanged"""
+    for web in webs:
+        if os.path.abspath(web.page_dir) not in index.directories:
+            return False
+    for path, mtime in index.directories.items():
+        try:
+            if os.stat(path).st_mtime != mtime:
+                return False
+        except OSError:
+            return False
+    return True
+
+def _report_links(dangling, link_report, index, topic_index, webs):
+    """log and write the dangling links, and save the topic index"""
+    from twiki_to_moin.topicindex import resolve_case, write_report
+    pages = len(set(page for page, target, suggestion in dangling))
+    msg = "Found {0} links to missing topics in {1} pages.".format(
+        len(dangling), pages)
+    log.info(msg)
+    if link_report:
+        # the index has no names, so the webs are listed again for the 
+        # topics that differ from a link only in case
+        names = (moin_page_name(item) for web in webs 
+                 for item in find_topics(web.page_dir, None, web.prefix))
+        write_report(link_report, resolve_case(dangling, names))
+        msg = "Wrote the dangling link report to {0}".format(link_report)
+        log.info(msg)
+    if topic_index:
+        index.save(topic_index)
+        msg = "Saved topic index {0}".format(topic_index)
+        log.info(msg)
+
+def _remove_sources(manifest, old_dir, new_dir, delete_removed, 
+                    edit_log=None):
+    """report, and optionally delete, output for removed TWiki sources
+
+    the entries of deleted topics are removed from the edit_log, a
+    editlog.GlobalEditLog
+    """
+
+    removed = manifest.removed(old_dir)
+    if not removed:
+        return
+    if not delete_removed:
+        msg = ("{0} TWiki pages or attachments in the manifest no longer "
+               "exist; use --delete-removed to remove them.").format(
+               len(removed))
+        log.info(msg)
+        return
+    for path, owner, topic in removed:
+        if path == owner:
+            msg = "Removing Moin topic {0}; {1} no longer exists".format(
+                topic, path)
+            log.info(msg)
+            shutil.rmtree(join(new_dir, topic), ignore_errors=True)
+        else:
+            msg = "Removing attachment {0} from Moin topic {1}".format(
+                os.path.basename(path), topic)
+            log.info(msg)
+            try:
+                os.remove(join(new_dir, topic, "attachments", 
+                               os.path.basename(path)))
+            except OSError:
+                pass
+    topics = [topic for path, owner, topic in removed if path == owner]
+    if edit_log and topics:
+        count = edit_log.remove(topics)
+        msg = "Removed {0} entries of deleted topics from the global " \
+              "edit-log {1}".format(count, edit_log.path)
+        log.info(msg)
+    manifest.forget([path for path, owner, topic in removed])
+
+def find_topics(old_dir, data_dir, prefix='', directories=None, 
+                stats=None):
+    """find the TWiki topics in a directory tree
+
+    yields a (twiki_path, pub_path, prefix, moin_topic) tuple per topic,
+    including the topics in sub directories (TWiki sub webs).  pub_path
+    is the topic's attachment directory, or None when there is no 
+    data_dir.  The modification time of each directory read is added
+    to the directories dict, when it is given.  The os.stat() result of
+    each topic is added to the stats dict, when it is given, and a topic
+    removed before it can be read is left out.
+
+    Directories are read as a stream, and sub directories are visited 
+    after the topics of their parent.  A directory reached a second time
+    through a symbolic link is skipped.
+
+    """
+    visited = set()
+    pending = [(old_dir, data_dir, prefix)]
+    while pending:
+        twiki_dir, pub_dir, prefix = pending.pop()
+        try:
+            st = os.stat(twiki_dir)
+        except OSError as detail:
+            msg = "Could not read TWiki directory {0}: {1}".format(
+                twiki_dir, detail)
+            log.warning(msg)
+            continue
+        if (st.st_dev, st.st_ino) in visited:
+            msg = "Skipping TWiki directory {0}, it was already processed"\
+                .format(twiki_dir)
+            log.warning(msg)
+            continue
+        visited.add((st.st_dev, st.st_ino))
+        if directories is not None:
+            directories[os.path.abspath(twiki_dir)] = st.st_mtime
+
+        subdirs = []
+        for name, is_topic, topic_st in _scan_directory(
+                twiki_dir, stats is not None):
+            if is_topic:
+                if pub_dir:
+                    pub_path = join(pub_dir, name[:-4])
+                else:
+                    pub_path = None
+                if stats is not None:
+                    stats[join(twiki_dir, name)] = topic_st
+                yield (join(twiki_dir, name), pub_path, prefix, 
+                       moin_topic_name(name[:-4], prefix))
+            else:
+                subdirs.append(name)
+        # pending is a stack; push in reverse to visit in directory order
+        for name in reversed(subdirs):
+            if pub_dir:
+                sub_pub_dir = join(pub_dir, name)
+            else:
+                sub_pub_dir = pub_dir
+            pending.append((join(twiki_dir, name), sub_pub_dir, 
+                            join(prefix, name)))
+
+def _scan_directory(path, stat=False):
+    """yield (name, is_topic, st) for the topics and sub directories in 
+    path; with stat, st is a topic's os.stat() result, otherwise None
+
+    uses scandir when it is available, which gets the entry type from
+    the directory listing without a stat call per entry, and keeps the
+    stat result of the entry.  A topic removed before it's stat is left
+    out.
+    """
+    if scandir:
+        for entry in scandir(path):
+            if entry.name.endswith(".txt"):
+                if entry.is_file():
+                    try:
+                        st = entry.stat() if stat else None
+                    except OSError:
+                        continue
+                    yield entry.name, True, st
+            elif entry.is_dir():
+                yield entry.name, False, None
+    else:
+        for name in os.listdir(path):
+            if name.endswith(".txt"):
+                if os.path.isfile(join(path, name)):
+                    try:
+                        st = os.stat(join(path, name)) if stat else None
+                    except OSError:
+                        continue
+                    yield name, True, st
+            elif isdir(join(path, name)):
+                yield name, False, None
+
+def moin_page_name(item):
+    """the Moin page name of a topic from find_topics()"""
+    name = os.path.basename(item[0])[:-4]
+    if item[2]:
+        return item[2].replace(os.sep, '/') + '/' + name
+    return name
+
+def moin_topic_name(twiki_name, prefix=''):
+    """convert a TWiki topic name to Moin's on disk format"""
+
+    topic = twiki_name
+    if prefix:
+        topic = join(prefix, topic)
+    topic = topic.replace("/", moinslash)
+    topic = topic.replace("-", moindash)
+    topic = topic.replace(" ", moinspace)
+    return topic
+
+def convert_topic(item, new_dir, known=None, stats=None, 
+                  engine='multipass', attachment_mode='copy', dedup_dir=None,
+                  profile=False, writer=None, history=False, index=None,
+                  mark_dangling=False, charset='auto', archive=False,
+                  new_revision=False, cache_dir=None, sizes=False):
+    """Convert a single TWiki topic, and copy it's attachments
+
+    item is a tuple from find_topics()
+    known is the topic's manifest state, or None when there is no manifest
+    stats is a dict of counters, updated with the work done
+    engine and attachment_mode are as for convert_directory()
+    dedup_dir is the attachment hash index, when deduplicating
+    with profile, the stage timings are stored in stats['timings']
+    writer is the writer.PageWriter the page is queued to; without one,
+    the topic's directories are made, and the page written, here
+    with history, the earlier revisions in the topic's RCS file are 
+    converted too, and written as the Moin revisions before the current one
+    index is the topicindex.TopicIndex used to check the page's links;
+    the links to missing topics are stored in stats['dangling'], and 
+    marked in the page with mark_dangling
+    charset is the character set of the page, see charset.decode_page()
+    with archive, the attachments are passed to the writer, see 
+    archive.ArchiveWriter
+    with new_revision, and no writer, a changed page is added as the 
+    revision after the topic's current Moin revision, and it's entry 
+    appended to the topic's edit-log, instead of replacing them (see 
+    watch.py); history is then ignored
+    cache_dir is the conversion cache, see cache.cached_convert()
+    with sizes, the page's size in bytes, before and after conversion,
+    is stored in stats['bytes_in'] and stats['bytes_out'] (see --metrics)
+    returns a list of (path, size, mtime, hash) for the topic and it's
+    attachments (empty without a manifest); failures are logged, and 
+    return None
+
+    """
+    from twiki_to_moin.charset import decode_page, to_bytes
+    from twiki_to_moin.conversion import ENGINES
+    from twiki_to_moin.copying import (make_page, make_edit_log, 
+                                       make_directories, copy_attachments,
+                                       current_revision)
+    from twiki_to_moin.manifest import source_record
+    from twiki_to_moin.meta import parse_meta
+    from twiki_to_moin.profiling import clock
+
+    twiki_path, pub_path, prefix, topic = item
+    if stats is None:
+        stats = {}
+    if profile:
+        timings = stats['timings'] = []
+    else:
+        timings = None
+    try:
+        if writer is None:
+            make_directories(new_dir, topic, bool(pub_path))
+        with open(twiki_path, 'rb') as f:
+            data = f.read()
+        start = clock()
+        txt = decode_page(data, charset)
+        if profile:
+            timings.append(('decode', clock() - start, len(data), len(txt)))
+        start = clock()
+        body, meta = parse_meta(txt)
+        if profile:
+            timings.append(('meta', clock() - start, len(txt), len(body)))
+        sources = []
+        if known is not None:
+            sources.append(source_record(twiki_path, data))
+        previous = known and known.get(os.path.abspath(twiki_path))
+        if previous and previous[2] == sources[0][3]:
+            msg = "TWiki page {0} is unchanged".format(
+                os.path.basename(twiki_path))
+            page_log.debug(msg)
+        else:
+            msg = "Converting TWiki page {0} to Moin topic {1}".format(
+                os.path.basename(twiki_path), topic)
+            page_log.info(msg)
+            if cache_dir:
+                from twiki_to_moin.cache import cached_convert
+                convert = functools.partial(cached_convert, cache_dir, 
+                                            engine, stats=stats)
+            else:
+                convert = ENGINES[engine]
+            if writer is None:
+                write = functools.partial(make_page, new_dir)
+                write_log = functools.partial(make_edit_log, new_dir,
+                                              append=new_revision)
+            else:
+                write = functools.partial(writer.write, new_dir, 
+                                          key=twiki_path)
+                write_log = functools.partial(writer.write_edit_log, 
+                                              new_dir, key=twiki_path)
+            revision, older, delta = 1, (), None
+            if new_revision:
+                revision = current_revision(new_dir, topic) + 1
+            elif history and os.path.isfile(twiki_path + ',v'):
+                revision, older, delta = _topic_history(twiki_path, data)
+            new_txt = convert(body, prefix, timings, meta=False)
+            if index is not None:
+                new_txt = _check_links(item, new_txt, index, mark_dangling,
+                                       stats, timings)
+            start = clock()
+            write(topic, new_txt, revision=revision)
+            if sizes:
+                stats['bytes_in'] = len(data)
+                stats['bytes_out'] = len(to_bytes(new_txt))
+            if profile:
+                timings.append(('write', clock() - start, 
+                                len(new_txt), len(new_txt)))
+            # edit-log entries, newest first
+            edits = [_edit_entry(twiki_path, topic, revision, meta, delta)]
+            if older:
+                _convert_history(twiki_path, prefix, topic, revision, older,
+                                 convert, write, edits, stats, timings, 
+                                 charset)
+            edits.reverse()
+            write_log(topic, [line for usecs, line in edits])
+            stats['edits'] = edits
+        if pub_path:
+            start = clock()
+            attachments = copy_attachments(new_dir, 
+                os.path.dirname(pub_path), os.path.basename(pub_path), 
+                topic, meta.attachments, known, attachment_mode, dedup_dir,
+                stats, writer if archive else None, twiki_path)
+            if known is not None:
+                sources.extend(attachments)
+            if profile:
+                timings.append(('attachments', clock() - start, 0, 0))
+    except Exception:
+        msg = "Could not convert TWiki page {0}".format(twiki_path)
+        log.exception(msg)
+        return None
+    return sources
+
+def _check_links(item, txt, index, mark, stats, timings):
+    """check the links of a converted page, see convert_topic()"""
+    from twiki_to_moin.profiling import clock
+    from twiki_to_moin.topicindex import check_links
+
+    start = clock()
+    page = moin_page_name(item)
+    new_txt, dangling = check_links(txt, page, index, mark)
+    if dangling:
+        msg = "{0} links to missing topics in {1}".format(len(dangling), page)
+        page_log.debug(msg)
+        stats['dangling'] = [(page, target, suggestion) 
+                             for target, suggestion in dangling]
+    if timings is not None:
+        timings.append(('linkcheck', clock() - start, len(txt), len(new_txt)))
+    return new_txt
+
+def _topic_history(twiki_path, data):
+    """find the earlier revisions of a topic in it's RCS file
+
+    returns the Moin revision number of the current page, an iterator of
+    (bytes, RCS delta) for the earlier revisions, newest first, and the 
+    RCS delta of the current page (see rcs.RcsFile).  The current page is
+    usually the newest RCS revision; if it's not, it is one revision more,
+    with no RCS delta.
+    """
+    from twiki_to_moin.rcs import RcsFile, RcsError
+    try:
+        archive = RcsFile(twiki_path + ',v')
+        revisions = archive.revisions()
+        newest = next(revisions, None)
+    except (IOError, OSError, RcsError) as detail:
+        msg = "Could not read the history of TWiki page {0}: {1}".format(
+            os.path.basename(twiki_path), detail)
+        log.warning(msg)
+        return 1, (), None
+    if newest is None:
+        return 1, (), None
+    count = len(archive.trunk)
+    older = ((text, archive.deltas[number]) for number, text in revisions)
+    delta = archive.deltas[newest[0]]
+    if newest[1] != data:
+        count += 1
+        older = itertools.chain([(newest[1], delta)], older)
+        delta = None
+    return count, older, delta
+
+def _convert_history(twiki_path, prefix, topic, revision, older, convert,
+                     write, edits, stats, timings, charset='auto'):
+    """convert and write the earlier revisions of a topic, newest first
+
+    their edit-log entries are added to edits
+    """
+    from twiki_to_moin.charset import decode_page
+    from twiki_to_moin.meta import parse_meta
+    from twiki_to_moin.rcs import RcsError
+    from twiki_to_moin.profiling import clock
+
+    msg = "Converting {0} earlier revisions of TWiki page {1}".format(
+        revision - 1, os.path.basename(twiki_path))
+    page_log.info(msg)
+    start = clock()
+    size_in = size_out = 0
+    try:
+        for data, delta in older:
+            revision -= 1
+            text = decode_page(data, charset)
+            body, meta = parse_meta(text)
+            new_txt = convert(body, prefix, meta=False)
+            write(topic, new_txt, revision=revision, current=False)
+            edits.append(_edit_entry(twiki_path, topic, revision, meta, delta))
+            size_in += len(text)
+            size_out += len(new_txt)
+            stats['history_revisions'] = stats.get('history_revisions', 0) + 1
+    except RcsError as detail:
+        msg = ("Could not read revisions before {0} of TWiki page {1}: "
+               "{2}").format(revision, os.path.basename(twiki_path), detail)
+        log.warning(msg)
+    if timings is not None:
+        timings.append(('history', clock() - start, size_in, size_out))
+
+def _edit_entry(twiki_path, topic, revision, meta, delta=None):
+    """the edit-log entry of a revision, see editlog.edit_log_entry()
+
+    the author and date come from the revision's TOPICINFO (meta is it's
+    meta.TopicMeta), or else it's RCS delta, or the TWiki file's 
+    modification time
+    """
+    from twiki_to_moin.editlog import topic_info, rcs_date, edit_log_entry
+    info = topic_info(meta)
+    if info:
+        seconds, author = info[:2]
+    else:
+        try:
+            seconds, author = rcs_date(delta['date']), delta['author'] or ''
+        except (TypeError, ValueError):
+            seconds, author = os.path.getmtime(twiki_path), ''
+    return edit_log_entry(seconds, revision, topic, author)
+
+class _RecordCollector(logging.Handler):
+    """logging handler used in worker processes to hold log records
+
+    the records are returned with each topic's result, so the parent
+    can log them in order.
+
+    """
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        # make the record safe to pickle
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(
+                record.exc_info)
+            record.exc_info = None
+        record.msg = record.getMessage()
+        record.args = None
+        self.records.append(record)
+
+_collector = None
+_buffer = None
+_index = None
+_marker = None
+
+def _init_worker(index=None, page_level=logging.NOTSET, journal_path=None):
+    """set up logging, page buffering and the topic index in a worker
+
+    page_level is the level of the page_log, see --progress; the worker
+    names the topic it is converting in a marker of journal_path
+    """
+    global _collector, _buffer, _index, _marker
+    _index = index
+    if journal_path:
+        from twiki_to_moin.journal import TopicMarker, marker_path
+        _marker = TopicMarker(marker_path(journal_path))
+    page_log.setLevel(page_level)
+    # an interrupt is handled by the parent, which stops the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    from twiki_to_moin.writer import PageBuffer
+    _collector = _RecordCollector()
+    _buffer = PageBuffer()
+    for handler in log.handlers[:]:
+        log.removeHandler(handler)
+    log.addHandler(_collector)
+
+def _convert_in_worker(task, new_dir, options):
+    item, known, charset = task
+    stats = {}
+    if _marker:
+        _marker.start(item[0])
+    sources = convert_topic(item, new_dir, known, stats, writer=_buffer,
+                            index=_index, charset=charset, **options)
+    if _marker:
+        _marker.finish()
+    records = _collector.records
+    _collector.records = []
+    return task, sources, records, stats, _buffer.take()
 
-            txt = file(os.path.join(old_dir, name)).read()
-            new_txt = twiki2moin(txt, prefix)
-            make_page( new_dir, topic, new_txt) 
-            if data_dir:
-                copy_attachments( new_dir, data_dir, name[:-4], topic, txt)
-        elif isdir(join(old_dir, name)):
-                convert_directory(join(old_dir, name), 
-                    new_dir, join(data_dir, name), join(prefix, name))
+def add_stats(totals, stats):
+    """add a topic's counters to the run totals"""
+    for key, value in stats.items():
+        totals[key] = totals.get(key, 0) + value
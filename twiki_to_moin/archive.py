@@ -0,0 +1,162 @@
+#
+#   Copyright 2013 La Honda Research Center, Inc.
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Writing the converted wiki to an archive (--output-archive)
+
+ArchiveWriter stands in for the writer.PageWriter, and writes the Moin
+topics, their attachments and the global edit-log as the entries of a
+single tar or zip file, with the layout of a MoinMoin data directory
+(pages/Topic/revisions/00000001, ..., edit-log).  A background thread
+adds the entries, through the same bounded queue as PageWriter, so the
+memory used stays bounded; attachments are streamed from their TWiki
+files.
+
+"""
+import io
+import logging
+import os
+import tarfile
+import time
+import zipfile
+
+from twiki_to_moin.charset import to_bytes
+from twiki_to_moin.writer import PageWriter, fsync_file
+
+log = logging.getLogger('twiki_to_moin')
+
+# archive name endings, and the tarfile mode or 'zip'
+ARCHIVE_FORMATS = [
+    ('.tar', 'w|'),
+    ('.tar.gz', 'w|gz'),
+    ('.tgz', 'w|gz'),
+    ('.tar.bz2', 'w|bz2'),
+    ('.tbz2', 'w|bz2'),
+    ('.tar.xz', 'w|xz'),
+    ('.txz', 'w|xz'),
+    ('.zip', 'zip'),
+]
+
+def archive_mode(path):
+    """the ARCHIVE_FORMATS mode for an archive name, or None"""
+    for ending, mode in ARCHIVE_FORMATS:
+        if path.endswith(ending):
+            return mode
+    return None
+
+
+class ArchiveWriter(PageWriter):
+    """write Moin topics as the entries of a tar or zip archive
+
+    new_dir, given to each method as for PageWriter, is only used for
+    it's name, the top directory of the topics in the archive.  close()
+    writes the remaining entries; add_file() can then add more, and 
+    finish() completes the archive.
+    """
+
+    def __init__(self, path, fsync='none'):
+        mode = archive_mode(path)
+        if mode is None:
+            raise ValueError("unknown archive format {0}".format(path))
+        self.path = path
+        self.mtime = time.time()
+        if mode == 'zip':
+            self.archive = zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED,
+                                           allowZip64=True)
+            self.tar = None
+        else:
+            self.archive = self.tar = tarfile.open(
+                path, mode, format=tarfile.PAX_FORMAT)
+        # the single thread keeps the entries in the order queued
+        PageWriter.__init__(self, 1, fsync)
+
+    def _name(self, new_dir, topic, *parts):
+        return '/'.join((os.path.basename(os.path.normpath(new_dir)), 
+                         topic) + parts)
+
+    def make_directories(self, new_dir, topic, attachments=True):
+        """queue the directory entries of a topic"""
+        names = [self._name(new_dir, topic), 
+                 self._name(new_dir, topic, "revisions")]
+        if attachments:
+            names.append(self._name(new_dir, topic, "attachments"))
+        self.queue.put((topic, topic, self._add_directories, (names,)))
+
+    def write(self, new_dir, topic, txt, key=None, revision=1, current=True):
+        number = "{0:08d}".format(revision)
+        entries = [(self._name(new_dir, topic, "revisions", number), 
+                    to_bytes(txt))]
+        if current:
+            entries.append((self._name(new_dir, topic, "current"), 
+                            to_bytes(number)))
+        self._put(key or topic, topic, self._add_data, (entries,))
+
+    def write_edit_log(self, new_dir, topic, lines, key=None):
+        entries = [(self._name(new_dir, topic, "edit-log"), 
+                    to_bytes("".join(lines)))]
+        self._put(key or topic, topic, self._add_data, (entries,))
+
+    def write_attachment(self, new_dir, topic, name, src, key=None):
+        """queue an attachment, read from src when it's added"""
+        self._put(key or topic, topic, self.add_file, 
+                  (self._name(new_dir, topic, "attachments", name), src))
+
+    def _add_directories(self, names):
+        for name in names:
+            if self.tar:
+                info = tarfile.TarInfo(name)
+                info.type = tarfile.DIRTYPE
+                info.mode = 0o755
+                info.mtime = self.mtime
+                self.tar.addfile(info)
+            else:
+                info = zipfile.ZipInfo(name + '/', 
+                                       time.localtime(self.mtime)[:6])
+                info.external_attr = (0o40755 << 16) | 0x10
+                self.archive.writestr(info, b'')
+        return []
+
+    def _add_data(self, entries):
+        for name, data in entries:
+            if self.tar:
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                info.mode = 0o644
+                info.mtime = self.mtime
+                self.tar.addfile(info, io.BytesIO(data))
+            else:
+                info = zipfile.ZipInfo(name, time.localtime(self.mtime)[:6])
+                info.compress_type = zipfile.ZIP_DEFLATED
+                info.external_attr = 0o644 << 16
+                self.archive.writestr(info, data)
+        return []
+
+    def add_file(self, name, src):
+        """add a file to the archive, read in chunks"""
+        if self.tar:
+            with open(src, 'rb') as f:
+                info = self.tar.gettarinfo(arcname=name, fileobj=f)
+                info.mode = 0o644
+                self.tar.addfile(info, f)
+        else:
+            self.archive.write(src, name)
+        return []
+
+    def finish(self):
+        """complete the archive"""
+        self.archive.close()
+        if self.fsync != 'none':
+            fsync_file(self.path)
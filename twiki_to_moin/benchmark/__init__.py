@@ -0,0 +1,25 @@
+#
+#   Copyright 2013 La Honda Research Center, Inc.
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Benchmarks for twiki_to_moin
+
+generate.py builds synthetic TWiki webs, and harness.py measures the
+conversion speed on them.  Run the benchmarks with
+
+    python -m twiki_to_moin.benchmark --help
+
+"""
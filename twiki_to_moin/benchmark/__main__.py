@@ -0,0 +1,79 @@
+#
+#   Copyright 2013 La Honda Research Center, Inc.
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+command line driver for the benchmarks
+
+"""
+from optparse import OptionParser
+import json
+import sys
+
+from twiki_to_moin.benchmark.generate import DEFAULTS
+from twiki_to_moin.benchmark.harness import run_benchmarks, write_results
+
+def main(args):
+    usage_msg = """%prog [options]
+
+Generates a synthetic TWiki web, and measures the conversion speed on it.
+
+examples:
+
+    %prog --topics 2000 --jobs 1,4 --output results-1.0.json
+
+    """
+    parser = OptionParser(usage=usage_msg, prog="twiki_to_moin.benchmark")
+    parser.add_option("-o", "--output", 
+                  action="store", type="string", dest="output", default=None,
+                  help="write the results to this JSON file")
+    parser.add_option("-e", "--engines", 
+                  action="store", type="string", dest="engines", 
+                  default="multipass,singlepass",
+                  help="comma separated conversion engines to measure")
+    parser.add_option("-j", "--jobs", 
+                  action="store", type="string", dest="jobs", default="1",
+                  help="comma separated worker counts for directory runs")
+    parser.add_option("--web-dir", 
+                  action="store", type="string", dest="web_dir", default=None,
+                  help="write the generated web here, and keep it")
+    parser.add_option("--no-directory", 
+                  action="store_false", dest="directory", default=True,
+                  help="skip the complete directory conversion runs")
+    parser.add_option("--no-pathological", 
+                  action="store_false", dest="pathological", default=True,
+                  help="skip the pathological inputs")
+    # one option per generator setting
+    for name, value in sorted(DEFAULTS.items()):
+        parser.add_option("--" + name.replace('_', '-'),
+                  action="store", type=type(value).__name__, dest=name,
+                  default=value, 
+                  help="generator setting (default {0})".format(value))
+
+    (options, arguments) = parser.parse_args(args[1:])
+    settings = dict((name, getattr(options, name)) for name in DEFAULTS)
+    results = run_benchmarks(
+        engines=options.engines.split(','),
+        jobs=[int(n) for n in options.jobs.split(',')],
+        directory=options.directory, pathological=options.pathological,
+        web_dir=options.web_dir, **settings)
+    if options.output:
+        write_results(results, options.output)
+    else:
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,228 @@
+#
+#   Copyright 2013 La Honda Research Center, Inc.
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Synthetic TWiki web generator
+
+generate_web() writes a TWiki data directory (topic .txt files) and pub
+directory (attachments) with a configurable size and mix of markup.  The
+output is determined by the seed, so runs can be compared.
+
+pathological_pages() returns inputs known to make the conversion regular
+expressions backtrack heavily.
+
+"""
+import math
+import os
+import random
+
+WORDS = ("the a wiki page topic server install release build test "
+         "network user group project report meeting notes update "
+         "config file version data system support design review").split()
+
+# default generator settings
+DEFAULTS = {
+    'topics': 200,
+    # page sizes in bytes follow a log normal distribution 
+    'size_median': 3000,
+    'size_sigma': 1.0,
+    'max_size': 500000,
+    # chance that a block of the page is a table, and rows per table
+    'table_density': 0.1,
+    'table_rows': 10,
+    # links per 100 words
+    'link_density': 3.0,
+    # chance a topic has attachments, the most it has, and their size
+    'attachment_density': 0.2,
+    'max_attachments': 3,
+    'attachment_size': 20000,
+    # sub webs, and how deep they nest
+    'subwebs': 2,
+    'subweb_depth': 2,
+    'seed': 1,
+}
+
+def generate_web(data_dir, pub_dir, **settings):
+    """write a synthetic TWiki web under data_dir and pub_dir
+
+    settings override DEFAULTS.  Topics are spread over the top web and
+    it's sub webs, and link to topics in the same web.  returns the list
+    of topic files written.
+
+    """
+    config = dict(DEFAULTS)
+    config.update(settings)
+    rng = random.Random(config['seed'])
+
+    webs = ['']
+    for i in range(config['subwebs']):
+        parent = ''
+        for level in range(config['subweb_depth']):
+            parent = os.path.join(parent, 'Sub{0}Level{1}'.format(i, level))
+            webs.append(parent)
+
+    names = [wiki_word(rng) + str(i) for i in range(config['topics'])]
+    # the topics of each web, which it's topics link to
+    web_names = [names[i::len(webs)] for i in range(len(webs))]
+    written = []
+    for i, name in enumerate(names):
+        web = webs[i % len(webs)]
+        topic_dir = os.path.join(data_dir, web)
+        if not os.path.isdir(topic_dir):
+            os.makedirs(topic_dir)
+        attachments = []
+        if rng.random() < config['attachment_density']:
+            attachments = write_attachments(rng, config,
+                os.path.join(pub_dir, web, name))
+        txt = topic_text(rng, config, web_names[i % len(webs)], attachments)
+        path = os.path.join(topic_dir, name + '.txt')
+        with open(path, 'w') as f:
+            f.write(txt)
+        written.append(path)
+    return written
+
+def wiki_word(rng):
+    return ''.join(rng.choice(WORDS).capitalize() 
+                   for i in range(rng.randint(2, 3)))
+
+def sentence(rng, names, link_density):
+    words = []
+    for i in range(rng.randint(5, 20)):
+        if rng.random() * 100 < link_density:
+            words.append(link(rng, names))
+        else:
+            word = rng.choice(WORDS)
+            markup = rng.random()
+            if markup < 0.03:
+                word = '*' + word + '*'
+            elif markup < 0.05:
+                word = '_' + word + '_'
+            elif markup < 0.06:
+                word = '=' + word + '='
+            words.append(word)
+    # capitalize() would lower case the WikiWords
+    txt = ' '.join(words)
+    return txt[:1].upper() + txt[1:] + '.'
+
+def link(rng, names):
+    kind = rng.random()
+    name = rng.choice(names)
+    if kind < 0.4:
+        return name
+    elif kind < 0.7:
+        return '[[' + name + ']]'
+    elif kind < 0.9:
+        return '[[' + name + '][' + ' '.join(rng.sample(WORDS, 2)) + ']]'
+    return '[[http://www.example.com/' + rng.choice(WORDS) + '][example]]'
+
+def block(rng, config, names):
+    """one block of TWiki markup: a paragraph, list, table, heading..."""
+    kind = rng.random()
+    density = config['link_density']
+    if kind < config['table_density']:
+        columns = rng.randint(2, 6)
+        rows = ['| ' + ' | '.join('*' + rng.choice(WORDS) + '*' 
+                                  for c in range(columns)) + ' |']
+        for r in range(rng.randint(1, config['table_rows'] * 2)):
+            rows.append('| ' + ' | '.join(rng.choice(WORDS) 
+                                          for c in range(columns)) + ' |')
+        return '\n'.join(rows)
+    kind = rng.random()
+    if kind < 0.15:
+        return '---' + '+' * rng.randint(1, 4) + ' ' + ' '.join(
+            rng.sample(WORDS, 3))
+    elif kind < 0.35:
+        items = []
+        for i in range(rng.randint(2, 8)):
+            depth = rng.randint(1, 2)
+            bullet = rng.choice(['*', '1.'])
+            items.append('   ' * depth + bullet + ' ' + 
+                         sentence(rng, names, density))
+        return '\n'.join(items)
+    elif kind < 0.40:
+        return '<verbatim>\n' + '\n'.join(
+            ' '.join(rng.sample(WORDS, 4)) for i in range(5)) + '\n</verbatim>'
+    elif kind < 0.45:
+        return '   $ ' + rng.choice(WORDS) + ': ' + sentence(rng, names, 
+                                                            density)
+    elif kind < 0.48:
+        return rng.choice(['%TOC%', '---', '<hr />', '%X% ' + 
+                           sentence(rng, names, density)])
+    return ' '.join(sentence(rng, names, density) 
+                    for i in range(rng.randint(1, 6)))
+
+def topic_text(rng, config, names, attachments):
+    size = min(config['max_size'], int(rng.lognormvariate(
+        math.log(config['size_median']), config['size_sigma'])))
+    lines = ['%META:TOPICINFO{author="' + wiki_word(rng) + '" date="' + 
+             str(1100000000 + rng.randint(0, 300000000)) + 
+             '" format="1.1" version="1.' + str(rng.randint(1, 40)) + '"}%']
+    if rng.random() < 0.5:
+        lines.append('%META:TOPICPARENT{name="' + rng.choice(names) + '"}%')
+    length = 0
+    while length < size:
+        text = block(rng, config, names)
+        lines.append(text)
+        lines.append('')
+        length += len(text) + 2
+    for name, size in attachments:
+        lines.append('%META:FILEATTACHMENT{name="' + name + 
+                     '" attachment="' + name + '" attr="" comment="" date="' +
+                     str(1100000000 + rng.randint(0, 300000000)) +
+                     '" path="' + name + '" size="' + str(size) + 
+                     '" user="' + wiki_word(rng) + '" version="1"}%')
+    return '\n'.join(lines) + '\n'
+
+def write_attachments(rng, config, topic_pub_dir):
+    """write attachment files; returns [(name, size)]"""
+    if not os.path.isdir(topic_pub_dir):
+        os.makedirs(topic_pub_dir)
+    attachments = []
+    for i in range(rng.randint(1, config['max_attachments'])):
+        name = rng.choice(WORDS) + str(i) + rng.choice(['.pdf', '.png'])
+        size = rng.randint(1, config['attachment_size'] * 2)
+        # a few shared files, like the logos attached all over a real wiki
+        if rng.random() < 0.3:
+            name = 'logo.png'
+            size = config['attachment_size']
+        with open(os.path.join(topic_pub_dir, name), 'wb') as f:
+            f.write(b'x' * size)
+        attachments.append((name, size))
+    return attachments
+
+def pathological_pages(size=20000):
+    """inputs that make the conversion regular expressions backtrack
+
+    returns {name: text}, each text about size bytes long
+    """
+    repeat = lambda piece: piece * (size // len(piece))
+    return {
+        # italic: underscores with no closing underscore at a word end
+        'underscores': 'x _' + repeat('a_a') + 'x',
+        # bold: many opening asterisks on one line
+        'asterisks': repeat('*a '),
+        # fixed: = signs inside words
+        'equals': repeat('a=b '),
+        # unclosed html paragraphs and verbatim blocks
+        'unclosed_p': repeat('<p>text\n'),
+        'unclosed_verbatim': repeat('<verbatim>text\n'),
+        # definition list pattern with many colons on one line
+        'definition_colons': '   $ ' + repeat('term: '),
+        # one very long table row
+        'long_table_row': '|' + repeat(' cell |'),
+        # wiki words separated by single spaces
+        'wikiwords': repeat(' WikiWord'),
+    }
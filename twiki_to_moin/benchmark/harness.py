@@ -0,0 +1,155 @@
+#
+#   Copyright 2013 La Honda Research Center, Inc.
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Conversion benchmarks
+
+Measures pages/sec and MB/sec for the conversion engines alone, for
+complete convert_directory() runs, and the time taken on pathological
+inputs.  The results are a dict, written as JSON with sorted keys so
+results from different releases can be compared with diff.
+
+"""
+import json
+import logging
+import os
+import platform
+import shutil
+import tempfile
+
+import twiki_to_moin
+from twiki_to_moin.benchmark.generate import generate_web, pathological_pages
+from twiki_to_moin.config import single_web
+from twiki_to_moin.conversion import ENGINES
+from twiki_to_moin.profiling import clock
+
+log = logging.getLogger('twiki_to_moin')
+
+def bench_engine(pages, engine, prefix='', repeat=3):
+    """time converting the text of pages with one engine
+
+    the best of repeat runs is reported
+    """
+    convert = ENGINES[engine]
+    size = sum(len(txt) for txt in pages)
+    best = None
+    for i in range(repeat):
+        start = clock()
+        for txt in pages:
+            convert(txt, prefix)
+        seconds = clock() - start
+        if best is None or seconds < best:
+            best = seconds
+    return rates(len(pages), size, best)
+
+def bench_directory(data_dir, pub_dir, engine='multipass', jobs=1):
+    """time a complete convert_directory() run into a scratch directory"""
+    size = 0
+    pages = 0
+    for item in twiki_to_moin.find_topics(data_dir, pub_dir):
+        pages += 1
+        size += os.path.getsize(item[0])
+    new_dir = tempfile.mkdtemp(prefix='twiki_to_moin-bench-')
+    try:
+        start = clock()
+        failures = twiki_to_moin.convert_directory(
+            [single_web(data_dir, pub_dir)], os.path.join(new_dir, 'pages'), 
+            engine=engine, jobs=jobs)
+        seconds = clock() - start
+    finally:
+        shutil.rmtree(new_dir)
+    result = rates(pages, size, seconds)
+    result['failures'] = failures
+    return result
+
+def bench_pathological(engine, sizes=(5000, 10000, 20000)):
+    """time each pathological input at several sizes
+
+    growth is how much slower the largest input is than linear scaling
+    from the smallest would predict; 1.0 is linear.
+    """
+    convert = ENGINES[engine]
+    results = {}
+    for size in sizes:
+        for name, txt in pathological_pages(size).items():
+            start = clock()
+            convert(txt, '')
+            seconds = clock() - start
+            results.setdefault(name, {})[str(size)] = round(seconds, 6)
+    for name, times in results.items():
+        first, last = times[str(sizes[0])], times[str(sizes[-1])]
+        if first:
+            times['growth'] = round(last / first * sizes[0] / sizes[-1], 2)
+    return results
+
+def rates(pages, size, seconds):
+    return {
+        'pages': pages,
+        'bytes': size,
+        'seconds': round(seconds, 6),
+        'pages_per_second': round(pages / seconds, 1) if seconds else None,
+        'mb_per_second': round(size / 1e6 / seconds, 3) if seconds else None,
+    }
+
+def run_benchmarks(engines=('multipass', 'singlepass'), jobs=(1,),
+                   directory=True, pathological=True, web_dir=None,
+                   **settings):
+    """generate a web and run the benchmarks on it
+
+    settings are passed to generate_web().  The web is written to web_dir
+    and kept, or to a scratch directory that is removed.
+    returns the results as a dict
+    """
+    scratch = None
+    if web_dir is None:
+        web_dir = scratch = tempfile.mkdtemp(prefix='twiki_to_moin-web-')
+    data_dir = os.path.join(web_dir, 'data', 'Main')
+    pub_dir = os.path.join(web_dir, 'pub', 'Main')
+    level = log.level
+    log.setLevel(logging.WARNING)
+    try:
+        paths = generate_web(data_dir, pub_dir, **settings)
+        pages = []
+        for path in paths:
+            with open(path) as f:
+                pages.append(f.read())
+        results = {
+            'version': twiki_to_moin.__version__,
+            'python': platform.python_version(),
+            'settings': settings,
+            'engines': {},
+            'directory': {},
+            'pathological': {},
+        }
+        for engine in engines:
+            results['engines'][engine] = bench_engine(pages, engine)
+            if directory:
+                results['directory'][engine] = dict(
+                    ('jobs_{0}'.format(n), 
+                     bench_directory(data_dir, pub_dir, engine, n))
+                    for n in jobs)
+            if pathological:
+                results['pathological'][engine] = bench_pathological(engine)
+    finally:
+        log.setLevel(level)
+        if scratch:
+            shutil.rmtree(scratch)
+    return results
+
+def write_results(results, path):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write('\n')
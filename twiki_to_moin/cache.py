@@ -0,0 +1,167 @@
+#
+#   Copyright 2013 La Honda Research Center, Inc.
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Cache of converted pages (--cache)
+
+Webs made from a template share many identical topics.  The cache is a
+directory holding each converted page in a file named by a hash of the 
+TWiki text, the prefix, the conversion engine and the converter version
+(a hash of the conversion code, so changing it starts a new cache), and
+a page seen before is read from the cache instead of being converted.
+
+Entries are written under a temporary name and renamed into place, so
+worker processes share the cache safely.  A hit updates the entry's
+modification time, and the least recently used entries are removed 
+until the cache is within it's size limit, every CACHE_PRUNE_ENTRIES 
+new entries during a run and at it's end.
+
+"""
+import hashlib
+import logging
+import os
+import tempfile
+
+from twiki_to_moin.charset import native, to_bytes
+
+log = logging.getLogger('twiki_to_moin')
+
+# default size limit of the cache, in bytes
+CACHE_SIZE = 256 * 1024 * 1024
+# new entries written between prunes during a run
+CACHE_PRUNE_ENTRIES = 1000
+
+_version = None
+
+def converter_version():
+    """a hash of the conversion code, used in the cache keys"""
+    global _version
+    if _version is None:
+        from twiki_to_moin import __version__, conversion, meta
+        sha = hashlib.sha1(to_bytes(__version__))
+        for module in (conversion, meta):
+            source = os.path.splitext(module.__file__)[0] + '.py'
+            try:
+                with open(source, 'rb') as f:
+                    sha.update(f.read())
+            except (IOError, OSError):
+                # installed without the source; the version has to do
+                pass
+        _version = sha.hexdigest()
+    return _version
+
+def cache_key(txt, prefix, engine):
+    """the hash naming a page's cache entry"""
+    sha = hashlib.sha1(to_bytes(converter_version()))
+    for part in (engine, prefix or ''):
+        sha.update(b'\0' + to_bytes(part))
+    sha.update(b'\0' + to_bytes(txt))
+    return sha.hexdigest()
+
+def cache_path(cache_dir, key):
+    # spread over sub directories, to keep the directories small
+    return os.path.join(cache_dir, key[:2], key[2:])
+
+def cached_convert(cache_dir, engine, txt, prefix, timings=None, stats=None,
+                   meta=True):
+    """convert a page with conversion.ENGINES[engine], using the cache
+
+    called like the engine (and used in it's place by convert_topic()); 
+    a hit is timed as the 'cache' stage.  stats counts the cache_hits 
+    and cache_misses.  The pages given are bodies from meta.parse_meta(),
+    whose conversion is the same with or without meta.
+    """
+    from twiki_to_moin.conversion import ENGINES
+    from twiki_to_moin.profiling import clock
+    if stats is None:
+        stats = {}
+    start = clock()
+    path = cache_path(cache_dir, cache_key(txt, prefix, engine))
+    try:
+        with open(path, 'rb') as f:
+            new_txt = native(f.read())
+        # the entry was used, for pruning
+        os.utime(path, None)
+    except (IOError, OSError):
+        new_txt = None
+    if new_txt is not None:
+        stats['cache_hits'] = stats.get('cache_hits', 0) + 1
+        if timings is not None:
+            timings.append(('cache', clock() - start, len(txt), len(new_txt)))
+        return new_txt
+    stats['cache_misses'] = stats.get('cache_misses', 0) + 1
+    new_txt = ENGINES[engine](txt, prefix, timings, meta)
+    try:
+        _store(path, to_bytes(new_txt))
+    except (IOError, OSError) as detail:
+        msg = "Could not add to the conversion cache {0}: {1}".format(
+            cache_dir, detail)
+        log.debug(msg)
+    return new_txt
+
+def _store(path, data):
+    parent = os.path.dirname(path)
+    if not os.path.isdir(parent):
+        try:
+            os.makedirs(parent)
+        except OSError:
+            # made by another worker
+            if not os.path.isdir(parent):
+                raise
+    fd, tmp_path = tempfile.mkstemp(dir=parent, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.rename(tmp_path, path)
+    except (IOError, OSError):
+        os.remove(tmp_path)
+        raise
+
+def prune_cache(cache_dir, max_bytes=CACHE_SIZE):
+    """remove the least recently used entries beyond max_bytes
+
+    returns (entries removed, entries kept, bytes kept)
+    """
+    entries = []
+    total = 0
+    for parent in os.listdir(cache_dir):
+        parent = os.path.join(cache_dir, parent)
+        if not os.path.isdir(parent):
+            continue
+        for name in os.listdir(parent):
+            if name.startswith('.tmp-'):
+                # being written
+                continue
+            path = os.path.join(parent, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+    removed = 0
+    if total > max_bytes:
+        entries.sort()
+        for mtime, size, path in entries:
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+    return removed, len(entries) - removed, total
@@ -0,0 +1,83 @@
+#
+#   Copyright 2013 La Honda Research Center, Inc.
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Character sets of the TWiki pages and the Moin files
+
+Each TWiki page is read as bytes, decoded once with the web's character
+set, converted, and encoded once as UTF-8 when it's written.  Pages are
+converted as the native str type: unicode on Python 3, and UTF-8 bytes
+on Python 2, where the conversion's patterns match bytes the same way.
+Pages that are ASCII, or already UTF-8, are only checked, not transcoded,
+on Python 2.
+
+"""
+import codecs
+
+PY2 = bytes is str
+
+# with 'auto', pages that are valid UTF-8 (including ASCII) are read as
+# UTF-8, and others in FALLBACK, TWiki's default {Site}{CharSet}
+AUTO = 'auto'
+FALLBACK = 'iso-8859-1'
+
+def check_charset(charset):
+    """return the normalized name of a character set, or AUTO
+
+    raises LookupError for an unknown character set
+    """
+    if charset == AUTO:
+        return charset
+    return codecs.lookup(charset).name
+
+def decode_page(data, charset=AUTO):
+    """return the text of a TWiki page read as bytes, as native text
+
+    charset is the page's character set, from check_charset(); bytes
+    that are not valid in it are replaced
+    """
+    if charset in (AUTO, 'utf-8'):
+        try:
+            text = data.decode('utf-8')
+        except UnicodeDecodeError:
+            if charset == AUTO:
+                text = data.decode(FALLBACK)
+            else:
+                text = data.decode('utf-8', 'replace')
+        else:
+            if PY2:
+                # already what the conversion works on
+                return data
+            return text
+    else:
+        text = data.decode(charset, 'replace')
+    if PY2:
+        return text.encode('utf-8')
+    return text
+
+def native(text):
+    """text or UTF-8 bytes as the native str type"""
+    if isinstance(text, str):
+        return text
+    if PY2:
+        return text.encode('utf-8')
+    return text.decode('utf-8')
+
+def to_bytes(text):
+    """native text as UTF-8 bytes, for writing to the Moin files"""
+    if isinstance(text, bytes):
+        return text
+    return text.encode('utf-8')
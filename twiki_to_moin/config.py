@@ -0,0 +1,127 @@
+#
+#   Copyright 2013 La Honda Research Center, Inc.
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Lists of TWiki webs to convert in one run (--config)
+
+The webs are read from an INI file, with a section per web::
+
+    [Main]
+    page_dir = /var/www/twiki/data/Main
+    data_dir = /var/www/twiki/pub/Main
+
+    [Sandbox]
+    page_dir = /var/www/twiki/data/Sandbox
+    data_dir = /var/www/twiki/pub/Sandbox
+    prefix = SandboxPages
+    charset = cp1252
+
+or from a JSON file (a name ending in .json) holding a list of objects
+with the same keys, optionally as the "webs" member of an object.  The 
+name is taken from the section, or the "name" key, and defaults to the
+last part of page_dir.  Relative paths are relative to the file.  A web
+without a charset is read in the --charset of the run.
+
+"""
+from collections import namedtuple
+import json
+import os
+
+from twiki_to_moin.charset import check_charset
+
+try:
+    from configparser import RawConfigParser, Error as ConfigError
+except ImportError:
+    # Python 2
+    from ConfigParser import RawConfigParser, Error as ConfigError
+
+# one web to convert; page_dir is the directory of it's topics, data_dir
+# the directory of their attachments (or None), and prefix the parent 
+# of it's Moin pages; charset is the character set of it's topics, or 
+# None for the run's --charset
+Web = namedtuple('Web', 'name page_dir data_dir prefix charset')
+Web.__new__.__defaults__ = (None,)
+
+def single_web(page_dir, data_dir=None, prefix='', charset=None):
+    """the Web for directories given on the command line"""
+    return Web(os.path.basename(os.path.normpath(page_dir)), page_dir,
+               data_dir, prefix, charset)
+
+def read_config(path):
+    """return the list of Webs in a config file
+
+    raises ValueError for a file that can't be read or has no webs
+    """
+    try:
+        if path.endswith('.json'):
+            entries = _read_json(path)
+        else:
+            entries = _read_ini(path)
+    except (IOError, OSError, ConfigError) as detail:
+        raise ValueError("Could not read {0}: {1}".format(path, detail))
+    base = os.path.dirname(os.path.abspath(path))
+    webs = []
+    for number, entry in enumerate(entries, 1):
+        if not isinstance(entry, dict):
+            raise ValueError("Web {0} in {1} is not a set of keys".format(
+                number, path))
+        for key in ('page_dir', 'data_dir'):
+            if not entry.get(key):
+                raise ValueError("Web {0} in {1} has no {2}".format(
+                    entry.get('name', number), path, key))
+        page_dir, data_dir = [os.path.normpath(os.path.join(base, entry[key]))
+                              for key in ('page_dir', 'data_dir')]
+        charset = entry.get('charset') or None
+        if charset:
+            try:
+                charset = check_charset(charset)
+            except LookupError:
+                raise ValueError("Web {0} in {1} has an unknown charset "
+                                 "{2}".format(entry.get('name', number), path,
+                                              charset))
+        webs.append(Web(entry.get('name') or os.path.basename(page_dir),
+                        page_dir, data_dir, entry.get('prefix') or '', 
+                        charset))
+    if not webs:
+        raise ValueError("No webs are listed in {0}".format(path))
+    return webs
+
+def _read_json(path):
+    with open(path) as f:
+        try:
+            entries = json.load(f)
+        except ValueError as detail:
+            raise ValueError("Could not read {0}: {1}".format(path, detail))
+    if isinstance(entries, dict):
+        entries = entries.get('webs', [])
+    if not isinstance(entries, list):
+        raise ValueError("The webs in {0} are not a list".format(path))
+    return entries
+
+def _read_ini(path):
+    # raw, since paths may have % in them
+    parser = RawConfigParser()
+    with open(path) as f:
+        if hasattr(parser, 'read_file'):
+            parser.read_file(f)
+        else:
+            parser.readfp(f)
+    entries = []
+    for section in parser.sections():
+        entry = dict(parser.items(section))
+        entry['name'] = section
+        entries.append(entry)
+    return entries
@@ -17,12 +17,19 @@
 
 import re
 
+from twiki_to_moin.meta import parse_meta
+from twiki_to_moin.profiling import timed_stage
 
-def twiki2moin(txt, prefix):
+
+def twiki2moin(txt, prefix, timings=None, meta=True):
     """Convert the text of a single TWiki page to MoinMoin markup
 
     txt is the TWiki input page content
     optional prefix is used to convert TWiki Web links to Moin subdirectories.
+    optional timings is a list; each stage appends it's timing to it 
+    (see profiling.py)
+    with meta False, txt is the body from meta.parse_meta(), and the
+    META lines are not looked for again
     returns the Moin equivalent
 
     """
@@ -34,21 +41,22 @@ def twiki2moin(txt, prefix):
     # You have been warned - use the unit tests when making changes to
     # the conversion logic  :-)
     
-    txt = process_variables(txt)	
+    txt = timed_stage(timings, 'variables', process_variables, txt)
 
-    txt = process_meta(txt)
+    if meta:
+        txt = timed_stage(timings, 'meta', process_meta, txt)
 
-    txt = process_links(txt, prefix)
+    txt = timed_stage(timings, 'links', process_links, txt, prefix)
 
-    txt = process_markup(txt)
+    txt = timed_stage(timings, 'markup', process_markup, txt)
 
     # remove signatures
     ## uncommento to enable 
     ## txt = re.compile("^-- Main.([a-z]+) - [0-9]+ [a-zA-Z]+ 200[0-9]\s*\n?", re.M).sub("", txt)
 
-    txt = process_tables(txt)
+    txt = timed_stage(timings, 'tables', process_tables, txt)
 
-    txt = process_html(txt)
+    txt = timed_stage(timings, 'html', process_html, txt)
 
     return txt
 
@@ -112,17 +120,147 @@ def process_markup(txt):
 def process_tables(txt):
     """Convert table syntax """
 
-    # find table rows, then replace one by one 
-    txt = re.compile(r"^\s*\|.*$", re.M).sub(convert_table_row, txt)
-
-    return txt
-
-def convert_table_row(matchobj):
-    """convert a single table row"""
+    # gather each block of table rows, and convert it as a whole
+    lines = []
+    table = []
+    for line in txt.split('\n'):
+        if line.lstrip()[:1] == '|':
+            table.append(line)
+            continue
+        if table:
+            lines.extend(convert_table(table))
+            table = []
+        lines.append(line)
+    if table:
+        lines.extend(convert_table(table))
+    return '\n'.join(lines)
+
+def convert_table(rows):
+    """convert a block of consecutive table rows
+
+    Each cell keeps it's text, with Moin attributes for the TWiki cell
+    features:
+
+    - alignment from the padding: two or more spaces before the text 
+      right aligns it, and two or more on both sides centers it
+    - header cells, *text*, are bold, and centered unless aligned
+    - an empty cell (||) joins the cell before it, spanning columns
+    - a cell containing only ^ joins the cell above it, spanning rows
+
+    The rows are read once, then written with the spans found.  A row 
+    that doesn't end with | is not a TWiki table row; it's | are just
+    doubled.
+    returns a list of the converted rows
 
-    row = matchobj.group(0)
-    row = re.sub('\|', '||', row)
-    return row
+    """
+    table = []
+    # [text, colspan, rowspan] of the last cell in each column
+    above = []
+    row_spans = any('^' in row for row in rows)
+    for row in rows:
+        if (not row_spans and not _cell_attribute_re.search(row) and
+                row.rstrip()[-1:] == '|'):
+            # no cell needs attributes
+            table.append(row.replace('|', '||'))
+            continue
+        indent, cells, trailing = split_table_row(row)
+        if trailing.strip() or not cells:
+            table.append(row.replace('|', '||'))
+            above = []
+            continue
+        if not row_spans and '||' not in row:
+            table.append(''.join([indent, '||', 
+                '||'.join([convert_table_cell(text) for text in cells]),
+                '||', trailing]))
+            continue
+        # spans; only keep the cells that start one
+        converted = []
+        for column, text in enumerate(cells):
+            if not text and converted:
+                cell = converted[-1]
+                cell[1] += 1
+            elif text.strip() == '^' and column < len(above):
+                cell = above[column]
+                cell[2] += 1
+            else:
+                cell = [text, 1, 1]
+                converted.append(cell)
+            if column < len(above):
+                above[column] = cell
+            else:
+                above.append(cell)
+        table.append((indent, converted, trailing))
+
+    lines = []
+    for entry in table:
+        if isinstance(entry, tuple):
+            indent, cells, trailing = entry
+            entry = ''.join([indent, '||', 
+                '||'.join([convert_table_cell(*cell) for cell in cells]), 
+                '||', trailing])
+        lines.append(entry)
+    return lines
+
+# a row without any of these is converted by just doubling it's |s
+_cell_attribute_re = re.compile(r"\|\s\s|\|\||\*|'''|\[\[|\{\{")
+
+def split_table_row(row):
+    """split a table row at it's |s
+
+    a | inside a Moin [[link|text]] or {{image|alt}} doesn't end a cell
+    returns the text before the first |, the cells, and the text after 
+    the last |
+    """
+    parts = row.split('|')
+    if '[[' in row or '{{' in row:
+        # join up the parts of links split at a |
+        merged = [parts[0]]
+        end = len(parts[0])
+        for part in parts[1:]:
+            last = merged[-1]
+            if ((last.rfind('[[') > last.rfind(']]') and 
+                 row.find(']]', end) >= 0) or
+                (last.rfind('{{') > last.rfind('}}') and 
+                 row.find('}}', end) >= 0)):
+                merged[-1] = last + '|' + part
+            else:
+                merged.append(part)
+            end += len(part) + 1
+        parts = merged
+    return parts[0], parts[1:-1], parts[-1]
+
+_header_cell_re = re.compile(r"(\s*)\*(.*)\*(\s*)$")
+
+def convert_table_cell(text, colspan=1, rowspan=1):
+    """return a cell's Moin attributes and text"""
+
+    if (colspan == rowspan == 1 and not text[:2].isspace() and 
+        '*' not in text and "'''" not in text):
+        # a plain cell
+        return text
+    attributes = []
+    if colspan > 1:
+        attributes.append("-{0}".format(colspan))
+    if rowspan > 1:
+        attributes.append("|{0}".format(rowspan))
+    left = len(text) - len(text.lstrip())
+    right = len(text) - len(text.rstrip())
+    stripped = text.strip()
+    matchobj = _header_cell_re.match(text)
+    if matchobj:
+        header = True
+        text = "{0}'''{1}'''{2}".format(*matchobj.groups())
+    else:
+        # usually converted already, with the rest of the bold markup
+        header = (len(stripped) > 6 and stripped.startswith("'''") and 
+                  stripped.endswith("'''"))
+    if left >= 2:
+        attributes.append(')' if right <= 1 else ':')
+    elif header:
+        attributes.append(':')
+    if attributes:
+        return "<{0}>{1}".format(' '.join(attributes), text)
+    return text
 
 def process_variables(txt):
     """replace twiki variables with Moin counterparts"""
@@ -166,7 +304,11 @@ def process_links(txt, prefix):
 def convert_link(matchobj, prefix):
     """convert the contents of a twiki link to MoinMoin Syntax """
 
-    link = matchobj.group(1)
+    return convert_link_text(matchobj.group(1), prefix)
+
+def convert_link_text(link, prefix):
+    """convert the text between [[ and ]] to MoinMoin Syntax """
+
     # print 'before', link
 
     link = re.sub(r'\]\[', '|', link)
@@ -195,7 +337,225 @@ def convert_link(matchobj, prefix):
     return link
 
 def process_meta(txt):
-    """convert Twiki Meta lines"""
+    """convert Twiki Meta lines
+
+    the META lines are removed, see meta.parse_meta()
+    """
+    return parse_meta(txt)[0]
+
+#
+# Single pass conversion engine
+#
+# twiki2moin() above applies ~35 separate substitutions, each of which
+# rescans and copies the whole page.  twiki2moin_single_pass() produces
+# the same Moin markup by tokenizing the page once with a single combined
+# pattern (one alternative per inline construct, tried in priority order),
+# and then walking the lines once for the block structure.  All patterns are
+# compiled once, at import time.
+#
+# The two engines agree on the unit test cases; run the unit tests and
+# compare engines with --engine when making changes here.
+#
+
+_INLINE_TOKENS = [
+    ('toc', r"(?<!!)%TOC%"),
+    ('info', r"(?<!!)%I%"),
+    ('alert', r"(?<!!)%X%"),
+    ('vbar', r"(?<!!)%VBAR%"),
+    ('caret', r"(?<!!)%CARET%"),
+    ('attachurl', r"(?<!!)%ATTACHURL(?:PATH)?%/(\S*)"),
+    ('link', r"\[\[(.*?)\]\]"),
+    ('bolditalic', r"\b__([^_].*?[^_])__"),
+    ('bold', r"\*([^*].*?[^*])\*"),
+    ('italic', r"_([^_].*?[^_])_\b"),
+    ('fixed', r"\B=\b([^*\n]*?)=\B"),
+    ('verbatim', r"\B<(?P<tag>verbatim|literal|pre)>\b([^*]*?)</(?P=tag)>\B"),
+    ('para', r"<p>([\s\S]*?)</p>"),
+    ('br', r"<br />"),
+    ('em', r"</?em>"),
+    ('strong', r"</?strong>"),
+    ('lt', r"&lt;"),
+    ('gt', r"&gt;"),
+    ('amp', r"&amp;"),
+]
+
+# WikiWords are only rewritten when a prefix is in use, so there are two
+# versions of the combined pattern.
+_WIKIWORD_TOKEN = ('wikiword', r"(?<=\s)[A-Z][a-z]+[A-Z]+[a-zA-Z]+")
+
+def _compile_tokens(tokens, first_chars):
+    # the lookahead on the characters a token can start with lets the
+    # scan reject most positions without trying every alternative
+    return re.compile('(?=[' + first_chars + '])(?:' + 
+                      '|'.join('(?P<{0}>{1})'.format(name, pattern)
+                               for name, pattern in tokens) + ')', re.M)
+
+_inline_re = _compile_tokens(_INLINE_TOKENS, r"%[_*=<&")
+_inline_prefix_re = _compile_tokens(
+    _INLINE_TOKENS[:7] + [_WIKIWORD_TOKEN] + _INLINE_TOKENS[7:],
+    r"%[_*=<&A-Z")
+
+_INLINE_CONSTANTS = {
+    'toc': "<<TableOfContents>>",
+    'info': "(!)",
+    'alert': "/!\\",
+    'vbar': "|",
+    'caret': "^",
+    'br': "\n",
+    'em': "''",
+    'strong': "'''",
+    'lt': "<",
+    'gt': ">",
+    'amp': "&",
+}
+
+def twiki2moin_single_pass(txt, prefix, timings=None, meta=True):
+    """Convert the text of a single TWiki page to MoinMoin markup
+
+    Same interface and result as twiki2moin(), using one tokenizing pass
+    for inline markup followed by the block level conversions.
 
-    txt = re.compile("^%META:.*%", re.M).sub("", txt)
+    """
+    if meta:
+        txt = timed_stage(timings, 'meta', process_meta, txt)
+    txt = timed_stage(timings, 'inline', convert_inline, txt, prefix)
+    txt = timed_stage(timings, 'blocks', process_blocks, txt)
     return txt
+
+def convert_inline(txt, prefix=""):
+    """convert variables, links, inline markup and html
+
+    The page is scanned once; each token found is replaced by its Moin
+    equivalent.  Text inside bold, italic and paragraph tokens is
+    converted recursively, since the multiple pass engine converts it
+    in later passes.
+
+    """
+    if prefix:
+        pattern = _inline_prefix_re
+    else:
+        pattern = _inline_re
+
+    def replace(matchobj):
+        kind = matchobj.lastgroup
+        if kind in _INLINE_CONSTANTS:
+            return _INLINE_CONSTANTS[kind]
+        # inner text is the first group after the token's own group
+        inner = matchobj.group(matchobj.lastindex + 1)
+        if kind == 'link':
+            return '[[' + convert_link_text(inner, prefix) + ']]'
+        elif kind == 'attachurl':
+            return "[[attachment:" + inner + "]]"
+        elif kind == 'wikiword':
+            return '[[' + prefix + '/' + matchobj.group(0) + ']]'
+        elif kind == 'bold':
+            return "'''" + convert_inline(inner, prefix) + "'''"
+        elif kind == 'bolditalic':
+            return "''''" + convert_inline(inner, prefix) + "''''"
+        elif kind == 'italic':
+            return "''" + convert_inline(inner, prefix) + "''"
+        elif kind == 'fixed':
+            return "`" + inner + "`"
+        elif kind == 'verbatim':
+            content = matchobj.group(matchobj.lastindex + 2)
+            if '\n' in content:
+                return "{{{\n" + content + "}}}\n"
+            return "`" + content + "`"
+        elif kind == 'para':
+            return convert_inline(inner, prefix) + "<<BR>>"
+        return matchobj.group(0)
+
+    return pattern.sub(replace, txt)
+
+# list items: three spaces (or a tab) per level, then a bullet, a number
+# ("1." or, from the TWiki wysiwyg editor, a single digit without the dot)
+# or a "$ term:" definition
+_list_item_re = re.compile(r"((?:   |\t)+)(?:(\*)|([0-9]\.?)|\$ (.*):) ")
+_heading_re = re.compile(r"-?---([+]{1,6}|#)\s*(.*)$")
+_html_rule_re = re.compile(r"<hr ?/?>\s*$")
+
+def process_blocks(txt):
+    """convert headings, lists, definition lists, rules and tables
+
+    The page is walked once, line by line.  Each line is classified by
+    its first characters and converted on its own.  Lines inside a
+    preformatted {{{ }}} block are copied unchanged.
+
+    """
+    lines = []
+    append = lines.append
+    preformatted = False
+    # the rows of the current table
+    table = []
+    for line in txt.split('\n'):
+        if preformatted:
+            if '}}}' in line:
+                preformatted = False
+            append(line)
+            continue
+        stripped = line.lstrip()
+        if stripped[:1] == '|':
+            table.append(line)
+            continue
+        if table:
+            lines.extend(convert_table(table))
+            table = []
+        if not stripped:
+            append(line)
+        elif line[0] == '-':
+            append(convert_dash_line(line))
+        elif stripped[0] == '<' and _html_rule_re.match(stripped):
+            append("----")
+        elif line[0] in ' \t':
+            append(convert_list_item(line))
+        else:
+            if stripped.startswith('{{{') and '}}}' not in stripped:
+                preformatted = True
+            append(line)
+    if table:
+        lines.extend(convert_table(table))
+    return '\n'.join(lines)
+
+def convert_dash_line(line):
+    """convert a line starting with - : a heading, a rule, or neither"""
+
+    matchobj = _heading_re.match(line)
+    if matchobj:
+        level, title = matchobj.groups()
+        if not title:
+            # an empty TWiki heading has no Moin equivalent
+            return ""
+        if level == '#':
+            marker = '='
+        else:
+            marker = '=' * len(level)
+        return ' '.join([marker, title, marker])
+    if line.startswith('---'):
+        return "----"
+    return line
+
+def convert_list_item(line):
+    """convert an indented line: list items and definitions
+
+    Leading tabs are expanded to the TWiki three spaces per level, so
+    nested lists keep their depth in Moin.
+
+    """
+    matchobj = _list_item_re.match(line)
+    if not matchobj:
+        return line
+    indent = matchobj.group(1).replace('\t', '   ')
+    rest = line[matchobj.end():]
+    if matchobj.group(2):
+        return indent + "* " + rest
+    elif matchobj.group(3):
+        return indent + " 1. " + rest
+    else:
+        # definition: the first level of indent is dropped
+        return indent[3:] + matchobj.group(4) + ":: " + rest
+
+# conversion engines selectable from the command line (--engine)
+ENGINES = {
+    'multipass': twiki2moin,
+    'singlepass': twiki2moin_single_pass,
+}
@@ -17,50 +17,298 @@
 import errno
 import logging
 import os
-import re
 import shutil
 
+from twiki_to_moin.charset import to_bytes
+from twiki_to_moin.manifest import file_hash, source_record
+
 log = logging.getLogger('twiki_to_moin')
+# the messages for every attachment, see logqueue.py
+page_log = logging.getLogger('twiki_to_moin.pages')
+
+def make_page(new_dir, topic, txt, fsync=False, revision=1, current=True):
+    """write a converted page as a revision of a Moin topic
 
-def make_page(new_dir, topic, txt):
-    txt = unicode(txt, "latin1").encode("utf8")
+    the topic's directories must exist, see make_directories()
+    with current, the revision is made the topic's current revision
+    with fsync, each file is flushed to disk before it is closed
+    returns the paths of the files written
+    """
     name = os.path.join(new_dir, topic)
+    number = "{0:08d}".format(revision)
+    files = [(os.path.join(name, "revisions", number), to_bytes(txt))]
+    if current:
+        files.append((os.path.join(name, "current"), to_bytes(number)))
+    for path, data in files:
+        with open(path, "wb") as f:
+            f.write(data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+    return [path for path, data in files]
+
+def make_edit_log(new_dir, topic, lines, fsync=False, append=False):
+    """write a Moin topic's edit-log, replacing any earlier one
+
+    lines are the edit-log lines, oldest first, see editlog.py
+    with append, the lines are added to the end of the edit-log instead
+    returns the paths of the files written
+    """
+    path = os.path.join(new_dir, topic, "edit-log")
+    with open(path, "ab" if append else "wb") as f:
+        f.write(to_bytes("".join(lines)))
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    return [path]
+
+def current_revision(new_dir, topic):
+    """the number of a Moin topic's current revision, 0 for a new topic"""
     try:
-        os.makedirs(os.path.join(name,"revisions"))
-    except OSError as detail:
-        if detail.errno == errno.EEXIST: 
-            pass
-        else:
-            raise 
+        with open(os.path.join(new_dir, topic, "current"), "rb") as f:
+            return int(f.read().strip() or 0)
+    except (IOError, OSError, ValueError):
+        return 0
+
+def make_directories(new_dir, topic, attachments=True, existing=None):
+    """create the directories of a Moin topic
+
+    existing is a set of the topics known to be in new_dir, normally 
+    read once from a listing of new_dir; a new topic's directories are 
+    made without checking for them first.  The topic is added to it.
+    """
+    name = os.path.join(new_dir, topic)
+    subdirs = [os.path.join(name, "revisions")]
+    if attachments:
+        subdirs.append(os.path.join(name, "attachments"))
+    if existing is not None and topic not in existing:
+        os.mkdir(name)
+        for subdir in subdirs:
+            os.mkdir(subdir)
+        existing.add(topic)
+        return
+    for subdir in subdirs:
+        try:
+            os.makedirs(subdir)
+        except OSError as detail:
+            if detail.errno != errno.EEXIST: 
+                raise
+    if existing is not None:
+        existing.add(topic)
+
+def copy_attachments(new_dir, data_dir, twiki_name, moin_topic, attachments,
+                     known=None, mode='copy', dedup_dir=None, stats=None,
+                     writer=None, key=None):
+    """copy the attachments listed in a topic's META data
 
-    # XXX these files need to be closed !
-    file(os.path.join(name,"current"), "w").write("00000001")
-    file(os.path.join(name,"revisions","00000001"), "w").write(txt)
+    attachments is the topic's meta.Attachment list, see meta.parse_meta()
+    mode is one of ATTACHMENT_MODES, see transfer_file()
+    dedup_dir is the hash index used by dedup_transfer(), if any
+    stats is a dict of counters, updated with the attachments copied and
+    the duplicates found
+    the topic's attachments directory must exist, see make_directories()
+    known is used by incremental runs (see manifest.py); it maps source 
+    paths to their (size, mtime, hash) from a previous run.  Attachments
+    that are unchanged and already copied are skipped, and a list of 
+    (path, size, mtime, hash) for the topic's attachments is returned.
+    with writer, an archive.ArchiveWriter, the attachments are queued to
+    it instead of copied, under key, see PageWriter.write()
 
-def copy_attachments(new_dir, data_dir, twiki_name, moin_topic, txt):
+    """
     name = os.path.join(new_dir,moin_topic)
-    try:
-        os.makedirs(os.path.join(name,"attachments"))
-    except OSError as detail:
-        if detail.errno == errno.EEXIST: 
-            pass
-        else:
-            raise 
-    attachments = re.compile("%META:FILEATTACHMENT.*attachment=\"(.*?)\"\s",
-        re.M).findall(txt)
-    for attachment in attachments:
-        msg = "processing attachment {0}".format(attachment)
-        log.info(msg)
+    sources = []
+    # the attachments given to the writer
+    archived = set()
+    for attachment in (entry.name for entry in attachments):
+        src = os.path.join(data_dir, twiki_name, attachment)
+        dest = os.path.join(name, "attachments", attachment)
+        if known is not None:
+            previous = known.get(os.path.abspath(src))
+            if previous and os.path.lexists(dest):
+                try:
+                    st = os.stat(src)
+                except OSError:
+                    st = None
+                if st and (st.st_size, st.st_mtime) == previous[:2]:
+                    msg = "unchanged attachment {0}".format(attachment)
+                    page_log.debug(msg)
+                    sources.append((src,) + tuple(previous))
+                    continue
         try:
             #print "src: %s, dest: %s" % (
             #    os.path.join(data_dir,twiki_name,attachment), 
             #    os.path.join(name,"attachments",attachment))
-            shutil.copyfile(
-                os.path.join(data_dir, twiki_name, attachment),
-                os.path.join(name, "attachments", attachment))
-        except IOError:
+            if writer is not None:
+                # a missing attachment is reported here, as for a copy;
+                # one listed twice is only added once
+                os.stat(src)
+                if attachment not in archived:
+                    archived.add(attachment)
+                    writer.write_attachment(new_dir, moin_topic, attachment,
+                                            src, key=key)
+                method, digest = 'archive', None
+            elif dedup_dir:
+                method, digest = dedup_transfer(src, dest, dedup_dir, mode)
+            else:
+                method, digest = transfer_file(src, dest, mode), None
+            if known is not None:
+                sources.append(source_record(src, digest=digest))
+            if stats is not None:
+                size = os.path.getsize(src)
+                stats['attachments'] = stats.get('attachments', 0) + 1
+                stats['attachment_bytes'] = \
+                    stats.get('attachment_bytes', 0) + size
+                if method == 'duplicate':
+                    stats['duplicate_attachments'] = \
+                        stats.get('duplicate_attachments', 0) + 1
+                    stats['duplicate_bytes'] = \
+                        stats.get('duplicate_bytes', 0) + size
+        except (IOError, OSError):
             msg = "Could not copy attachment {0} for topic {1}".format(
-                attachment, topic)
+                attachment, moin_topic)
             log.warn(msg)
-            pass
+            continue
+        msg = "processing attachment {0} ({1})".format(attachment, method)
+        page_log.info(msg)
+    if known is not None:
+        return sources
+
+#
+# Attachment transfer
+#
+# transfer_file() tries the methods allowed by the attachment mode in
+# order, cheapest first, falling back to the next one when a method 
+# fails (a link across file systems, reflink on a file system without
+# support, or a Python without copy_file_range).
+#
+
+ATTACHMENT_MODES = ['copy', 'hardlink', 'reflink', 'symlink']
+
+_COPY_METHODS = [method for method in ['copy_file_range', 'sendfile']
+                 if hasattr(os, method)] + ['copy']
+_TRANSFER_METHODS = {
+    'copy': _COPY_METHODS,
+    'reflink': ['reflink'] + _COPY_METHODS,
+    'hardlink': ['hardlink', 'reflink'] + _COPY_METHODS,
+    'symlink': ['symlink'] + _COPY_METHODS,
+}
+
+# the FICLONE ioctl, from linux/fs.h
+FICLONE = 0x40049409
+
+# methods that failed because the system doesn't support them are not
+# tried again
+_unsupported = set()
+_UNSUPPORTED_ERRORS = (errno.ENOSYS, errno.ENOTTY, errno.EOPNOTSUPP)
+
+def transfer_file(src, dest, mode='copy'):
+    """make dest a copy of (or a link to) src
+
+    returns the name of the method that succeeded.  An existing dest is
+    removed first, since it may be a link to the TWiki source.
+
+    """
+    remove_file(dest)
+    methods = _TRANSFER_METHODS[mode]
+    for method in methods[:-1]:
+        if method in _unsupported:
+            continue
+        try:
+            _transfer_functions[method](src, dest)
+            return method
+        except (IOError, OSError) as detail:
+            msg = "{0} failed for {1}: {2}".format(method, src, detail)
+            log.debug(msg)
+            if detail.errno in _UNSUPPORTED_ERRORS:
+                _unsupported.add(method)
+            remove_file(dest)
+    # the last method is a plain copy; let it's errors through
+    _transfer_functions[methods[-1]](src, dest)
+    return methods[-1]
+
+def dedup_transfer(src, dest, index_dir, mode='copy'):
+    """transfer src to dest, unless the same content was seen before
+
+    index_dir holds a hard link to the first copy of each attachment, 
+    named by it's hash.  When src matches an earlier attachment, dest is
+    linked to that copy and the method returned is 'duplicate';
+    otherwise src is transferred with transfer_file() and added to the
+    index.  Linking into the index is atomic, so worker processes can
+    share it.
+    returns (method, hash of src)
+
+    """
+    digest = file_hash(src)
+    first = os.path.join(index_dir, digest)
+    remove_file(dest)
+    try:
+        os.link(first, dest)
+        return 'duplicate', digest
+    except OSError as detail:
+        if detail.errno != errno.ENOENT:
+            msg = "Could not link {0} to {1}: {2}".format(dest, first, detail)
+            log.debug(msg)
+    method = transfer_file(src, dest, mode)
+    try:
+        os.link(dest, first)
+    except OSError:
+        # another worker indexed the same content first
+        pass
+    return method, digest
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except OSError as detail:
+        if detail.errno != errno.ENOENT:
+            raise
+
+def _hardlink(src, dest):
+    os.link(src, dest)
+
+def _symlink(src, dest):
+    os.symlink(os.path.abspath(src), dest)
+
+def _reflink(src, dest):
+    import fcntl
+    with open(src, 'rb') as fsrc:
+        with open(dest, 'wb') as fdest:
+            fcntl.ioctl(fdest.fileno(), FICLONE, fsrc.fileno())
+
+def _kernel_copy(src, dest, copy_range):
+    """copy with a function like copy_file_range, in the kernel
+
+    raises IOError if the copy stops short, so the next method is tried
+    """
+    with open(src, 'rb') as fsrc:
+        with open(dest, 'wb') as fdest:
+            size = os.fstat(fsrc.fileno()).st_size
+            offset = 0
+            while offset < size:
+                count = copy_range(fsrc.fileno(), fdest.fileno(), offset,
+                                   min(size - offset, 1 << 30))
+                if count == 0:
+                    break
+                offset += count
+    if offset < size:
+        raise IOError(errno.EIO, "copied {0} of {1} bytes".format(offset, 
+                                                                  size))
+
+def _copy_file_range(src, dest):
+    copy_file_range = os.copy_file_range
+    _kernel_copy(src, dest, lambda fd_in, fd_out, offset, count:
+        copy_file_range(fd_in, fd_out, count, offset, offset))
+
+def _sendfile(src, dest):
+    sendfile = os.sendfile
+    _kernel_copy(src, dest, lambda fd_in, fd_out, offset, count:
+        sendfile(fd_out, fd_in, offset, count))
 
+_transfer_functions = {
+    'copy': shutil.copyfile,
+    'copy_file_range': _copy_file_range,
+    'sendfile': _sendfile,
+    'hardlink': _hardlink,
+    'reflink': _reflink,
+    'symlink': _symlink,
+}
@@ -0,0 +1,169 @@
+#
+#   Copyright 2013 La Honda Research Center, Inc.
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Moin edit-log files
+
+Moin keeps an edit-log in each page directory, listing the page's 
+revisions, and a global edit-log in the data directory, used for 
+RecentChanges.  The entries are made from each revision's 
+%META:TOPICINFO% (the TWiki author and date), falling back to the RCS
+revision, or the file's modification time.
+
+The page edit-logs are written by the page writer with the page.  The
+global edit-log entries are collected during the run, and merged into
+the global edit-log in time order when it ends.
+
+"""
+import calendar
+import os
+
+from twiki_to_moin.charset import native, to_bytes
+
+# the address recorded for converted revisions
+ADDR = '127.0.0.1'
+
+# bytes gathered before each write to the global edit-log
+WRITE_CHUNK = 1024 * 1024
+
+def topic_info(meta):
+    """return (seconds, author, version) from a topic's TOPICINFO
+
+    meta is the topic's meta.TopicMeta
+    returns None when the topic has no usable TOPICINFO
+    """
+    attributes = meta.topicinfo
+    try:
+        seconds = int(attributes['date'])
+    except (KeyError, ValueError):
+        return None
+    return seconds, attributes.get('author', ''), attributes.get('version')
+
+def rcs_date(date):
+    """convert an RCS date (UTC, 2013.01.31.23.59.59) to seconds"""
+    fields = [int(field) for field in date.split('.')]
+    if fields[0] < 100:
+        # RCS dates before 2000 have two digit years
+        fields[0] += 1900
+    return calendar.timegm(fields + [0, 0, 0])
+
+def edit_log_entry(seconds, revision, topic, author, comment=''):
+    """return (microseconds, line) for one line of a Moin edit-log
+
+    topic is the Moin topic's directory name; the TWiki author is
+    recorded as the host name, which Moin shows when there is no user id
+    author is text, or UTF-8 bytes; the line is native text
+    """
+    action = 'SAVENEW' if revision == 1 else 'SAVE'
+    author = native(author)
+    usecs = int(seconds * 1000000)
+    return usecs, '\t'.join([str(usecs), "{0:08d}".format(revision), action, 
+                             topic, ADDR, author, '', '', comment]) + '\n'
+
+def write_edit_log(path, lines):
+    """write edit-log lines, gathered into large writes
+
+    returns the path written
+    """
+    with open(path, 'wb') as f:
+        chunk = []
+        size = 0
+        for line in lines:
+            chunk.append(line)
+            size += len(line)
+            if size >= WRITE_CHUNK:
+                f.write(to_bytes(''.join(chunk)))
+                chunk = []
+                size = 0
+        f.write(to_bytes(''.join(chunk)))
+    return path
+
+
+class GlobalEditLog(object):
+    """the global edit-log entries of a run"""
+
+    def __init__(self, path):
+        self.path = path
+        # (microseconds, line)
+        self.entries = []
+
+    def add(self, entries):
+        self.entries.extend(entries)
+
+    def write(self):
+        """merge the entries into the global edit-log, in time order
+
+        entries already in the edit-log for the topics converted in this
+        run are replaced; those for other topics (from another web, or 
+        skipped as unchanged) are kept.
+        returns the number of entries written
+        """
+        topics = set(line.split('\t', 4)[3] for usecs, line in self.entries)
+        entries = self.entries
+        if os.path.exists(self.path):
+            with open(self.path, 'rb') as f:
+                for line in f:
+                    line = native(line)
+                    fields = line.split('\t', 4)
+                    if len(fields) < 5 or fields[3] in topics:
+                        continue
+                    try:
+                        entries.append((int(fields[0]), line))
+                    except ValueError:
+                        continue
+        entries.sort()
+        tmp_path = self.path + '.tmp'
+        write_edit_log(tmp_path, (line for usecs, line in entries))
+        os.rename(tmp_path, self.path)
+        return len(entries)
+
+    def remove(self, topics):
+        """remove the entries of deleted topics from the global edit-log
+
+        returns the number of entries removed
+        """
+        if not topics or not os.path.exists(self.path):
+            return 0
+        topics = set(topics)
+        kept = []
+        removed = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                line = native(line)
+                fields = line.split('\t', 4)
+                if len(fields) >= 5 and fields[3] in topics:
+                    removed += 1
+                else:
+                    kept.append(line)
+        if removed:
+            tmp_path = self.path + '.tmp'
+            write_edit_log(tmp_path, kept)
+            os.rename(tmp_path, self.path)
+        return removed
+
+    def append(self):
+        """add the entries to the end of the global edit-log, in time order
+
+        used for new revisions of topics already in the edit-log, which
+        keeps their earlier entries; the entries are then cleared
+        returns the number of entries written
+        """
+        self.entries.sort()
+        with open(self.path, 'ab') as f:
+            f.write(to_bytes(''.join(line for usecs, line in self.entries)))
+        count = len(self.entries)
+        self.entries = []
+        return count
@@ -0,0 +1,249 @@
+#
+#   Copyright 2013 La Honda Research Center, Inc.
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Checkpoint journal of a conversion run (--resume)
+
+The journal is a text file with a line per event, "done" and the TWiki
+path of each topic converted and written, and "stopped" and the path of
+the topic being converted when a run was interrupted or failed.  The
+done lines are appended in batches, after the page writer has written 
+the pages they cover, so a crash loses at most the last batch, whose 
+topics are converted again.
+
+A run that completes removes it's journal.  With --resume, the topics
+already done are skipped, and so is a topic a run stopped on, which is
+how a page that crashes or hangs the conversion is skipped.
+
+A process that is killed, or crashes, can't record the topic it was 
+converting.  So each process converting topics keeps a TopicMarker, a 
+small file next to the journal naming the topic it is converting, 
+written before the topic is converted and emptied after.  A marker 
+left naming a topic by a process that died is read as a stopped line.
+The markers also show when a worker process has died, see died().
+
+"""
+import errno
+import logging
+import os
+import time
+
+log = logging.getLogger('twiki_to_moin')
+
+# done topics held before they are appended to the journal, and the
+# longest they are held, in seconds
+JOURNAL_BATCH = 500
+JOURNAL_INTERVAL = 10.0
+
+def journal_path(new_dir):
+    """the default journal of a run, next to the pages directory"""
+    return os.path.join(os.path.dirname(os.path.abspath(new_dir)), 
+                        "twiki_to_moin-journal")
+
+def marker_path(path, pid=None):
+    """the TopicMarker of a process (this one by default) for a journal"""
+    return "{0}.current-{1}".format(path, pid or os.getpid())
+
+def _process(marker):
+    """the pid of the process of a marker, or None"""
+    try:
+        return int(marker.rpartition('-')[2])
+    except ValueError:
+        return None
+
+def _running(pid):
+    """False if there is no process pid"""
+    try:
+        os.kill(pid, 0)
+    except OSError as detail:
+        return detail.errno != errno.ESRCH
+    return True
+
+
+class TopicMarker(object):
+    """a file naming the topic a process is converting"""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'w')
+
+    def start(self, twiki_path):
+        """name the topic about to be converted"""
+        self.file.seek(0)
+        self.file.truncate()
+        self.file.write(os.path.abspath(twiki_path))
+        self.file.flush()
+
+    def finish(self):
+        """empty the marker once the topic is converted"""
+        self.file.seek(0)
+        self.file.truncate()
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class Journal(object):
+    """the topics converted by a run, and the topic a run stopped on
+
+    topics are identified by the absolute path of their TWiki file.
+    With resume, the journal of an earlier run is read and added to;
+    otherwise a new journal is started.
+    """
+
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.done = set()
+        self.stopped = set()
+        if resume and os.path.exists(path):
+            self._read()
+            msg = ("Resuming from journal {0}: {1} topics done, {2} to "
+                   "skip").format(path, len(self.done), len(self.stopped))
+            log.info(msg)
+        elif resume:
+            msg = "No journal {0} to resume from, converting all the " \
+                  "topics".format(path)
+            log.warning(msg)
+        parent = os.path.dirname(os.path.abspath(path))
+        if not os.path.isdir(parent):
+            os.makedirs(parent)
+        self.file = open(path, 'a' if resume else 'w')
+        self.pending = []
+        self.last_flush = time.time()
+        if resume:
+            for twiki_path in self._read_markers():
+                msg = ("The conversion was killed while converting TWiki "
+                       "page {0}; it is skipped").format(twiki_path)
+                log.warning(msg)
+                self._write_stopped(twiki_path)
+        self._remove_markers()
+
+    def _read(self):
+        with open(self.path) as f:
+            for line in f:
+                kind, tab, path = line.rstrip('\n').partition('\t')
+                if kind == 'done':
+                    self.done.add(path)
+                elif kind == 'stopped':
+                    self.stopped.add(path)
+                elif kind == 'failed':
+                    self.done.discard(path)
+
+    def _markers(self):
+        directory, name = os.path.split(os.path.abspath(self.path))
+        prefix = name + '.current-'
+        return [os.path.join(directory, marker) 
+                for marker in os.listdir(directory) 
+                if marker.startswith(prefix)]
+
+    def _read_markers(self, dead_only=False):
+        """the topics named by the markers left by processes
+
+        with dead_only, only the markers of processes that died, and this 
+        one's, which is read when it failed
+        """
+        topics = []
+        for marker in self._markers():
+            if dead_only:
+                pid = _process(marker)
+                if pid is None or (pid != os.getpid() and _running(pid)):
+                    continue
+            try:
+                with open(marker) as f:
+                    path = f.read()
+            except (IOError, OSError):
+                continue
+            if path:
+                topics.append(path)
+        return topics
+
+    def died(self):
+        """True if another process with a marker has died"""
+        for marker in self._markers():
+            pid = _process(marker)
+            if pid and pid != os.getpid() and not _running(pid):
+                return True
+        return False
+
+    def _remove_markers(self):
+        for marker in self._markers():
+            try:
+                os.remove(marker)
+            except OSError:
+                pass
+
+    def skip(self, twiki_path):
+        """return 'done' or 'stopped' for a topic to skip, or None"""
+        path = os.path.abspath(twiki_path)
+        if path in self.done:
+            return 'done'
+        if path in self.stopped:
+            return 'stopped'
+        return None
+
+    def completed(self, twiki_path, written=True):
+        """note a topic converted, once it's pages are written; written 
+        is False if they could not be, see flush()
+        """
+        kind = 'done' if written else 'failed'
+        self.pending.append(kind + '\t' + os.path.abspath(twiki_path) + '\n')
+
+    def due(self):
+        """True when the completed topics should be flushed"""
+        return (len(self.pending) >= JOURNAL_BATCH or 
+                time.time() - self.last_flush >= JOURNAL_INTERVAL)
+
+    def flush(self):
+        """append the completed topics to the journal"""
+        self.file.write(''.join(self.pending))
+        self.file.flush()
+        self.pending = []
+        self.last_flush = time.time()
+
+    def stop(self, twiki_path):
+        """record the topic being converted when a run is stopped"""
+        self._write_stopped(twiki_path)
+        msg = ("The conversion stopped while converting TWiki page {0}; it "
+               "is skipped with --resume").format(twiki_path)
+        log.warning(msg)
+
+    def stop_crashed(self):
+        """record the topics this process failed, or worker processes 
+        died, converting
+
+        returns the number of topics recorded
+        """
+        topics = self._read_markers(dead_only=True)
+        for twiki_path in topics:
+            self.stop(twiki_path)
+        return len(topics)
+
+    def _write_stopped(self, twiki_path):
+        path = os.path.abspath(twiki_path)
+        self.stopped.add(path)
+        self.file.write('stopped\t' + path + '\n')
+        self.file.flush()
+
+    def close(self, remove=False):
+        """close the journal; with remove, the run is complete
+
+        the markers are removed, since the run stopped in order
+        """
+        self.file.close()
+        self._remove_markers()
+        if remove:
+            os.remove(self.path)
@@ -0,0 +1,176 @@
+#
+#   Copyright 2013 La Honda Research Center, Inc.
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Logging through a background thread, and progress summaries
+
+start_logging() moves the handlers of the twiki_to_moin logger (the
+console, and the --logfile) behind a queue.  Logging a message only 
+queues the record; a background thread formats and writes it, so the
+conversion loop doesn't wait on the log file.  stop_logging() writes
+the records still queued, and is called on exit.
+
+The messages logged for every page and attachment go to the 
+twiki_to_moin.pages logger.  With --progress, that logger only passes 
+warnings and errors, and Progress logs a summary every so many pages or
+seconds instead.  JsonFormatter writes each record as a line of JSON.
+
+"""
+import atexit
+import json
+import logging
+import threading
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from twiki_to_moin.profiling import clock
+
+log = logging.getLogger('twiki_to_moin')
+page_log = logging.getLogger('twiki_to_moin.pages')
+
+# records held while the thread writes, before logging blocks
+LOG_QUEUE_SIZE = 10000
+
+# the default progress interval, in pages and seconds
+PROGRESS_PAGES = 1000
+PROGRESS_SECONDS = 30.0
+
+
+class QueueHandler(logging.Handler):
+    """queue each record for a LogWriter"""
+
+    def __init__(self, records):
+        logging.Handler.__init__(self)
+        self.records = records
+
+    def emit(self, record):
+        self.records.put(record)
+
+
+class LogWriter(object):
+    """pass the queued records to handlers, in a background thread"""
+
+    def __init__(self, handlers):
+        self.handlers = handlers
+        self.records = queue.Queue(LOG_QUEUE_SIZE)
+        self.thread = threading.Thread(target=self._run, 
+                                       name="twiki_to_moin-log")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            record = self.records.get()
+            if record is None:
+                break
+            for handler in self.handlers:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+
+    def stop(self):
+        """write the queued records, and stop the thread"""
+        self.records.put(None)
+        self.thread.join()
+        for handler in self.handlers:
+            handler.flush()
+
+
+_writer = None
+
+def start_logging(logger=log):
+    """move the handlers of logger behind a queue and a LogWriter"""
+    global _writer
+    if _writer is not None:
+        return
+    handlers = logger.handlers[:]
+    _writer = LogWriter(handlers)
+    for handler in handlers:
+        logger.removeHandler(handler)
+    logger.addHandler(QueueHandler(_writer.records))
+    atexit.register(stop_logging, logger)
+
+def stop_logging(logger=log):
+    """put the handlers back, after writing the queued records"""
+    global _writer
+    if _writer is None:
+        return
+    writer, _writer = _writer, None
+    for handler in logger.handlers[:]:
+        if isinstance(handler, QueueHandler):
+            logger.removeHandler(handler)
+    writer.stop()
+    for handler in writer.handlers:
+        logger.addHandler(handler)
+
+
+class JsonFormatter(logging.Formatter):
+    """format records as lines of JSON"""
+
+    def format(self, record):
+        entry = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S', 
+                                  time.gmtime(record.created)) + 
+                    '.{0:03d}Z'.format(int(record.msecs)),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, sort_keys=True)
+
+
+class Progress(object):
+    """log the pages converted every so many pages or seconds"""
+
+    def __init__(self, pages=PROGRESS_PAGES, seconds=PROGRESS_SECONDS):
+        self.pages = pages
+        self.seconds = seconds
+        self.start = self.last = clock()
+        self.converted = 0
+        self.failed = 0
+        self.logged = 0
+
+    def add(self, failed=False):
+        if failed:
+            self.failed += 1
+        else:
+            self.converted += 1
+        done = self.converted + self.failed
+        if (done - self.logged >= self.pages or 
+            clock() - self.last >= self.seconds):
+            self.log()
+
+    def finish(self):
+        """log the totals, unless they were just logged"""
+        if self.converted + self.failed > self.logged:
+            self.log()
+
+    def log(self):
+        now = clock()
+        done = self.converted + self.failed
+        rate = done / (now - self.start) if now > self.start else 0.0
+        msg = ("Progress: {0} TWiki pages converted, {1} failed, {2:.1f} "
+               "pages a second").format(self.converted, self.failed, rate)
+        log.info(msg)
+        self.logged = done
+        self.last = now
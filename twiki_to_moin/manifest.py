@@ -0,0 +1,215 @@
+#
+#   Copyright 2013 La Honda Research Center, Inc.
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Source manifest for incremental conversion runs
+
+The manifest is a SQLite file recording the size, mtime and content hash
+of every TWiki topic and attachment converted, and the conversion 
+settings (engine and prefix) of each.  On the next run, topics whose
+source (and attachments) and settings are unchanged are skipped.
+
+"""
+import hashlib
+import logging
+import os
+import sqlite3
+
+log = logging.getLogger('twiki_to_moin')
+
+# commit after this many recorded topics
+COMMIT_INTERVAL = 1000
+
+def source_record(path, data=None, digest=None):
+    """return (path, size, mtime, hash) for a source file
+
+    the hash is computed from data when it is given (a topic that has
+    already been read), otherwise the file is read in chunks.  A hash
+    that is already known can be passed as digest.
+
+    """
+    st = os.stat(path)
+    if digest is None:
+        if data is None:
+            digest = file_hash(path)
+        else:
+            digest = hashlib.sha1(data).hexdigest()
+    return (path, st.st_size, st.st_mtime, digest)
+
+def conversion_settings(engine, prefix):
+    """the settings a topic is converted with, as recorded"""
+    return '{0}\t{1}'.format(engine, prefix or '')
+
+def file_hash(path, chunk_size=1024 * 1024):
+    """sha1 of a file's contents, read in chunks"""
+    sha = hashlib.sha1()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+class Manifest(object):
+    """The sources converted by previous runs
+
+    The recorded state is loaded into memory when the manifest is opened,
+    so lookups during a run don't touch the database.  Only this process
+    writes to the file.
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        parent = os.path.dirname(os.path.abspath(path))
+        if not os.path.isdir(parent):
+            os.makedirs(parent)
+        self.db = sqlite3.connect(path)
+        self.db.execute("""CREATE TABLE IF NOT EXISTS sources (
+            path TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            topic TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            mtime REAL NOT NULL,
+            hash TEXT NOT NULL,
+            settings TEXT NOT NULL DEFAULT '')""")
+        columns = [row[1] for row in 
+                   self.db.execute("PRAGMA table_info(sources)")]
+        if 'settings' not in columns:
+            # written before the settings were recorded; the topics are 
+            # converted again once
+            self.db.execute("ALTER TABLE sources ADD COLUMN "
+                            "settings TEXT NOT NULL DEFAULT ''")
+        # path -> (owner, topic, size, mtime, hash, settings)
+        self.entries = {}
+        # topic source path -> list of it's attachment source paths
+        self.attachments = {}
+        for row in self.db.execute("SELECT path, owner, topic, size, mtime, "
+                                   "hash, settings FROM sources"):
+            path, owner = row[0], row[1]
+            self.entries[path] = row[1:]
+            if path != owner:
+                self.attachments.setdefault(owner, []).append(path)
+        self.seen = set()
+        self.skipped = 0
+        self.pending = 0
+
+    def known(self, twiki_path, settings=None):
+        """return {path: (size, mtime, hash)} recorded for a topic
+
+        The topic source and all of it's attachments are included. An
+        empty dict is returned for a new topic.  When the topic was 
+        converted with other settings (see conversion_settings()), it's
+        source is left out, so it is converted again.
+
+        """
+        twiki_path = os.path.abspath(twiki_path)
+        known = {}
+        if twiki_path in self.entries:
+            for path in [twiki_path] + self.attachments.get(twiki_path, []):
+                known[path] = self.entries[path][2:5]
+            if settings is not None and \
+                    self.entries[twiki_path][5] != settings:
+                del known[twiki_path]
+        return known
+
+    def unchanged(self, known):
+        """True if none of the known sources has changed size or mtime
+
+        known without the topic's own source is changed, see known()
+        """
+        if not any(self.entries[path][0] == path for path in known):
+            return False
+        for path, (size, mtime, digest) in known.items():
+            try:
+                st = os.stat(path)
+            except OSError:
+                return False
+            if st.st_size != size or st.st_mtime != mtime:
+                return False
+        return True
+
+    def skip(self, known):
+        """note a topic skipped as unchanged"""
+        self.seen.update(known)
+        self.skipped += 1
+
+    def record(self, twiki_path, topic, sources, settings=''):
+        """record the sources of a converted topic
+
+        sources is a list of (path, size, mtime, hash); the first entry
+        is the topic itself.  settings are the conversion_settings() it
+        was converted with.
+
+        """
+        owner = os.path.abspath(twiki_path)
+        self.seen.add(owner)
+        rows = []
+        for path, size, mtime, digest in sources:
+            path = os.path.abspath(path)
+            self.seen.add(path)
+            entry = (owner, topic, size, mtime, digest, settings)
+            if self.entries.get(path) != entry:
+                if path not in self.entries and path != owner:
+                    self.attachments.setdefault(owner, []).append(path)
+                self.entries[path] = entry
+                rows.append((path,) + entry)
+        if rows:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO sources (path, owner, topic, size, "
+                "mtime, hash, settings) VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        self.pending += 1
+        if self.pending >= COMMIT_INTERVAL:
+            self.commit()
+
+    def mark_seen(self, twiki_path, known=()):
+        """keep a topic that failed to convert from looking removed"""
+        self.seen.add(os.path.abspath(twiki_path))
+        self.seen.update(known)
+
+    def removed(self, old_dir):
+        """return (path, owner, topic) for sources under old_dir not seen
+
+        only topics found under old_dir are considered, so several webs
+        can share a manifest.
+
+        """
+        root = os.path.join(os.path.abspath(old_dir), '')
+        removed = []
+        for path, entry in self.entries.items():
+            owner, topic = entry[0], entry[1]
+            if owner.startswith(root) and path not in self.seen:
+                removed.append((path, owner, topic))
+        removed.sort()
+        return removed
+
+    def forget(self, paths):
+        for path in paths:
+            entry = self.entries.pop(path, None)
+            if entry and path != entry[0]:
+                self.attachments.get(entry[0], []).remove(path)
+        self.db.executemany("DELETE FROM sources WHERE path = ?",
+                            [(path,) for path in paths])
+
+    def commit(self):
+        self.db.commit()
+        self.pending = 0
+
+    def close(self):
+        self.commit()
+        self.db.close()
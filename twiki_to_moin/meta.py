@@ -0,0 +1,157 @@
+#
+#   Copyright 2013 La Honda Research Center, Inc.
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+TWiki topic META data
+
+TWiki stores a topic's META data as %META:TYPE{name="value" ...}% lines,
+TOPICINFO and TOPICPARENT before the text, and FILEATTACHMENT, FORM and
+FIELD lines after it.  parse_meta() reads the lines at the start and end
+of a topic once, and returns the text without them, and a TopicMeta with
+the values, which are used by the conversion, the attachment copying and
+the edit-logs.
+
+"""
+from collections import namedtuple
+import re
+
+Attachment = namedtuple('Attachment', 
+                        'name path size date user comment attributes')
+Field = namedtuple('Field', 'name title value')
+
+_attribute_re = re.compile(r'(\w+)="(.*?)"')
+# characters TWiki encodes in META values
+_encoded_re = re.compile(r'%(0[AaDd]|2[25]|7[BbDd])')
+
+def _decode(value):
+    return _encoded_re.sub(lambda m: chr(int(m.group(1), 16)), value)
+
+def _number(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class TopicMeta(object):
+    """the META data of a topic"""
+
+    def __init__(self):
+        # attributes of TOPICINFO: author, date, format, version
+        self.topicinfo = {}
+        self.parent = None
+        self.attachments = []
+        self.form = None
+        self.fields = []
+        # (type, attributes) of the other META lines, TOPICMOVED etc.
+        self.other = []
+
+    def add(self, spec):
+        """add a META line, without the %META: and the closing %"""
+        kind, brace, rest = spec.partition('{')
+        attributes = dict((name, _decode(value)) 
+                          for name, value in _attribute_re.findall(rest))
+        if kind == 'TOPICINFO':
+            self.topicinfo = attributes
+        elif kind == 'TOPICPARENT':
+            self.parent = attributes.get('name')
+        elif kind == 'FILEATTACHMENT':
+            name = attributes.get('name') or attributes.get('attachment')
+            if name:
+                self.attachments.append(Attachment(name, 
+                    attributes.get('path', name), 
+                    _number(attributes.get('size')),
+                    _number(attributes.get('date')), 
+                    attributes.get('user', ''),
+                    attributes.get('comment', ''), attributes))
+        elif kind == 'FORM':
+            self.form = attributes.get('name')
+        elif kind == 'FIELD':
+            self.fields.append(Field(attributes.get('name'), 
+                                     attributes.get('title'),
+                                     attributes.get('value', '')))
+        else:
+            self.other.append((kind, attributes))
+
+
+def _meta_spec(line):
+    """return (spec, rest) for a META line, or None for any other line
+
+    spec is the line without the %META: and the closing %, and rest is 
+    what follows the closing %
+    """
+    close = line.rfind('%')
+    if close < 6 or not line.startswith('%META:'):
+        return None
+    return line[6:close], line[close + 1:]
+
+def parse_meta(txt):
+    """split a topic into it's text and META data
+
+    returns (text, TopicMeta); each META line of the text is left empty.
+    Only the lines at the start and the end of the topic are read, unless
+    there is a META line in between.
+    """
+    meta = TopicMeta()
+    pieces = []
+    start = 0
+    while txt.startswith('%META:', start):
+        end = txt.find('\n', start)
+        if end < 0:
+            end = len(txt)
+        found = _meta_spec(txt[start:end])
+        if found is None:
+            break
+        meta.add(found[0])
+        pieces.append(found[1])
+        start = end + 1
+    if start > len(txt):
+        # all META, without a final newline
+        return '\n'.join(pieces), meta
+
+    stop = len(txt)
+    tail = []
+    if stop > start and txt.endswith('\n'):
+        stop -= 1
+        tail.append('')
+    # the footer, read backwards; the first line of the rest of the text
+    # is not META, or it would be in the header
+    footer = []
+    while True:
+        line_start = max(txt.rfind('\n', start, stop) + 1, start)
+        if line_start == start or not txt.startswith('%META:', line_start):
+            break
+        found = _meta_spec(txt[line_start:stop])
+        if found is None:
+            break
+        footer.append(found)
+        stop = line_start - 1
+
+    middle = txt[start:stop]
+    if '\n%META:' in middle:
+        # META lines within the text; rare, so it's read line by line
+        lines = middle.split('\n')
+        for i, line in enumerate(lines):
+            found = _meta_spec(line)
+            if found is not None:
+                meta.add(found[0])
+                lines[i] = found[1]
+        middle = '\n'.join(lines)
+    pieces.append(middle)
+    for spec, rest in reversed(footer):
+        meta.add(spec)
+        pieces.append(rest)
+    return '\n'.join(pieces + tail), meta
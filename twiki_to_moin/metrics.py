@@ -0,0 +1,246 @@
+#
+#   Copyright 2013 La Honda Research Center, Inc.
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Metrics of a conversion run (--metrics-json, --metrics-prom)
+
+Metrics collects counters and histograms in memory as each topic's
+result comes back: the topics converted, failed and skipped, the bytes
+read and written, the attachments copied, the time spent in each 
+conversion stage (from the stage timings, see profiling.py), and the
+pages converted per second over the run.  The files are written every
+METRICS_INTERVAL seconds and at the end of the run, not per page, as a
+JSON summary and as a Prometheus text file (for the node exporter's 
+textfile collector).  Each is written to a temporary file and renamed,
+so a reader never sees a partial file.
+
+"""
+from bisect import bisect_left
+import json
+import logging
+import os
+import time
+
+from twiki_to_moin.profiling import clock
+
+log = logging.getLogger('twiki_to_moin')
+
+# seconds between writes of the metrics files, and between the samples
+# of the conversion rate
+METRICS_INTERVAL = 30.0
+RATE_INTERVAL = 10.0
+
+# histogram bucket upper bounds, for the TWiki page size and the time
+# to convert a page
+SIZE_BUCKETS = [1024, 4096, 16384, 65536, 262144, 1048576, 4194304]
+SECONDS_BUCKETS = [0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0]
+
+# topic stats counted, see convert_topic(), and their metric names
+COUNTERS = [
+    ('bytes_in', 'twiki_bytes'),
+    ('bytes_out', 'moin_bytes'),
+    ('attachments', 'attachments'),
+    ('attachment_bytes', 'attachment_bytes'),
+    ('duplicate_attachments', 'duplicate_attachments'),
+    ('history_revisions', 'history_revisions'),
+    ('cache_hits', 'cache_hits'),
+    ('cache_misses', 'cache_misses'),
+]
+
+PREFIX = 'twiki_to_moin_'
+
+
+class Histogram(object):
+    """counts of values by bucket, as Prometheus histograms count them"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # the last count is for values above every bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def add(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def cumulative(self):
+        """(upper bound, count of values up to it), ending with +Inf"""
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + ['+Inf'], self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def report(self):
+        return {'buckets': [[bound, count] for bound, count 
+                            in self.cumulative()],
+                'sum': round(self.sum, 6), 'count': sum(self.counts)}
+
+
+class Metrics(object):
+    """counters and histograms of a conversion run"""
+
+    def __init__(self, json_path=None, prom_path=None):
+        self.json_path = json_path
+        self.prom_path = prom_path
+        self.start_time = time.time()
+        self.start = clock()
+        self.converted = 0
+        self.failed = 0
+        self.skipped = 0
+        self.finished = False
+        self.counters = dict((key, 0) for key, name in COUNTERS)
+        # stage name -> seconds
+        self.stages = {}
+        self.page_bytes = Histogram(SIZE_BUCKETS)
+        self.page_seconds = Histogram(SECONDS_BUCKETS)
+        # (seconds into the run, pages done) every RATE_INTERVAL
+        self.rate_samples = [(0.0, 0)]
+        self.last_write = self.start
+
+    def add(self, stats, timings=None, failed=False):
+        """add the result of one topic
+
+        stats are the topic's counters, see convert_topic(); timings are
+        it's stage timings, if any
+        """
+        if failed:
+            self.failed += 1
+        else:
+            self.converted += 1
+        for key, name in COUNTERS:
+            if key in stats:
+                self.counters[key] += stats[key]
+        if 'bytes_in' in stats:
+            self.page_bytes.add(stats['bytes_in'])
+        if timings:
+            seconds = 0.0
+            for name, stage_seconds, size_in, size_out in timings:
+                self.stages[name] = self.stages.get(name, 0.0) + \
+                    stage_seconds
+                seconds += stage_seconds
+            self.page_seconds.add(seconds)
+        elapsed = clock() - self.start
+        if elapsed - self.rate_samples[-1][0] >= RATE_INTERVAL:
+            self.rate_samples.append((elapsed, self.converted + self.failed))
+
+    def due(self):
+        """True when the files should be written again"""
+        return clock() - self.last_write >= METRICS_INTERVAL
+
+    def report(self):
+        """return the metrics as a dict, ready for json"""
+        elapsed = clock() - self.start
+        pages = self.converted + self.failed
+        rates = []
+        samples = self.rate_samples + [(elapsed, pages)]
+        for (t0, pages0), (t1, pages1) in zip(samples, samples[1:]):
+            if t1 > t0:
+                rates.append({'seconds': round(t1, 3), 'pages': pages1,
+                              'pages_per_second': 
+                              round((pages1 - pages0) / (t1 - t0), 3)})
+        report = {
+            'start_time': round(self.start_time, 3),
+            'seconds': round(elapsed, 3),
+            'finished': self.finished,
+            'topics': {'converted': self.converted, 'failed': self.failed,
+                       'skipped': self.skipped},
+            'pages_per_second': round(pages / elapsed, 3) if elapsed else 0,
+            'stage_seconds': dict((name, round(seconds, 6)) for name, seconds
+                                  in self.stages.items()),
+            'page_bytes': self.page_bytes.report(),
+            'page_seconds': self.page_seconds.report(),
+            'rate': rates,
+        }
+        for key, name in COUNTERS:
+            report[name] = self.counters[key]
+        return report
+
+    def prometheus(self, report=None):
+        """return the metrics in the Prometheus text format"""
+        if report is None:
+            report = self.report()
+        lines = []
+        def metric(name, kind, text, values):
+            lines.append("# HELP {0}{1} {2}".format(PREFIX, name, text))
+            lines.append("# TYPE {0}{1} {2}".format(PREFIX, name, kind))
+            for labels, value in values:
+                lines.append("{0}{1}{2} {3}".format(PREFIX, name, labels, 
+                                                    value))
+        metric('topics_total', 'counter', 'TWiki topics by result.',
+               [('{{result="{0}"}}'.format(result), count) 
+                for result, count in sorted(report['topics'].items())])
+        for key, name in COUNTERS:
+            metric(name + '_total', 'counter', 
+                   name.replace('_', ' ').capitalize() + '.',
+                   [('', report[name])])
+        metric('stage_seconds_total', 'counter', 
+               'Seconds spent in each conversion stage.',
+               [('{{stage="{0}"}}'.format(stage), seconds) for stage, seconds
+                in sorted(report['stage_seconds'].items())])
+        for name, text in [('page_bytes', 'Size of the TWiki pages.'),
+                           ('page_seconds', 'Time to convert a page.')]:
+            histogram = report[name]
+            metric(name, 'histogram', text,
+                   [('_bucket{{le="{0}"}}'.format(bound), count) 
+                    for bound, count in histogram['buckets']] +
+                   [('_sum', histogram['sum']), 
+                    ('_count', histogram['count'])])
+        rate = report['rate'][-1]['pages_per_second'] if report['rate'] else 0
+        metric('pages_per_second', 'gauge', 
+               'Pages converted per second, recently.', [('', rate)])
+        metric('run_start_time_seconds', 'gauge', 
+               'Start of the conversion run.', [('', report['start_time'])])
+        metric('run_seconds', 'gauge', 'Length of the conversion run.', 
+               [('', report['seconds'])])
+        metric('run_finished', 'gauge', '1 once the run has finished.',
+               [('', int(report['finished']))])
+        return '\n'.join(lines) + '\n'
+
+    def unwritten(self, count):
+        """count topics converted, but not written, as failed"""
+        self.converted -= count
+        self.failed += count
+
+    def write(self, skipped=None, finished=False):
+        """write the metrics files
+
+        skipped is the number of topics skipped so far, as unchanged or
+        converted before resuming
+        """
+        if skipped is not None:
+            self.skipped = skipped
+        self.finished = finished
+        self.last_write = clock()
+        report = self.report()
+        if self.json_path:
+            _replace(self.json_path, 
+                     json.dumps(report, indent=2, sort_keys=True) + '\n')
+        if self.prom_path:
+            _replace(self.prom_path, self.prometheus(report))
+
+
+def _replace(path, text):
+    """write text to path through a temporary file"""
+    tmp_path = path + '.tmp'
+    try:
+        with open(tmp_path, 'w') as f:
+            f.write(text)
+        os.rename(tmp_path, path)
+    except (IOError, OSError) as detail:
+        msg = "Could not write metrics to {0}: {1}".format(path, detail)
+        log.warning(msg)
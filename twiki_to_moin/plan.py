@@ -0,0 +1,254 @@
+#
+#   Copyright 2013 La Honda Research Center, Inc.
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Dry run planning of a conversion (--plan)
+
+plan_conversion() estimates the work, the disk space and the time a 
+conversion will take, without writing anything.  The topics and 
+attachments are counted and sized with stat calls; only a random sample
+of the topics, and the largest ones, are read.  The sample is converted
+to measure the conversion rate and how much the text grows, and the 
+totals are scaled from it.
+
+"""
+import heapq
+import logging
+import os
+import random
+import stat
+
+from twiki_to_moin.profiling import clock
+
+log = logging.getLogger('twiki_to_moin')
+
+# topics read and converted to calibrate the estimates
+SAMPLE_SIZE = 50
+# the largest topics, which are also read, to look for large tables
+LARGEST = 10
+# sizes worth a warning
+LARGE_PAGE_BYTES = 1024 * 1024
+LARGE_TABLE_ROWS = 1000
+# files and directories of each Moin topic: current, edit-log and a 
+# revision, the topic, revisions and attachments directories
+FILES_PER_TOPIC = 6
+# attachment modes whose copies take no space of their own
+SHARED_MODES = ['hardlink', 'reflink', 'symlink']
+
+def plan_conversion(old_dir, data_dir, new_dir, prefix='', 
+                    engine='multipass', jobs=1, attachment_mode='copy',
+                    charset='auto', sample_size=SAMPLE_SIZE, seed=0):
+    """estimate a conversion of old_dir to new_dir, see convert_directory()
+
+    returns the plan as a dict
+    """
+    from twiki_to_moin import find_topics
+
+    rng = random.Random(seed)
+    topics = topic_bytes = 0
+    attachments = attachment_bytes = 0
+    # (size, path) of the largest topics, and a random sample of the 
+    # others, out of the topics pushed out of largest so far
+    largest = []
+    sample = []
+    others = 0
+    for item in find_topics(old_dir, data_dir, prefix):
+        try:
+            size = os.stat(item[0]).st_size
+        except OSError:
+            continue
+        topics += 1
+        topic_bytes += size
+        entry = (size, item[0])
+        if len(largest) < LARGEST:
+            heapq.heappush(largest, entry)
+            entry = None
+        else:
+            entry = heapq.heappushpop(largest, entry)
+        # reservoir sampling of the topics pushed out of largest
+        if entry is not None:
+            others += 1
+            if len(sample) < sample_size:
+                sample.append(entry)
+            else:
+                i = rng.randrange(others)
+                if i < sample_size:
+                    sample[i] = entry
+        if item[1]:
+            count, size = _attachments(item[1])
+            attachments += count
+            attachment_bytes += size
+
+    calibration = _calibrate(sample, largest, engine, charset)
+    large_tables = [(path, rows) 
+                    for path, rows in sorted(calibration.pop('tables'))
+                    if rows >= LARGE_TABLE_ROWS]
+
+    block = _block_size(new_dir)
+    output_bytes = int(topic_bytes * calibration['growth'])
+    output_bytes += topics * FILES_PER_TOPIC * block
+    if attachment_mode not in SHARED_MODES:
+        output_bytes += attachment_bytes
+    free = _free_space(new_dir)
+    seconds = None
+    if calibration['bytes_per_second']:
+        seconds = topic_bytes / calibration['bytes_per_second'] / jobs
+
+    return {
+        'topics': topics,
+        'topic_bytes': topic_bytes,
+        'attachments': attachments,
+        'attachment_bytes': attachment_bytes,
+        'large_pages': [(path, size) for size, path in 
+                        sorted(largest, reverse=True) 
+                        if size >= LARGE_PAGE_BYTES],
+        'large_tables': large_tables,
+        'sampled': calibration['pages'],
+        'bytes_per_second': calibration['bytes_per_second'],
+        'growth': calibration['growth'],
+        'output_bytes': output_bytes,
+        'free_bytes': free,
+        'enough_space': free is None or free >= output_bytes,
+        'conversion_seconds': seconds,
+        'jobs': jobs,
+    }
+
+def _attachments(pub_path):
+    """return the number and total size of the files in a topic's pub 
+    directory, leaving out RCS files"""
+    count = size = 0
+    try:
+        names = os.listdir(pub_path)
+    except OSError:
+        return 0, 0
+    for name in names:
+        if name.endswith(',v'):
+            continue
+        try:
+            st = os.stat(os.path.join(pub_path, name))
+        except OSError:
+            continue
+        if stat.S_ISREG(st.st_mode):
+            count += 1
+            size += st.st_size
+    return count, size
+
+def _calibrate(sample, largest, engine, charset):
+    """convert the sampled topics, timing the conversion
+
+    returns the conversion rate, the output bytes per input byte, and 
+    (path, rows) of the largest table of each topic read; the largest
+    topics are only read for their tables, since they would skew the
+    rates
+    """
+    from twiki_to_moin.charset import decode_page
+    from twiki_to_moin.conversion import ENGINES
+    from twiki_to_moin.meta import parse_meta
+    convert = ENGINES[engine]
+    size_in = size_out = pages = 0
+    seconds = 0.0
+    tables = []
+    for size, path in sample + largest:
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except (IOError, OSError):
+            continue
+        tables.append((path, _largest_table(data)))
+        if (size, path) in largest:
+            continue
+        start = clock()
+        txt = convert(parse_meta(decode_page(data, charset))[0], '', 
+                      meta=False)
+        seconds += clock() - start
+        pages += 1
+        size_in += len(data)
+        size_out += len(txt)
+    return {
+        'pages': pages,
+        'bytes_per_second': size_in / seconds if seconds else None,
+        'growth': float(size_out) / size_in if size_in else 1.0,
+        'tables': tables,
+    }
+
+def _largest_table(data):
+    """the number of rows of the longest run of table rows in a page"""
+    rows = longest = 0
+    for line in data.split(b'\n'):
+        if line.lstrip(b' ').startswith(b'|'):
+            rows += 1
+            longest = max(longest, rows)
+        else:
+            rows = 0
+    return longest
+
+def _existing_parent(path):
+    path = os.path.abspath(path)
+    while not os.path.exists(path):
+        path = os.path.dirname(path)
+    return path
+
+def _block_size(new_dir):
+    try:
+        return os.statvfs(_existing_parent(new_dir)).f_frsize
+    except (AttributeError, OSError):
+        return 4096
+
+def _free_space(new_dir):
+    """bytes free to an unprivileged user under new_dir, or None"""
+    try:
+        st = os.statvfs(_existing_parent(new_dir))
+    except (AttributeError, OSError):
+        return None
+    return st.f_bavail * st.f_frsize
+
+def log_plan(plan):
+    """log a plan from plan_conversion()"""
+    mb = 1024.0 * 1024
+    msg = "Plan: {0} TWiki topics, {1:.1f} MB".format(
+        plan['topics'], plan['topic_bytes'] / mb)
+    log.info(msg)
+    msg = "Plan: {0} attachments, {1:.1f} MB".format(
+        plan['attachments'], plan['attachment_bytes'] / mb)
+    log.info(msg)
+    for path, size in plan['large_pages']:
+        msg = "Plan: large page {0}, {1:.1f} MB".format(path, size / mb)
+        log.warning(msg)
+    for path, rows in plan['large_tables']:
+        msg = "Plan: large table in {0}, {1} rows".format(path, rows)
+        log.warning(msg)
+    if plan['bytes_per_second']:
+        msg = ("Plan: converted {0} sample pages at {1:.2f} MB/s; the "
+               "output is {2:.2f} times the input").format(
+            plan['sampled'], plan['bytes_per_second'] / mb, plan['growth'])
+        log.info(msg)
+        msg = "Plan: estimated conversion time {0:.0f} seconds with {1} " \
+              "jobs, not counting attachment copies".format(
+            plan['conversion_seconds'], plan['jobs'])
+        log.info(msg)
+    msg = "Plan: estimated output {0:.1f} MB".format(
+        plan['output_bytes'] / mb)
+    log.info(msg)
+    if plan['free_bytes'] is None:
+        log.warning("Plan: could not find the free space for the output")
+    elif plan['enough_space']:
+        msg = "Plan: {0:.1f} MB free for the output".format(
+            plan['free_bytes'] / mb)
+        log.info(msg)
+    else:
+        msg = "Plan: only {0:.1f} MB free for the output".format(
+            plan['free_bytes'] / mb)
+        log.error(msg)
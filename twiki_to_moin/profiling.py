@@ -0,0 +1,182 @@
+#
+#   Copyright 2013 La Honda Research Center, Inc.
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Per stage timing of the conversion (--profile)
+
+The conversion engines call timed_stage() for each stage when they are
+given a timings list.  Each page's timings are added to a Profile, which
+reports the totals per stage, the slowest pages, and pages where a stage
+ran far slower than normal for the amount of text, which usually means
+a regular expression is backtracking.
+
+"""
+from array import array
+import heapq
+import json
+import logging
+import time
+
+log = logging.getLogger('twiki_to_moin')
+
+# wall clock with the best resolution available
+clock = getattr(time, 'perf_counter', time.time)
+
+# a stage is an outlier when it's time per byte is this many times the
+# median for the stage, and it takes at least MIN_OUTLIER_SECONDS.  Pages
+# are counted as at least MIN_RATE_BYTES long, so the fixed cost of a 
+# stage doesn't make every tiny page look slow.
+OUTLIER_FACTOR = 10.0
+MIN_OUTLIER_SECONDS = 0.01
+MIN_RATE_BYTES = 1024
+
+def timed_stage(timings, name, function, txt, *args):
+    """return function(txt, *args), timing it when timings is a list
+
+    appends (name, seconds, input size, output size) to timings, and 
+    the stage's output to timings.texts for a StageOutputs
+    """
+    if timings is None:
+        return function(txt, *args)
+    start = clock()
+    result = function(txt, *args)
+    timings.append((name, clock() - start, len(txt), len(result)))
+    if isinstance(timings, StageOutputs):
+        timings.texts.append(result)
+    return result
+
+
+class StageOutputs(list):
+    """stage timings that also keep the text each stage returned"""
+
+    def __init__(self):
+        list.__init__(self)
+        self.texts = []
+
+
+class Profile(object):
+    """stage timings for all the pages of a run"""
+
+    def __init__(self, slowest=10):
+        self.slowest = slowest
+        self.topics = []
+        # stage name -> [seconds, bytes in, bytes out]
+        self.totals = {}
+        self.stages = []
+        # stage name -> (topic index, seconds, seconds per byte) arrays
+        self.samples = {}
+        # (seconds, topic index, size) of the slowest pages
+        self.slow_pages = []
+
+    def add(self, topic, timings):
+        """add the timings of one page"""
+        index = len(self.topics)
+        self.topics.append(topic)
+        page_seconds = 0.0
+        size = 0
+        for name, seconds, size_in, size_out in timings:
+            if name not in self.totals:
+                self.stages.append(name)
+                self.totals[name] = [0.0, 0, 0]
+                self.samples[name] = (array('l'), array('d'), array('d'))
+            total = self.totals[name]
+            total[0] += seconds
+            total[1] += size_in
+            total[2] += size_out
+            indexes, times, rates = self.samples[name]
+            indexes.append(index)
+            times.append(seconds)
+            rates.append(seconds / max(size_in, MIN_RATE_BYTES))
+            page_seconds += seconds
+            size = max(size, size_in)
+        entry = (page_seconds, index, size)
+        if len(self.slow_pages) < self.slowest:
+            heapq.heappush(self.slow_pages, entry)
+        else:
+            heapq.heappushpop(self.slow_pages, entry)
+
+    def report(self, outliers=20):
+        """return the profile as a dict, ready for json"""
+        total_seconds = sum(total[0] for total in self.totals.values()) or 1
+        stages = []
+        for name in self.stages:
+            seconds, size_in, size_out = self.totals[name]
+            stages.append({
+                'stage': name,
+                'seconds': round(seconds, 6),
+                'percent': round(100.0 * seconds / total_seconds, 1),
+                'bytes_in': size_in,
+                'bytes_out': size_out,
+                'mb_per_second': round(size_in / 1e6 / seconds, 3)
+                                 if seconds else None,
+            })
+        slowest = []
+        for seconds, index, size in sorted(self.slow_pages, reverse=True):
+            slowest.append({'topic': self.topics[index],
+                            'seconds': round(seconds, 6), 'bytes': size})
+        return {
+            'pages': len(self.topics),
+            'stages': stages,
+            'slowest_pages': slowest,
+            'outliers': self.outliers(outliers),
+        }
+
+    def outliers(self, limit):
+        """pages where a stage is far slower per byte than it's median"""
+        found = []
+        for name in self.stages:
+            indexes, times, rates = self.samples[name]
+            median = sorted(rates)[len(rates) // 2]
+            if not median:
+                continue
+            for i, rate in enumerate(rates):
+                if (rate > median * OUTLIER_FACTOR and
+                    times[i] >= MIN_OUTLIER_SECONDS):
+                    found.append((rate / median, name, i))
+        found.sort(reverse=True)
+        result = []
+        for ratio, name, i in found[:limit]:
+            indexes, times, rates = self.samples[name]
+            result.append({'topic': self.topics[indexes[i]], 'stage': name,
+                           'seconds': round(times[i], 6),
+                           'times_median': round(ratio, 1)})
+        return result
+
+    def log_report(self, report=None):
+        if report is None:
+            report = self.report()
+        log.info("Conversion profile for {0} pages:".format(report['pages']))
+        for stage in report['stages']:
+            msg = ("  {stage:<12} {seconds:10.3f}s {percent:5.1f}% "
+                   "{bytes_in:>12} bytes in {bytes_out:>12} bytes out").format(
+                   **stage)
+            log.info(msg)
+        log.info("Slowest pages:")
+        for page in report['slowest_pages']:
+            msg = "  {topic} {seconds:.3f}s {bytes} bytes".format(**page)
+            log.info(msg)
+        if report['outliers']:
+            log.info("Stages far slower than normal for the page size:")
+        for page in report['outliers']:
+            msg = ("  {topic} {stage} {seconds:.3f}s, {times_median} times "
+                   "the median").format(**page)
+            log.info(msg)
+
+    def write_json(self, path, report=None):
+        if report is None:
+            report = self.report()
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
@@ -0,0 +1,234 @@
+#
+#   Copyright 2013 La Honda Research Center, Inc.
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Reading TWiki topic history from RCS files
+
+TWiki keeps the history of Topic.txt in Topic.txt,v, an RCS file.  The
+file holds the full text of the newest revision, followed by a reverse 
+delta for each older revision, which turns the text of the revision after
+it into it's own.  RcsFile reads the file once, and revisions() applies
+the deltas one after another, keeping only the current text in memory.
+
+Only the trunk is read; TWiki doesn't use RCS branches.
+
+"""
+import re
+
+class RcsError(Exception):
+    """the RCS file is not in the expected format"""
+
+_token_re = re.compile(br'\s*(?:(@)|([;:])|([^\s;:@]+))')
+_digits = b'0123456789'
+
+class RcsFile(object):
+    """the revisions of an RCS file
+
+    head is the newest revision number, trunk lists the trunk revisions
+    newest first, and deltas maps each revision to a dict of it's date,
+    author and the revision before it (next).
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.data = f.read()
+        self.pos = 0
+        self.head = None
+        self.deltas = {}
+        self._read_admin()
+        # the deltatexts start after desc
+        self.text_start = self.pos
+        self.trunk = []
+        revision = self.head
+        while revision:
+            if revision not in self.deltas or revision in self.trunk:
+                self._error("broken revision chain at {0}".format(revision))
+            self.trunk.append(revision)
+            revision = self.deltas[revision]['next']
+
+    def _error(self, msg):
+        raise RcsError("{0}: {1}".format(self.path, msg))
+
+    def _token(self):
+        """return the next token; strings are returned as (bytes,)"""
+        match = _token_re.match(self.data, self.pos)
+        if not match:
+            if self.data[self.pos:].strip():
+                self._error("unexpected data at offset {0}".format(self.pos))
+            return None
+        self.pos = match.end()
+        if match.group(1):
+            return (self._string(),)
+        return match.group(2) or match.group(3)
+
+    def _string(self):
+        start = i = self.pos
+        while True:
+            i = self.data.find(b'@', i)
+            if i < 0:
+                self._error("unterminated string at offset {0}".format(start))
+            if self.data[i + 1:i + 2] != b'@':
+                break
+            i += 2
+        self.pos = i + 1
+        return self.data[start:i].replace(b'@@', b'@')
+
+    def _phrase(self, key):
+        """return the values of a phrase, up to it's ';'"""
+        values = []
+        while True:
+            token = self._token()
+            if token is None:
+                self._error("unexpected end of file in {0}".format(key))
+            if token == b';':
+                return values
+            values.append(token)
+
+    def _peek(self):
+        pos = self.pos
+        token = self._token()
+        self.pos = pos
+        return token
+
+    def _read_admin(self):
+        """read the admin section and the delta tree, up to desc"""
+        while True:
+            token = self._token()
+            if token is None:
+                self._error("no desc")
+            if token == b'desc':
+                if not isinstance(self._token(), tuple):
+                    self._error("desc is not a string")
+                break
+            if isinstance(token, tuple):
+                self._error("unexpected string at offset {0}".format(self.pos))
+            if token[:1] in _digits:
+                self._read_delta(token.decode('ascii'))
+                continue
+            values = self._phrase(token)
+            if token == b'head':
+                self.head = values and values[0].decode('ascii')
+        if self.head is None:
+            self._error("no head revision")
+
+    def _read_delta(self, revision):
+        delta = {'date': None, 'author': None, 'next': None}
+        while True:
+            token = self._peek()
+            if token is None or token == b'desc' or (
+                    not isinstance(token, tuple) and token[:1] in _digits):
+                break
+            self._token()
+            values = self._phrase(token)
+            if token in (b'date', b'author', b'next') and values:
+                delta[token.decode('ascii')] = values[0].decode('ascii')
+        self.deltas[revision] = delta
+
+    def _deltatexts(self):
+        """yield (revision, text) for each deltatext, in file order"""
+        while True:
+            revision = self._token()
+            if revision is None:
+                return
+            if isinstance(revision, tuple):
+                self._error("unexpected string at offset {0}".format(self.pos))
+            text = None
+            while text is None:
+                token = self._token()
+                if token is None:
+                    self._error("no text for revision {0}".format(revision))
+                if token == b'text':
+                    text = self._token()
+                    if not isinstance(text, tuple):
+                        self._error("text is not a string")
+                elif token != b'log':
+                    # a newphrase
+                    self._phrase(token)
+                else:
+                    self._token()
+            yield revision.decode('ascii'), text[0]
+
+    def revisions(self):
+        """yield (revision, text) for the trunk revisions, newest first"""
+        self.pos = self.text_start
+        expected = iter(self.trunk)
+        wanted = next(expected, None)
+        lines = None
+        for revision, text in self._deltatexts():
+            if revision != wanted:
+                if revision in self.trunk:
+                    self._error("revision {0} out of order".format(revision))
+                # a branch
+                continue
+            if lines is None:
+                lines = split_lines(text)
+            else:
+                lines = apply_delta(lines, text, self._error)
+            yield revision, b''.join(lines)
+            wanted = next(expected, None)
+            if wanted is None:
+                return
+        if wanted is not None:
+            self._error("no text for revision {0}".format(wanted))
+
+
+def split_lines(text):
+    """split text into lines, keeping the line ends"""
+    lines = [line + b'\n' for line in text.split(b'\n')]
+    if lines[-1] == b'\n':
+        lines.pop()
+    else:
+        lines[-1] = lines[-1][:-1]
+    return lines
+
+def apply_delta(lines, delta, error):
+    """apply an RCS delta to the list of lines it is based on
+
+    the delta is a series of 'dL N' (delete N lines starting at line L) 
+    and 'aL N' (add the N lines that follow after line L) commands, with
+    line numbers counting the lines of the base text.
+    returns the new list of lines
+    """
+    result = []
+    pos = 0
+    commands = split_lines(delta)
+    i = 0
+    while i < len(commands):
+        command = commands[i]
+        i += 1
+        try:
+            kind = command[:1]
+            line, count = [int(n) for n in command[1:].split()]
+        except ValueError:
+            error("bad delta command {0!r}".format(command))
+        if kind == b'd':
+            if line - 1 < pos or line - 1 + count > len(lines):
+                error("delta deletes lines out of range")
+            result.extend(lines[pos:line - 1])
+            pos = line - 1 + count
+        elif kind == b'a':
+            if line < pos or line > len(lines):
+                error("delta adds lines out of range")
+            result.extend(lines[pos:line])
+            pos = line
+            result.extend(commands[i:i + count])
+            i += count
+        else:
+            error("bad delta command {0!r}".format(command))
+    result.extend(lines[pos:])
+    return result
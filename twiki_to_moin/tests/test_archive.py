@@ -0,0 +1,133 @@
+#
+#   Copyright 2013 La Honda Research Center, Inc.
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import logging
+import os
+import shutil
+import tarfile
+import tempfile
+import time
+import unittest
+import zipfile
+
+import twiki_to_moin as ttm
+from twiki_to_moin.archive import ArchiveWriter, archive_mode
+from twiki_to_moin.config import single_web
+from twiki_to_moin.writer import QUEUE_PER_THREAD
+
+class ArchiveTests(unittest.TestCase):
+    "Tests for writing the converted wiki to an archive"
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.data = os.path.join(self.root, 'data')
+        self.pub = os.path.join(self.root, 'pub')
+        os.makedirs(os.path.join(self.pub, 'Home'))
+        os.mkdir(self.data)
+        with open(os.path.join(self.data, 'Home.txt'), 'w') as f:
+            f.write('%META:TOPICINFO{author="JoeUser" date="1356998400" '
+                    'format="1.1" version="1.1"}%\n'
+                    '---+ Welcome\n'
+                    '%META:FILEATTACHMENT{name="notes.txt" version="1.1"}%\n')
+        with open(os.path.join(self.data, 'Other.txt'), 'w') as f:
+            f.write('Some text\n')
+        with open(os.path.join(self.pub, 'Home', 'notes.txt'), 'w') as f:
+            f.write('the notes\n')
+        self.level = ttm.log.level
+        ttm.log.setLevel(logging.CRITICAL)
+
+    def tearDown(self):
+        ttm.log.setLevel(self.level)
+        shutil.rmtree(self.root)
+
+    def convert(self, name, jobs=1):
+        path = os.path.join(self.root, name)
+        failures = ttm.convert_directory([single_web(self.data, self.pub)], 
+                                         os.path.join(self.root, 'pages'),
+                                         jobs=jobs, output_archive=path)
+        self.assertEqual(failures, 0)
+        # only the archive is written
+        self.assertFalse(os.path.exists(os.path.join(self.root, 'pages')))
+        return path
+
+    def check(self, names, read):
+        for name in ['pages/Home/', 'pages/Home/revisions/', 
+                     'pages/Home/attachments/', 'pages/Other/', 
+                     'pages/Home/current', 'pages/Home/revisions/00000001',
+                     'pages/Home/attachments/notes.txt', 'edit-log']:
+            self.assertTrue(name.rstrip('/') in names, name)
+        self.assertEqual(read('pages/Home/current'), b'00000001')
+        self.assertEqual(read('pages/Home/attachments/notes.txt'), 
+                         b'the notes\n')
+        self.assertTrue(b'= Welcome =' in 
+                        read('pages/Home/revisions/00000001'))
+
+    def test_tar(self):
+        path = self.convert('wiki.tar.gz')
+        with tarfile.open(path) as tar:
+            names = tar.getnames()
+            self.check(names, lambda name: tar.extractfile(name).read())
+
+    def test_zip(self):
+        path = self.convert('wiki.zip', jobs=2)
+        with zipfile.ZipFile(path) as archive:
+            names = [name.rstrip('/') for name in archive.namelist()]
+            self.check(names, archive.read)
+
+    def test_slow_archive(self):
+        for i in range(150):
+            with open(os.path.join(self.data, 'Topic%d.txt' % i), 'w') as f:
+                f.write('Topic %d\n' % i)
+        find_topics, add_data = ttm.find_topics, ArchiveWriter._add_data
+        found = []
+        written = []
+        in_flight = []
+
+        def counted_topics(*args):
+            for item in find_topics(*args):
+                found.append(item)
+                yield item
+
+        def slow_add_data(writer, entries):
+            time.sleep(0.002)
+            if entries[-1][0].endswith('/current'):
+                written.append(entries)
+                in_flight.append(len(found) - len(written))
+            return add_data(writer, entries)
+
+        ttm.find_topics = counted_topics
+        ArchiveWriter._add_data = slow_add_data
+        try:
+            self.convert('wiki.tar.gz', jobs=2)
+        finally:
+            ttm.find_topics = find_topics
+            ArchiveWriter._add_data = add_data
+        self.assertEqual(len(written), 152)
+        # the chunks sent to the workers, the one being taken, and the 
+        # writer's queue
+        limit = ((2 * ttm.CHUNKS_PER_JOB + 1) * ttm.CHUNK_SIZE + 
+                 QUEUE_PER_THREAD)
+        self.assertTrue(max(in_flight) <= limit, max(in_flight))
+
+    def test_archive_mode(self):
+        self.assertEqual(archive_mode('wiki.tar.bz2'), 'w|bz2')
+        self.assertEqual(archive_mode('wiki.tgz'), 'w|gz')
+        self.assertEqual(archive_mode('wiki.zip'), 'zip')
+        self.assertEqual(archive_mode('wiki.rar'), None)
+
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(ArchiveTests)
@@ -0,0 +1,92 @@
+#
+#   Copyright 2013 La Honda Research Center, Inc.
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import twiki_to_moin as ttm
+from twiki_to_moin.benchmark import generate, harness
+from twiki_to_moin.conversion import twiki2moin
+from twiki_to_moin.meta import parse_meta
+from twiki_to_moin.topicindex import TopicIndex, check_links
+
+class GeneratorTests(unittest.TestCase):
+    "Tests for the synthetic TWiki web generator"
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def web(self, name, **settings):
+        data = os.path.join(self.root, name, 'data')
+        pub = os.path.join(self.root, name, 'pub')
+        paths = generate.generate_web(data, pub, topics=20, **settings)
+        pages = []
+        for path in paths:
+            with open(path) as f:
+                pages.append((os.path.relpath(path, data), f.read()))
+        return pages
+
+    def test_repeatable(self):
+        self.assertEqual(self.web('one'), self.web('two'))
+        self.assertNotEqual(self.web('one'), self.web('three', seed=2))
+
+    def test_topics(self):
+        pages = self.web('one', subwebs=1)
+        self.assertEqual(len(pages), 20)
+        self.assertTrue(any(os.sep in path for path, txt in pages))
+        self.assertTrue(all(txt.startswith('%META:TOPICINFO{') 
+                            for path, txt in pages))
+
+    def test_links_resolve(self):
+        data = os.path.join(self.root, 'data')
+        generate.generate_web(data, os.path.join(self.root, 'pub'), 
+                              topics=30, subwebs=0)
+        topics = list(ttm.find_topics(data, None))
+        index = TopicIndex()
+        for item in topics:
+            index.add(ttm.moin_page_name(item))
+        links = dangling = 0
+        for item in topics:
+            with open(item[0]) as f:
+                txt = twiki2moin(parse_meta(f.read())[0], '')
+            page = ttm.moin_page_name(item)
+            # every link, checked against no topics
+            links += len(check_links(txt, page, TopicIndex())[1])
+            dangling += len(check_links(txt, page, index)[1])
+        self.assertTrue(links > 30, links)
+        self.assertEqual(dangling, 0)
+
+    def test_bench_engine(self):
+        pages = [txt for path, txt in self.web('one')]
+        result = harness.bench_engine(pages, 'singlepass', repeat=1)
+        self.assertEqual(result['pages'], 20)
+        self.assertEqual(result['bytes'], sum(len(txt) for txt in pages))
+
+    def test_pathological(self):
+        results = harness.bench_pathological('singlepass', sizes=(500, 1000))
+        self.assertEqual(sorted(results), 
+                         sorted(generate.pathological_pages(500)))
+
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(GeneratorTests)
@@ -0,0 +1,117 @@
+#
+#   Copyright 2013 La Honda Research Center, Inc.
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+import twiki_to_moin as ttm
+from twiki_to_moin import cache
+from twiki_to_moin.cache import (cache_key, cache_path, cached_convert, 
+                                 prune_cache)
+from twiki_to_moin.config import single_web
+from twiki_to_moin.conversion import twiki2moin
+
+class CacheTests(unittest.TestCase):
+    "Tests for the conversion cache"
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.cache = os.path.join(self.root, 'cache')
+        self.level = ttm.log.level
+        ttm.log.setLevel(logging.CRITICAL)
+
+    def tearDown(self):
+        ttm.log.setLevel(self.level)
+        shutil.rmtree(self.root)
+
+    def test_key(self):
+        key = cache_key('text', 'Web', 'multipass')
+        self.assertEqual(key, cache_key('text', 'Web', 'multipass'))
+        self.assertNotEqual(key, cache_key('text', 'Other', 'multipass'))
+        self.assertNotEqual(key, cache_key('text', 'Web', 'singlepass'))
+        self.assertNotEqual(key, cache_key('text2', 'Web', 'multipass'))
+
+    def test_hit(self):
+        stats = {}
+        txt = '---+ Heading\nSee OtherTopic\n'
+        first = cached_convert(self.cache, 'multipass', txt, 'Web', 
+                               stats=stats)
+        self.assertEqual(first, twiki2moin(txt, 'Web'))
+        timings = []
+        second = cached_convert(self.cache, 'multipass', txt, 'Web', 
+                                timings, stats)
+        self.assertEqual(second, first)
+        self.assertEqual(stats, {'cache_hits': 1, 'cache_misses': 1})
+        self.assertEqual([timing[0] for timing in timings], ['cache'])
+
+    def test_prune(self):
+        for i, txt in enumerate(['one', 'two', 'three']):
+            cached_convert(self.cache, 'multipass', txt, '')
+            path = cache_path(self.cache, cache_key(txt, '', 'multipass'))
+            os.utime(path, (1000000000 + i, 1000000000 + i))
+        removed, kept, size = prune_cache(self.cache, 8)
+        self.assertEqual((removed, kept), (1, 2))
+        self.assertFalse(os.path.exists(
+            cache_path(self.cache, cache_key('one', '', 'multipass'))))
+
+    def test_convert_directory(self):
+        data = os.path.join(self.root, 'data')
+        os.makedirs(os.path.join(data, 'Sub'))
+        for name in ['WebHome.txt', os.path.join('Sub', 'WebHome.txt'),
+                     'Other.txt']:
+            with open(os.path.join(data, name), 'w') as f:
+                f.write('Welcome to the web\n')
+        pages = os.path.join(self.root, 'pages')
+        failures = ttm.convert_directory([single_web(data)], pages, 
+                                         cache_dir=self.cache)
+        self.assertEqual(failures, 0)
+        # the prefix is part of the key
+        entries = sum(len(files) for path, dirs, files in os.walk(self.cache))
+        self.assertEqual(entries, 2)
+
+    def test_prune_during_run(self):
+        data = os.path.join(self.root, 'data')
+        os.mkdir(data)
+        for i in range(40):
+            with open(os.path.join(data, 'Topic%d.txt' % i), 'w') as f:
+                f.write('Topic %d of the web\n' % i)
+        sizes = []
+        store = cache._store
+        def measure(path, data):
+            store(path, data)
+            sizes.append(sum(os.path.getsize(os.path.join(parent, name)) 
+                             for parent, dirs, files in os.walk(self.cache)
+                             for name in files))
+        cache._store = measure
+        prune_entries = cache.CACHE_PRUNE_ENTRIES
+        cache.CACHE_PRUNE_ENTRIES = 5
+        try:
+            ttm.convert_directory([single_web(data)], 
+                                  os.path.join(self.root, 'pages'),
+                                  cache_dir=self.cache, cache_size=200)
+        finally:
+            cache._store = store
+            cache.CACHE_PRUNE_ENTRIES = prune_entries
+        self.assertEqual(len(sizes), 40)
+        # within the limit but for the entries written since a prune
+        self.assertTrue(max(sizes) <= 200 + 5 * 30, max(sizes))
+
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(CacheTests)
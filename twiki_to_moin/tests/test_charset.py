@@ -0,0 +1,71 @@
+#
+#   Copyright 2013 La Honda Research Center, Inc.
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import twiki_to_moin.charset as tc
+from twiki_to_moin.copying import make_directories, make_page
+
+UTF8 = u'Caf\xe9 \u20ac'.encode('utf-8')
+LATIN1 = u'Caf\xe9'.encode('latin1')
+
+class CharsetTests(unittest.TestCase):
+    "Tests for page decoding and encoding"
+
+    def test_check(self):
+        self.assertEqual(tc.check_charset('auto'), 'auto')
+        self.assertEqual(tc.check_charset('UTF8'), 'utf-8')
+        self.assertRaises(LookupError, tc.check_charset, 'no-such-charset')
+
+    def test_auto(self):
+        self.assertEqual(tc.decode_page(b'ascii'), 'ascii')
+        self.assertEqual(tc.to_bytes(tc.decode_page(UTF8)), UTF8)
+        # not UTF-8, read as ISO-8859-1
+        self.assertEqual(tc.to_bytes(tc.decode_page(LATIN1)), 
+                         u'Caf\xe9'.encode('utf-8'))
+
+    def test_charset(self):
+        latin1 = tc.check_charset('latin1')
+        self.assertEqual(tc.to_bytes(tc.decode_page(UTF8, latin1)), 
+                         u'Caf\xc3\xa9 \xe2\x82\xac'.encode('utf-8'))
+        self.assertEqual(tc.to_bytes(tc.decode_page(LATIN1, 'utf-8')), 
+                         u'Caf\ufffd'.encode('utf-8'))
+
+    def test_native(self):
+        self.assertEqual(tc.native(UTF8), tc.decode_page(UTF8))
+        self.assertEqual(tc.native('text'), 'text')
+
+    def test_make_page(self):
+        root = tempfile.mkdtemp()
+        try:
+            make_directories(root, 'Topic', False)
+            make_page(root, 'Topic', tc.decode_page(UTF8))
+            with open(os.path.join(root, 'Topic', 'revisions', 
+                                   '00000001'), 'rb') as f:
+                self.assertEqual(f.read(), UTF8)
+            with open(os.path.join(root, 'Topic', 'current'), 'rb') as f:
+                self.assertEqual(f.read(), b'00000001')
+        finally:
+            shutil.rmtree(root)
+
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(CharsetTests)
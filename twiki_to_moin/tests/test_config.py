@@ -0,0 +1,121 @@
+#
+#   Copyright 2013 La Honda Research Center, Inc.
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import json
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+import twiki_to_moin as ttm
+from twiki_to_moin.config import Web, read_config, single_web
+
+class ConfigTests(unittest.TestCase):
+    "Tests for converting several webs with --config"
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.level = ttm.log.level
+        ttm.log.setLevel(logging.CRITICAL)
+
+    def tearDown(self):
+        ttm.log.setLevel(self.level)
+        shutil.rmtree(self.root)
+
+    def write(self, name, text):
+        path = os.path.join(self.root, name)
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+    def test_ini(self):
+        path = self.write('webs.ini', 
+            '[Main]\npage_dir = data/Main\ndata_dir = /twiki/pub/Main\n\n'
+            '[Sandbox]\npage_dir = data/Sandbox\ndata_dir = pub/Sandbox\n'
+            'prefix = SandboxPages\ncharset = CP1252\n')
+        self.assertEqual(read_config(path), [
+            Web('Main', os.path.join(self.root, 'data', 'Main'), 
+                '/twiki/pub/Main', ''),
+            Web('Sandbox', os.path.join(self.root, 'data', 'Sandbox'), 
+                os.path.join(self.root, 'pub', 'Sandbox'), 'SandboxPages',
+                'cp1252')])
+
+    def test_json(self):
+        path = self.write('webs.json', json.dumps({'webs': [
+            {'page_dir': '/twiki/data/Main', 'data_dir': '/twiki/pub/Main'}]}))
+        self.assertEqual(read_config(path), 
+                         [Web('Main', '/twiki/data/Main', '/twiki/pub/Main', 
+                              '')])
+
+    def test_single_web(self):
+        self.assertEqual(single_web('/twiki/data/Main/', '/twiki/pub/Main'),
+                         Web('Main', '/twiki/data/Main/', '/twiki/pub/Main', 
+                             ''))
+
+    def test_errors(self):
+        for name, text in [('none.ini', ''), 
+                           ('bad.ini', '[Main]\npage_dir = data/Main\n'),
+                           ('bad.json', '{"webs": [1]}'),
+                           ('charset.ini', '[Main]\npage_dir = data/Main\n'
+                                           'data_dir = pub/Main\n'
+                                           'charset = nonesuch\n'),
+                           ('broken.json', '[{')]:
+            self.assertRaises(ValueError, read_config, 
+                              self.write(name, text))
+        self.assertRaises(ValueError, read_config, 
+                          os.path.join(self.root, 'missing.ini'))
+
+    def test_convert_directory(self):
+        webs = []
+        for web, prefix in [('Main', ''), ('Sandbox', 'SandboxPages')]:
+            data = os.path.join(self.root, 'data', web)
+            os.makedirs(data)
+            self.write(os.path.join('data', web, 'WebHome.txt'), 
+                       'The %s web\n' % web)
+            webs.append(Web(web, data, None, prefix))
+        pages = os.path.join(self.root, 'pages')
+        failures = ttm.convert_directory(webs, pages)
+        self.assertEqual(failures, 0)
+        self.assertEqual(sorted(os.listdir(pages)), 
+                         ['SandboxPages(2f)WebHome', 'WebHome'])
+        with open(os.path.join(self.root, 'edit-log')) as f:
+            self.assertEqual(len(f.readlines()), 2)
+
+    def test_web_charset(self):
+        webs = []
+        for web, charset in [('Main', None), ('Legacy', 'cp1252')]:
+            data = os.path.join(self.root, 'data', web)
+            os.makedirs(data)
+            with open(os.path.join(data, 'WebHome.txt'), 'wb') as f:
+                f.write(b'Price 5\x80\n')
+            webs.append(Web(web, data, None, web, charset))
+        pages = os.path.join(self.root, 'pages')
+        failures = ttm.convert_directory(webs, pages)
+        self.assertEqual(failures, 0)
+        text = {}
+        for web in ['Main', 'Legacy']:
+            path = os.path.join(pages, web + '(2f)WebHome', 'revisions', 
+                                '00000001')
+            with open(path, 'rb') as f:
+                text[web] = f.read()
+        # the run's charset (auto) reads it as ISO-8859-1
+        self.assertEqual(text['Main'], u'Price 5\x80\n'.encode('utf-8'))
+        self.assertEqual(text['Legacy'], u'Price 5\u20ac\n'.encode('utf-8'))
+
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(ConfigTests)
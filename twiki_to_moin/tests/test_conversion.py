@@ -18,6 +18,7 @@
 import unittest
 
 import twiki_to_moin.conversion as tm
+from twiki_to_moin.meta import parse_meta
 
 class VariableTests(unittest.TestCase):
 
@@ -112,6 +113,36 @@ topic info
 """
         self.assertEqual(tm.process_meta(twiki), moin)
 
+    def test_not_meta(self):
+        twiki = "%META:NOT CLOSED\ntext\n%META:FIELD{}% after\r\n"
+        moin  = "%META:NOT CLOSED\ntext\n after\r\n"
+        self.assertEqual(tm.process_meta(twiki), moin)
+
+    def test_parse(self):
+        twiki = """%META:TOPICINFO{author="JaneDoe" date="1357034400" format="1.1" version="1.3"}%
+%META:TOPICPARENT{name="WebHome"}%
+text
+%META:FILEATTACHMENT{attr="" comment="a %22quoted%22 comment" date="1357034400" name="Sample.txt" path="C:\\Sample.txt" size="1024" user="JaneDoe" version="1"}%
+%META:FILEATTACHMENT{name="Smile.gif" attachment="Smile.gif"}%
+%META:FORM{name="WebFormTemplate"}%
+%META:FIELD{name="OperatingSystem" title="OS" value="OsWin%0AOsMac"}%
+%META:TOPICMOVED{from="Codev.OldName" to="Codev.NewName"}%
+"""
+        txt, meta = parse_meta(twiki)
+        self.assertEqual(txt, "\n\ntext\n\n\n\n\n\n")
+        self.assertEqual(meta.topicinfo['author'], 'JaneDoe')
+        self.assertEqual(meta.parent, 'WebHome')
+        self.assertEqual([entry.name for entry in meta.attachments], 
+                         ['Sample.txt', 'Smile.gif'])
+        sample = meta.attachments[0]
+        self.assertEqual((sample.size, sample.date, sample.user, 
+                          sample.comment), 
+                         (1024, 1357034400, 'JaneDoe', 'a "quoted" comment'))
+        self.assertEqual(meta.form, 'WebFormTemplate')
+        self.assertEqual(meta.fields, 
+                         [('OperatingSystem', 'OS', 'OsWin\nOsMac')])
+        self.assertEqual(meta.other[0][0], 'TOPICMOVED')
+
 
 class LinkTests(unittest.TestCase):
     "Tests for link conversion"
@@ -546,6 +577,153 @@ class TableTests(unittest.TestCase):
         moin = """something |header 1|header2|header3|"""
         self.assertEqual(tm.process_tables(twiki), moin)
 
+    def test_alignment(self):
+        twiki = "| left |   right |  center  |"
+        moin = "|| left ||<)>   right ||<:>  center  ||"
+        self.assertEqual(tm.process_tables(twiki), moin)
+
+    def test_header(self):
+        twiki = "|*Name*|   *Size* |\n| '''Bold''' |  x |"
+        moin = ("||<:>'''Name'''||<)>   '''Size''' ||\n"
+                "||<:> '''Bold''' ||<)>  x ||")
+        self.assertEqual(tm.process_tables(twiki), moin)
+
+    def test_spans(self):
+        twiki = "| a | b ||\n| c | d | e |\n| ^ | f | ^ |\n| ^ | g | h |"
+        moin = ("|| a ||<-2> b ||\n||<|3> c || d ||<|2> e ||\n"
+                "|| f ||\n|| g || h ||")
+        self.assertEqual(tm.process_tables(twiki), moin)
+
+    def test_links(self):
+        twiki = "| [[WebHome|Home]] | {{logo.png|logo}} | [[broken |"
+        moin = "|| [[WebHome|Home]] || {{logo.png|logo}} || [[broken ||"
+        self.assertEqual(tm.process_tables(twiki), moin)
+
+    def test_not_ended(self):
+        twiki = "| a | b |\n| c | d\n| ^ | e |"
+        moin = "|| a || b ||\n|| c || d\n|| ^ || e ||"
+        self.assertEqual(tm.process_tables(twiki), moin)
+
+class BlockTests(unittest.TestCase):
+    "tests for the line oriented block conversion"
+
+    def test_headings(self):
+        twiki = "---+ Heading level 1\n---+++ Heading *level* 3\n---# Numbered"
+        moin = "= Heading level 1 =\n=== Heading *level* 3 ===\n= Numbered ="
+        self.assertEqual(tm.process_blocks(twiki), moin)
+
+    def test_empty_heading(self):
+        twiki = "---+\nnot a heading"
+        moin = "\nnot a heading"
+        self.assertEqual(tm.process_blocks(twiki), moin)
+
+    def test_rules(self):
+        twiki = "text\n\n<hr />\n\n---\n--\n-------"
+        moin = "text\n\n----\n\n----\n--\n----"
+        self.assertEqual(tm.process_blocks(twiki), moin)
+
+    def test_tab_indented_lists(self):
+        twiki = "\t* item\n\t\t* subitem\n\t\t1. number\n\t$ term: def"
+        moin = "   * item\n      * subitem\n       1. number\nterm:: def"
+        self.assertEqual(tm.process_blocks(twiki), moin)
+
+    def test_mixed_lists(self):
+        twiki = "   * item\n      1. first\n      2. second\n   * item 2"
+        moin = "   * item\n       1. first\n       1. second\n   * item 2"
+        self.assertEqual(tm.process_blocks(twiki), moin)
+
+    def test_indented_text(self):
+        twiki = "   2005 was a year\n    * odd indent"
+        self.assertEqual(tm.process_blocks(twiki), twiki)
+
+    def test_table(self):
+        twiki = "|a|b|\n  | c | d |\nsomething |x|"
+        moin = "||a||b||\n  || c || d ||\nsomething |x|"
+        self.assertEqual(tm.process_blocks(twiki), moin)
+
+    def test_preformatted(self):
+        twiki = "{{{\n---+ not a heading\n| not | a table |\n}}}\n---"
+        moin = "{{{\n---+ not a heading\n| not | a table |\n}}}\n----"
+        self.assertEqual(tm.process_blocks(twiki), moin)
+
+
+class EngineTests(unittest.TestCase):
+    "the single pass engine must match twiki2moin on the test cases"
+
+    samples = [
+        "%TOC%", "!%TOC%", "%I%", "!%I%", "%X%", "!%X%", "%VBAR%", 
+        "!%VBAR%", "%CARET%", "!%CARET%", "%ATTACHURL%/image.jpg",
+        "!%ATTACHURL%/image.jpg ", "%ATTACHURLPATH%/image.jpg",
+        "!%ATTACHURLPATH%/image.jpg ",
+        "%META:FILEATTACHMENT{}%",
+        """%META:TOPICINFO{version="1.6" date="976762663" author="LastEditorWikiName" format="1.0"}%
+topic info
+%META:TOPICPARENT{name="NavigationByTopicContext"}%
+%META:FILEATTACHMENT{name="Sample.txt" version="1.3" ... }%
+""",
+        "[[SimpleLink]]", "[[simplelink]]", "[[Simple Link]]",
+        " WikiWord ", " WikiWikiWord ", " WIKIWORD ", " Wiki_Word ",
+        " WikiWord? ", "[[SimpleLink][A Friendly name]]",
+        "[[http://www.example.com]]", "[[https://www.example.com][Example.com]]",
+        "[[attachment:something.jpg][Picture]]", "[[attachment:something.jpg]]",
+        "_italic_", "_italic_word_", "_italic sentence words_",
+        "*bold*", "*bold_word*", "*bold sentence words*",
+        "*bold* sentence *words*", "__bold_italic__", "__bold_italic_word__",
+        "__bold_italic sentence words__", "__bold_italic__ sentence __words__",
+        "=fixed=", "=fixed words=", "<verbatim>something</verbatim>",
+        "\n<verbatim>something\na second line\n</verbatim>",
+        "<literal>something</literal>",
+        "\n<literal>something\na second line\n</literal>",
+        "   $ MoinMoin: A great Wiki software", "   1. Item 1", "   1 Item 1",
+        "   10. Item 10", "   10 Item 10",
+        "\n   1. item\n      1. subitem\n   1. item 2\n      1. subitem\n",
+        "\n   1 item\n      1 subitem\n   1 item 2\n      1 subitem\n",
+        "   * item", "\n   * item\n      * subitem\n   * item 2\n",
+        "---++++++ Heading level 6", "---+++++ Heading level 5",
+        "---++++ Heading level 4", "---+++ Heading level 3",
+        "---++ Heading level 2", "---+ Heading level 1",
+        "---# Heading level 1", "<hr />", "--", "---", "----",
+        "<br />", "<em>emphasis</em>", "<strong>strong</strong>",
+        "&lt;", "&gt;", "&amp;", "<p>paragraph of text</p>",
+        "<p>not paragraph of text", "\n<p>a multiline \nparagraph\n</p>\n",
+        "<pre>This is preformatted content</pre>",
+        "\n<pre>This is preformatted\ncode\ncontent\n</pre>",
+        "\n|header 1|header2|header3|\n|data 1 1 | data 1 2 | data 1 3|\n",
+        "something |header 1|header2|header3|",
+        "| *Name* |   *Size* |\n| [[WebHome][Home]] |  ^  |\n| a ||",
+    ]
+
+    def test_engines_match(self):
+        for prefix in ("", "Parent"):
+            for twiki in self.samples:
+                self.assertEqual(tm.twiki2moin_single_pass(twiki, prefix),
+                                 tm.twiki2moin(twiki, prefix))
+
+    def test_timings(self):
+        twiki = "\n".join(self.samples)
+        for engine, stages in [
+                (tm.twiki2moin, ['variables', 'meta', 'links', 'markup', 
+                                 'tables', 'html']),
+                (tm.twiki2moin_single_pass, ['meta', 'inline', 'blocks'])]:
+            timings = []
+            moin = engine(twiki, "", timings)
+            self.assertEqual(moin, engine(twiki, ""))
+            self.assertEqual([timing[0] for timing in timings], stages)
+            self.assertEqual(timings[0][2], len(twiki))
+            self.assertEqual(timings[-1][3], len(moin))
+            # the body of a page, with the META lines already removed
+            timings = []
+            body = tm.parse_meta(twiki)[0]
+            self.assertEqual(engine(body, "", timings, meta=False), moin)
+            self.assertEqual([timing[0] for timing in timings], 
+                             [stage for stage in stages if stage != 'meta'])
+
+    def test_page(self):
+        twiki = "\n".join(self.samples)
+        for prefix in ("", "Parent"):
+            self.assertEqual(tm.twiki2moin_single_pass(twiki, prefix),
+                             tm.twiki2moin(twiki, prefix))
+
 def suite():
 
     test_cases = [ 
@@ -556,6 +734,8 @@ def suite():
         MarkupTests,
         TableTests,
         HTMLTests,
+        BlockTests,
+        EngineTests,
     ]
     test_suite = unittest.TestSuite(
         [ unittest.TestLoader().loadTestsFromTestCase(test_case)
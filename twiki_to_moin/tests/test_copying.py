@@ -0,0 +1,143 @@
+#
+#   Copyright 2013 La Honda Research Center, Inc.
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import twiki_to_moin.copying as tc
+
+class TransferTests(unittest.TestCase):
+    "Tests for attachment transfer modes"
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.src = os.path.join(self.root, 'source.pdf')
+        self.dest = os.path.join(self.root, 'dest.pdf')
+        with open(self.src, 'wb') as f:
+            f.write(b'attachment data')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def contents(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def test_copy(self):
+        method = tc.transfer_file(self.src, self.dest, 'copy')
+        self.assertTrue(method in ['copy_file_range', 'sendfile', 'copy'])
+        self.assertEqual(self.contents(self.dest), b'attachment data')
+        self.assertNotEqual(os.stat(self.src).st_ino, 
+                            os.stat(self.dest).st_ino)
+
+    def test_short_copy(self):
+        # a copy_range that stops early, as when the file shrinks
+        def copy_range(fd_in, fd_out, offset, count):
+            if offset:
+                return 0
+            return os.write(fd_out, os.read(fd_in, 4))
+        self.assertRaises(IOError, tc._kernel_copy, self.src, self.dest, 
+                          copy_range)
+        functions = tc._transfer_functions.copy()
+        methods = tc._TRANSFER_METHODS['copy']
+        tc._transfer_functions['copy_file_range'] = \
+            lambda src, dest: tc._kernel_copy(src, dest, copy_range)
+        tc._TRANSFER_METHODS['copy'] = ['copy_file_range', 'copy']
+        try:
+            method = tc.transfer_file(self.src, self.dest, 'copy')
+        finally:
+            tc._transfer_functions.update(functions)
+            tc._TRANSFER_METHODS['copy'] = methods
+        self.assertEqual(method, 'copy')
+        self.assertEqual(self.contents(self.dest), b'attachment data')
+
+    def test_hardlink(self):
+        self.assertEqual(tc.transfer_file(self.src, self.dest, 'hardlink'),
+                         'hardlink')
+        self.assertEqual(os.stat(self.src).st_ino, os.stat(self.dest).st_ino)
+
+    def test_symlink(self):
+        self.assertEqual(tc.transfer_file(self.src, self.dest, 'symlink'),
+                         'symlink')
+        self.assertEqual(os.readlink(self.dest), self.src)
+
+    def test_reflink(self):
+        # falls back to a copy where reflinks are not supported 
+        tc.transfer_file(self.src, self.dest, 'reflink')
+        self.assertEqual(self.contents(self.dest), b'attachment data')
+
+    def test_replace_link(self):
+        # copying over an earlier hardlink must not change the source 
+        tc.transfer_file(self.src, self.dest, 'hardlink')
+        with open(self.src + '.new', 'wb') as f:
+            f.write(b'new')
+        tc.transfer_file(self.src + '.new', self.dest, 'copy')
+        self.assertEqual(self.contents(self.src), b'attachment data')
+        self.assertEqual(self.contents(self.dest), b'new')
+
+    def test_missing_source(self):
+        self.assertRaises((IOError, OSError), tc.transfer_file, 
+                          self.src + '.missing', self.dest, 'hardlink')
+        self.assertFalse(os.path.exists(self.dest))
+
+    def test_dedup(self):
+        index = os.path.join(self.root, 'index')
+        os.mkdir(index)
+        other = os.path.join(self.root, 'other.pdf')
+        shutil.copyfile(self.src, other)
+        first, digest = tc.dedup_transfer(self.src, self.dest, index)
+        self.assertNotEqual(first, 'duplicate')
+        second = os.path.join(self.root, 'second.pdf')
+        self.assertEqual(tc.dedup_transfer(other, second, index), 
+                         ('duplicate', digest))
+        self.assertEqual(os.stat(self.dest).st_ino, os.stat(second).st_ino)
+        self.assertNotEqual(os.stat(self.src).st_ino, 
+                            os.stat(second).st_ino)
+
+
+class DirectoryTests(unittest.TestCase):
+    "Tests for Moin topic directories"
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_new_topic(self):
+        existing = set()
+        tc.make_directories(self.root, 'Topic', True, existing)
+        self.assertEqual(sorted(os.listdir(os.path.join(self.root, 'Topic'))),
+                         ['attachments', 'revisions'])
+        self.assertEqual(existing, set(['Topic']))
+
+    def test_existing_topic(self):
+        os.makedirs(os.path.join(self.root, 'Topic', 'revisions'))
+        tc.make_directories(self.root, 'Topic', True, set(['Topic']))
+        tc.make_directories(self.root, 'Topic', False)
+        self.assertEqual(sorted(os.listdir(os.path.join(self.root, 'Topic'))),
+                         ['attachments', 'revisions'])
+
+
+def suite():
+    loader = unittest.TestLoader()
+    return unittest.TestSuite([
+        loader.loadTestsFromTestCase(TransferTests),
+        loader.loadTestsFromTestCase(DirectoryTests),
+    ])
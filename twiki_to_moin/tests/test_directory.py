@@ -0,0 +1,79 @@
+#
+#   Copyright 2013 La Honda Research Center, Inc.
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import twiki_to_moin as ttm
+
+class FindTopicsTests(unittest.TestCase):
+    "Tests for TWiki topic discovery"
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.data = os.path.join(self.root, 'data', 'Main')
+        self.pub = os.path.join(self.root, 'pub', 'Main')
+        os.makedirs(os.path.join(self.data, 'Sub', 'Deeper'))
+        for name in ['WebHome.txt', 'WebHome.txt,v', 'Other.txt', 
+                     'Sub/SubTopic.txt', 'Sub/Deeper/Deep-Topic.txt',
+                     'Sub/notes.lease']:
+            open(os.path.join(self.data, name), 'w').close()
+        # a directory that looks like a topic
+        os.mkdir(os.path.join(self.data, 'Strange.txt'))
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def find(self):
+        return sorted(ttm.find_topics(self.data, self.pub))
+
+    def test_nested(self):
+        join = os.path.join
+        self.assertEqual(self.find(), [
+            (join(self.data, 'Other.txt'), join(self.pub, 'Other'), 
+             '', 'Other'),
+            (join(self.data, 'Sub', 'Deeper', 'Deep-Topic.txt'), 
+             join(self.pub, 'Sub', 'Deeper', 'Deep-Topic'), 
+             join('Sub', 'Deeper'), 'Sub(2f)Deeper(2f)Deep(2d)Topic'),
+            (join(self.data, 'Sub', 'SubTopic.txt'), 
+             join(self.pub, 'Sub', 'SubTopic'), 'Sub', 'Sub(2f)SubTopic'),
+            (join(self.data, 'WebHome.txt'), join(self.pub, 'WebHome'), 
+             '', 'WebHome'),
+        ])
+
+    def test_parent_before_subdirectory(self):
+        topics = [item[3] for item in ttm.find_topics(self.data, self.pub)]
+        self.assertEqual(sorted(topics[:2]), ['Other', 'WebHome'])
+
+    def test_no_data_dir(self):
+        pub_paths = [item[1] for item in ttm.find_topics(self.data, None)]
+        self.assertEqual(pub_paths, [None] * 4)
+
+    def test_symlink_loop(self):
+        os.symlink(self.data, os.path.join(self.data, 'Sub', 'Loop'))
+        self.assertEqual(len(self.find()), 4)
+
+    def test_prefix(self):
+        topics = sorted(item[3] for item in 
+                        ttm.find_topics(self.data, self.pub, 'Parent'))
+        self.assertEqual(topics[0], 'Parent(2f)Other')
+
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(FindTopicsTests)
@@ -0,0 +1,89 @@
+#
+#   Copyright 2013 La Honda Research Center, Inc.
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import twiki_to_moin.editlog as te
+from twiki_to_moin.meta import parse_meta
+
+class EditLogTests(unittest.TestCase):
+    "Tests for Moin edit-log generation"
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, 'edit-log')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_topic_info(self):
+        txt = ('%META:TOPICINFO{author="JaneDoe" date="1357034400" '
+               'format="1.1" version="1.3"}%\nsome text\n')
+        self.assertEqual(te.topic_info(parse_meta(txt)[1]), 
+                         (1357034400, 'JaneDoe', '1.3'))
+        self.assertEqual(te.topic_info(parse_meta('no meta data\n')[1]), 
+                         None)
+
+    def test_rcs_date(self):
+        self.assertEqual(te.rcs_date('2013.01.01.10.00.00'), 1357034400)
+        self.assertEqual(te.rcs_date('99.12.31.23.59.59'), 946684799)
+
+    def test_entry(self):
+        self.assertEqual(te.edit_log_entry(1357034400, 1, 'Sub(2f)Topic', 
+                                           'JaneDoe'), 
+            (1357034400000000, '1357034400000000\t00000001\tSAVENEW\t'
+             'Sub(2f)Topic\t127.0.0.1\tJaneDoe\t\t\t\n'))
+        self.assertEqual(te.edit_log_entry(1, 2, 'Topic', '')[1].split('\t')[2],
+                         'SAVE')
+
+    def read(self):
+        with open(self.path) as f:
+            return [line.split('\t')[:4] for line in f]
+
+    def test_merge(self):
+        edit_log = te.GlobalEditLog(self.path)
+        edit_log.add([te.edit_log_entry(30, 1, 'Two', 'JaneDoe'),
+                      te.edit_log_entry(10, 1, 'One', 'JaneDoe'),
+                      te.edit_log_entry(20, 2, 'One', 'JaneDoe')])
+        self.assertEqual(edit_log.write(), 3)
+        # a second run converting only One
+        edit_log = te.GlobalEditLog(self.path)
+        edit_log.add([te.edit_log_entry(40, 1, 'One', 'PeterSmith')])
+        self.assertEqual(edit_log.write(), 2)
+        self.assertEqual(self.read(), [
+            ['30000000', '00000001', 'SAVENEW', 'Two'],
+            ['40000000', '00000001', 'SAVENEW', 'One'],
+        ])
+
+    def test_remove(self):
+        edit_log = te.GlobalEditLog(self.path)
+        edit_log.add([te.edit_log_entry(10, 1, 'One', 'JaneDoe'),
+                      te.edit_log_entry(20, 1, 'Two', 'JaneDoe'),
+                      te.edit_log_entry(30, 2, 'One', 'JaneDoe')])
+        edit_log.write()
+        self.assertEqual(edit_log.remove(['One', 'Three']), 2)
+        self.assertEqual(self.read(), [
+            ['20000000', '00000001', 'SAVENEW', 'Two'],
+        ])
+
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(EditLogTests)
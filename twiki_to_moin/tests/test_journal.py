@@ -0,0 +1,189 @@
+#
+#   Copyright 2013 La Honda Research Center, Inc.
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+import logging
+import multiprocessing
+import os
+import shutil
+import signal
+import tempfile
+import unittest
+
+import twiki_to_moin as ttm
+from twiki_to_moin.config import single_web
+from twiki_to_moin.journal import Journal, TopicMarker, marker_path
+
+def _convert_and_crash(data, pages, path):
+    """convert in a child process killed on the topic Crash"""
+    convert_topic = ttm.convert_topic
+    def crash(item, *args, **kwargs):
+        if item[0].endswith('Crash.txt'):
+            os.kill(os.getpid(), signal.SIGKILL)
+        return convert_topic(item, *args, **kwargs)
+    ttm.convert_topic = crash
+    ttm.convert_directory([single_web(data)], pages, journal=path)
+
+class JournalTests(unittest.TestCase):
+    "Tests for the checkpoint journal and --resume"
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, 'journal')
+        self.data = os.path.join(self.root, 'data')
+        os.mkdir(self.data)
+        for name in ['Done', 'Stopped', 'Other']:
+            with open(os.path.join(self.data, name + '.txt'), 'w') as f:
+                f.write('Some text\n')
+        self.level = ttm.log.level
+        ttm.log.setLevel(logging.CRITICAL)
+
+    def tearDown(self):
+        ttm.log.setLevel(self.level)
+        shutil.rmtree(self.root)
+
+    def topic(self, name):
+        return os.path.join(self.data, name + '.txt')
+
+    def test_resume(self):
+        journal = Journal(self.path)
+        journal.completed(self.topic('Done'))
+        # a topic whose pages could not be written
+        journal.completed(self.topic('Other'), written=False)
+        journal.flush()
+        journal.stop(self.topic('Stopped'))
+        journal.close()
+        journal = Journal(self.path, resume=True)
+        self.assertEqual(journal.skip(self.topic('Done')), 'done')
+        self.assertEqual(journal.skip(self.topic('Stopped')), 'stopped')
+        self.assertEqual(journal.skip(self.topic('Other')), None)
+        journal.close(remove=True)
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_new_run(self):
+        journal = Journal(self.path)
+        journal.completed(self.topic('Done'))
+        journal.flush()
+        journal.close()
+        journal = Journal(self.path)
+        self.assertEqual(journal.skip(self.topic('Done')), None)
+        journal.close()
+
+    def test_marker(self):
+        marker = TopicMarker(marker_path(self.path, 1))
+        marker.start(self.topic('Stopped'))
+        marker.close()
+        # a marker left empty by a topic converted
+        marker = TopicMarker(marker_path(self.path, 2))
+        marker.start(self.topic('Done'))
+        marker.finish()
+        marker.close()
+        journal = Journal(self.path, resume=True)
+        self.assertEqual(journal.skip(self.topic('Stopped')), 'stopped')
+        self.assertEqual(journal.skip(self.topic('Done')), None)
+        journal.close()
+        self.assertEqual(sorted(os.listdir(self.root)), ['data', 'journal'])
+        journal = Journal(self.path, resume=True)
+        self.assertEqual(journal.skip(self.topic('Stopped')), 'stopped')
+        journal.close()
+
+    def test_killed(self):
+        with open(self.topic('Crash'), 'w') as f:
+            f.write('Some text\n')
+        pages = os.path.join(self.root, 'pages')
+        child = multiprocessing.Process(target=_convert_and_crash, 
+                                        args=(self.data, pages, self.path))
+        child.start()
+        child.join()
+        self.assertEqual(child.exitcode, -signal.SIGKILL)
+        failures = ttm.convert_directory([single_web(self.data)], pages, 
+                                         resume=True, journal=self.path)
+        self.assertEqual(failures, 1)
+        # the page directory is made before the topic is converted
+        self.assertFalse(os.path.exists(os.path.join(pages, 'Crash', 
+                                                     'current')))
+        self.assertTrue(os.path.exists(os.path.join(pages, 'Other', 
+                                                    'current')))
+        # the journal and markers are removed
+        self.assertEqual(sorted(os.listdir(self.root)), 
+                         ['data', 'edit-log', 'pages'])
+
+    def test_interrupted(self):
+        pages = os.path.join(self.root, 'pages')
+        convert_topic = ttm.convert_topic
+        errors = []
+        def stop(item, *args, **kwargs):
+            if item[0].endswith('Stopped.txt'):
+                raise errors[0]
+            return convert_topic(item, *args, **kwargs)
+        ttm.convert_topic = stop
+        try:
+            # Ctrl-C records nothing, the topic is converted again
+            errors.append(KeyboardInterrupt)
+            self.assertRaises(KeyboardInterrupt, ttm.convert_directory,
+                              [single_web(self.data)], pages, 
+                              journal=self.path)
+            journal = Journal(self.path, resume=True)
+            self.assertEqual(journal.skip(self.topic('Stopped')), None)
+            journal.close()
+            # a failure while converting the topic records it
+            errors[0] = SystemExit
+            self.assertRaises(SystemExit, ttm.convert_directory,
+                              [single_web(self.data)], pages, 
+                              journal=self.path)
+            journal = Journal(self.path, resume=True)
+            self.assertEqual(journal.skip(self.topic('Stopped')), 'stopped')
+            journal.close()
+        finally:
+            ttm.convert_topic = convert_topic
+
+    def test_worker_killed(self):
+        with open(self.topic('Crash'), 'w') as f:
+            f.write('Some text\n')
+        pages = os.path.join(self.root, 'pages')
+        convert_topic = ttm.convert_topic
+        def crash(item, *args, **kwargs):
+            if item[0].endswith('Crash.txt'):
+                os.kill(os.getpid(), signal.SIGKILL)
+            return convert_topic(item, *args, **kwargs)
+        # the workers are forked with it
+        ttm.convert_topic = crash
+        try:
+            self.assertRaises(ttm.WorkerError, ttm.convert_directory,
+                              [single_web(self.data)], pages, jobs=2,
+                              journal=self.path)
+        finally:
+            ttm.convert_topic = convert_topic
+        journal = Journal(self.path, resume=True)
+        self.assertEqual(journal.skip(self.topic('Crash')), 'stopped')
+        journal.close()
+
+    def test_convert_directory(self):
+        with open(self.path, 'w') as f:
+            f.write('done\t' + self.topic('Done') + '\n')
+            f.write('stopped\t' + self.topic('Stopped') + '\n')
+        pages = os.path.join(self.root, 'pages')
+        failures = ttm.convert_directory([single_web(self.data)], pages, 
+                                         resume=True, journal=self.path)
+        # the page the earlier run stopped on counts as a failure
+        self.assertEqual(failures, 1)
+        self.assertEqual(os.listdir(pages), ['Other'])
+        self.assertFalse(os.path.exists(self.path))
+
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(JournalTests)
@@ -0,0 +1,95 @@
+#
+#   Copyright 2013 La Honda Research Center, Inc.
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import json
+import logging
+import unittest
+
+from twiki_to_moin.logqueue import (JsonFormatter, Progress, start_logging,
+                                    stop_logging)
+
+class Collector(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class LogQueueTests(unittest.TestCase):
+    "Tests for background logging and progress summaries"
+
+    def setUp(self):
+        self.logger = logging.getLogger('twiki_to_moin.test')
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.collector = Collector()
+        self.logger.addHandler(self.collector)
+
+    def tearDown(self):
+        stop_logging(self.logger)
+        self.logger.removeHandler(self.collector)
+        logging.getLogger('twiki_to_moin.test.pages').setLevel(
+            logging.NOTSET)
+
+    def messages(self):
+        return [record.getMessage() for record in self.collector.records]
+
+    def test_queue(self):
+        start_logging(self.logger)
+        self.assertFalse(self.collector in self.logger.handlers)
+        for i in range(100):
+            self.logger.info("message {0}".format(i))
+        stop_logging(self.logger)
+        self.assertTrue(self.collector in self.logger.handlers)
+        self.assertEqual(self.messages(), 
+                         ["message {0}".format(i) for i in range(100)])
+
+    def test_page_level(self):
+        pages = logging.getLogger('twiki_to_moin.test.pages')
+        pages.setLevel(logging.WARNING)
+        pages.info("Converting TWiki page")
+        pages.warning("Could not copy attachment")
+        self.assertEqual(self.messages(), ["Could not copy attachment"])
+
+    def test_json(self):
+        record = logging.LogRecord('twiki_to_moin', logging.ERROR, __file__,
+                                   1, "Could not convert %s", ('Page',), 
+                                   None)
+        entry = json.loads(JsonFormatter().format(record))
+        self.assertEqual(entry['level'], 'ERROR')
+        self.assertEqual(entry['message'], "Could not convert Page")
+        self.assertTrue(entry['time'].endswith('Z'))
+
+    def test_progress(self):
+        import twiki_to_moin.logqueue as logqueue
+        logger, logqueue.log = logqueue.log, self.logger
+        try:
+            progress = Progress(pages=2, seconds=1000)
+            for failed in [False, True, False]:
+                progress.add(failed)
+            progress.finish()
+            progress.finish()
+        finally:
+            logqueue.log = logger
+        self.assertEqual(len(self.messages()), 2)
+        self.assertTrue(self.messages()[1].startswith(
+            "Progress: 2 TWiki pages converted, 1 failed"))
+
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(LogQueueTests)
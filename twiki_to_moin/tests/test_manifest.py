@@ -0,0 +1,134 @@
+#
+#   Copyright 2013 La Honda Research Center, Inc.
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+import twiki_to_moin as ttm
+from twiki_to_moin.config import single_web
+from twiki_to_moin.manifest import Manifest, conversion_settings
+
+class ManifestTests(unittest.TestCase):
+    "Tests for the source manifest of incremental runs"
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, 'manifest')
+        self.data = os.path.join(self.root, 'data')
+        self.pages = os.path.join(self.root, 'pages')
+        os.mkdir(self.data)
+        for name in ['WebHome', 'Other']:
+            with open(self.topic(name), 'w') as f:
+                f.write('See WebHome\n')
+        self.level = ttm.log.level
+        ttm.log.setLevel(logging.CRITICAL)
+
+    def tearDown(self):
+        ttm.log.setLevel(self.level)
+        shutil.rmtree(self.root)
+
+    def topic(self, name):
+        return os.path.join(self.data, name + '.txt')
+
+    def convert(self, engine='multipass'):
+        failures = ttm.convert_directory([single_web(self.data)], 
+                                         self.pages, engine=engine, 
+                                         manifest=self.path,
+                                         delete_removed=True)
+        self.assertEqual(failures, 0)
+
+    def edit_log_topics(self):
+        with open(os.path.join(self.root, 'edit-log')) as f:
+            return sorted(set(line.split('\t')[3] for line in f))
+
+    def test_record(self):
+        manifest = Manifest(self.path)
+        path = os.path.abspath(self.topic('WebHome'))
+        self.assertEqual(manifest.known(path), {})
+        self.assertFalse(manifest.unchanged({}))
+        st = os.stat(path)
+        manifest.record(path, 'WebHome', 
+                        [(path, st.st_size, st.st_mtime, 'hash')], 
+                        conversion_settings('multipass', ''))
+        manifest.close()
+        # read back from the file
+        manifest = Manifest(self.path)
+        known = manifest.known(path)
+        self.assertEqual(known, {path: (st.st_size, st.st_mtime, 'hash')})
+        self.assertTrue(manifest.unchanged(known))
+        with open(path, 'a') as f:
+            f.write('More text\n')
+        self.assertFalse(manifest.unchanged(known))
+        manifest.forget([path])
+        self.assertEqual(manifest.known(path), {})
+        manifest.close()
+
+    def test_unchanged(self):
+        self.convert()
+        shutil.rmtree(os.path.join(self.pages, 'Other'))
+        # unchanged, so skipped
+        self.convert()
+        self.assertFalse(os.path.exists(os.path.join(self.pages, 'Other')))
+        with open(self.topic('Other'), 'w') as f:
+            f.write('Changed text\n')
+        self.convert()
+        self.assertTrue(os.path.exists(os.path.join(self.pages, 'Other')))
+
+    def test_delete_removed(self):
+        self.convert()
+        self.assertEqual(self.edit_log_topics(), ['Other', 'WebHome'])
+        os.remove(self.topic('Other'))
+        self.convert()
+        self.assertFalse(os.path.exists(os.path.join(self.pages, 'Other')))
+        self.assertTrue(os.path.exists(os.path.join(self.pages, 'WebHome')))
+        self.assertEqual(self.edit_log_topics(), ['WebHome'])
+
+    def test_settings(self):
+        manifest = Manifest(self.path)
+        settings = conversion_settings('multipass', '')
+        sources = [(self.topic('WebHome'), 12, 1.0, 'hash')]
+        manifest.record(self.topic('WebHome'), 'WebHome', sources, settings)
+        known = manifest.known(self.topic('WebHome'), settings)
+        self.assertEqual(list(known.values()), [(12, 1.0, 'hash')])
+        # converted with another engine, or another prefix
+        for other in [conversion_settings('singlepass', ''), 
+                      conversion_settings('multipass', 'Main')]:
+            known = manifest.known(self.topic('WebHome'), other)
+            self.assertEqual(known, {})
+            self.assertFalse(manifest.unchanged(known))
+        manifest.close()
+        # kept by the file
+        manifest = Manifest(self.path)
+        self.assertEqual(manifest.entries[os.path.abspath(
+            self.topic('WebHome'))][5], settings)
+        manifest.close()
+
+    def test_engine_change(self):
+        self.convert()
+        shutil.rmtree(os.path.join(self.pages, 'Other'))
+        self.convert()
+        self.assertFalse(os.path.exists(os.path.join(self.pages, 'Other')))
+        self.convert('singlepass')
+        self.assertTrue(os.path.exists(os.path.join(self.pages, 'Other')))
+
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(ManifestTests)
@@ -0,0 +1,91 @@
+#
+#   Copyright 2013 La Honda Research Center, Inc.
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import json
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+import twiki_to_moin as ttm
+from twiki_to_moin.config import single_web
+from twiki_to_moin.metrics import Histogram, Metrics
+
+class MetricsTests(unittest.TestCase):
+    "Tests for the run metrics"
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.level = ttm.log.level
+        ttm.log.setLevel(logging.CRITICAL)
+
+    def tearDown(self):
+        ttm.log.setLevel(self.level)
+        shutil.rmtree(self.root)
+
+    def test_histogram(self):
+        histogram = Histogram([10, 100])
+        for value in [1, 10, 50, 1000]:
+            histogram.add(value)
+        self.assertEqual(histogram.cumulative(), 
+                         [(10, 2), (100, 3), ('+Inf', 4)])
+        self.assertEqual(histogram.report()['sum'], 1061)
+
+    def test_report(self):
+        metrics = Metrics()
+        metrics.add({'bytes_in': 2000, 'bytes_out': 1800, 'attachments': 2},
+                    [('links', 0.25, 2000, 1900), ('markup', 0.5, 1900, 1800)])
+        metrics.add({}, failed=True)
+        metrics.unwritten(1)
+        report = metrics.report()
+        self.assertEqual(report['topics'], 
+                         {'converted': 0, 'failed': 2, 'skipped': 0})
+        self.assertEqual(report['twiki_bytes'], 2000)
+        self.assertEqual(report['attachments'], 2)
+        self.assertEqual(report['stage_seconds'], 
+                         {'links': 0.25, 'markup': 0.5})
+        self.assertEqual(report['page_seconds']['count'], 1)
+        text = metrics.prometheus(report)
+        self.assertTrue('twiki_to_moin_topics_total{result="failed"} 2\n' 
+                        in text)
+        self.assertTrue('twiki_to_moin_page_bytes_bucket{le="4096"} 1\n'
+                        in text)
+        self.assertTrue('twiki_to_moin_stage_seconds_total{stage="markup"} '
+                        '0.5\n' in text)
+
+    def test_convert_directory(self):
+        data = os.path.join(self.root, 'data')
+        os.mkdir(data)
+        for name in ['WebHome', 'Other']:
+            with open(os.path.join(data, name + '.txt'), 'w') as f:
+                f.write('---+ The %s topic\n' % name)
+        metrics = Metrics(os.path.join(self.root, 'metrics.json'),
+                          os.path.join(self.root, 'metrics.prom'))
+        ttm.convert_directory([single_web(data)], 
+                              os.path.join(self.root, 'pages'),
+                              metrics=metrics)
+        with open(os.path.join(self.root, 'metrics.json')) as f:
+            report = json.load(f)
+        self.assertTrue(report['finished'])
+        self.assertEqual(report['topics']['converted'], 2)
+        self.assertTrue('markup' in report['stage_seconds'])
+        with open(os.path.join(self.root, 'metrics.prom')) as f:
+            self.assertTrue('twiki_to_moin_run_finished 1\n' in f.read())
+
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(MetricsTests)
@@ -0,0 +1,76 @@
+#
+#   Copyright 2013 La Honda Research Center, Inc.
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import twiki_to_moin.plan as tp
+
+class PlanTests(unittest.TestCase):
+    "Tests for the --plan estimates"
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.data = os.path.join(self.root, 'data')
+        self.pub = os.path.join(self.root, 'pub')
+        os.makedirs(os.path.join(self.pub, 'WebHome'))
+        os.mkdir(self.data)
+        pages = {'WebHome': 'A *bold* WikiWord\n' * 10,
+                 'Table': '\n'.join(['text'] + ['| a | b |'] * 30),
+                 'Other': 'Some text\n'}
+        for name, txt in pages.items():
+            with open(os.path.join(self.data, name + '.txt'), 'w') as f:
+                f.write(txt)
+        for name in ['image.png', 'image.png,v']:
+            with open(os.path.join(self.pub, 'WebHome', name), 'w') as f:
+                f.write('x' * 100)
+        self.new_dir = os.path.join(self.root, 'wiki', 'pages')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_plan(self):
+        plan = tp.plan_conversion(self.data, self.pub, self.new_dir)
+        self.assertEqual(plan['topics'], 3)
+        self.assertEqual(plan['attachments'], 1)
+        self.assertEqual(plan['attachment_bytes'], 100)
+        self.assertTrue(plan['output_bytes'] > plan['topic_bytes'])
+        self.assertTrue(plan['enough_space'])
+        self.assertFalse(os.path.exists(os.path.dirname(self.new_dir)))
+
+    def test_large_tables(self):
+        rows = tp.LARGE_TABLE_ROWS
+        tp.LARGE_TABLE_ROWS = 20
+        try:
+            plan = tp.plan_conversion(self.data, self.pub, self.new_dir)
+        finally:
+            tp.LARGE_TABLE_ROWS = rows
+        self.assertEqual(plan['large_tables'], 
+                         [(os.path.join(self.data, 'Table.txt'), 30)])
+
+    def test_shared_attachments(self):
+        copy = tp.plan_conversion(self.data, self.pub, self.new_dir)
+        linked = tp.plan_conversion(self.data, self.pub, self.new_dir,
+                                    attachment_mode='hardlink')
+        self.assertEqual(copy['output_bytes'] - linked['output_bytes'], 100)
+
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(PlanTests)
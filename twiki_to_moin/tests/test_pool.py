@@ -0,0 +1,82 @@
+#
+#   Copyright 2013 La Honda Research Center, Inc.
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+
+import twiki_to_moin as ttm
+from twiki_to_moin.config import single_web
+
+class PoolTests(unittest.TestCase):
+    "Tests for converting topics in worker processes"
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.level = ttm.log.level
+        ttm.log.setLevel(logging.CRITICAL)
+
+    def tearDown(self):
+        ttm.log.setLevel(self.level)
+        shutil.rmtree(self.root)
+
+    def test_imap_bounded(self):
+        taken = []
+
+        def tasks():
+            for i in range(100):
+                taken.append(i)
+                yield i
+
+        pool = multiprocessing.Pool(2)
+        try:
+            results = ttm._imap_bounded(pool, abs, tasks(), chunk_size=4, 
+                                        window=3)
+            for i, result in enumerate(results):
+                self.assertEqual(result, i)
+                # the tasks sent, and not yet taken back
+                self.assertTrue(len(taken) - i <= 4 * 3)
+        finally:
+            pool.terminate()
+            pool.join()
+        self.assertEqual(len(taken), 100)
+
+    def test_convert_directory(self):
+        data = os.path.join(self.root, 'data')
+        os.mkdir(data)
+        for i in range(40):
+            with open(os.path.join(data, 'Topic%d.txt' % i), 'w') as f:
+                f.write('---+ Topic %d\nSee *WebHome*\n' % i)
+        output = {}
+        for jobs in (1, 3):
+            pages = os.path.join(self.root, 'pages%d' % jobs)
+            failures = ttm.convert_directory([single_web(data)], pages, 
+                                             jobs=jobs)
+            self.assertEqual(failures, 0)
+            output[jobs] = {}
+            for topic in os.listdir(pages):
+                path = os.path.join(pages, topic, 'revisions', '00000001')
+                with open(path) as f:
+                    output[jobs][topic] = f.read()
+        self.assertEqual(len(output[1]), 40)
+        self.assertEqual(output[1], output[3])
+
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(PoolTests)
@@ -0,0 +1,123 @@
+#
+#   Copyright 2013 La Honda Research Center, Inc.
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+import json
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+import twiki_to_moin.profiling as tp
+
+class _Records(logging.Handler):
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class ProfileTests(unittest.TestCase):
+    "Tests for the per stage conversion profile"
+
+    def setUp(self):
+        self.profile = tp.Profile(slowest=2)
+        # twenty ordinary pages, 10000 bytes in a millisecond a stage
+        for i in range(20):
+            self.profile.add('Page%d' % i, [('markup', 0.001, 10000, 9000),
+                                            ('tables', 0.0, 10000, 10000)])
+
+    def test_totals(self):
+        report = self.profile.report()
+        self.assertEqual(report['pages'], 20)
+        markup, tables = report['stages']
+        self.assertEqual(markup['stage'], 'markup')
+        self.assertAlmostEqual(markup['seconds'], 0.02)
+        self.assertEqual(markup['percent'], 100.0)
+        self.assertEqual((markup['bytes_in'], markup['bytes_out']), 
+                         (200000, 180000))
+        self.assertEqual(markup['mb_per_second'], 10.0)
+        # a stage that took no time has no rate
+        self.assertEqual(tables['mb_per_second'], None)
+
+    def test_slowest(self):
+        self.profile.add('Slow', [('markup', 0.3, 100, 100)])
+        self.profile.add('Slower', [('markup', 0.2, 100, 100), 
+                                    ('tables', 0.2, 100, 100)])
+        self.profile.add('Quick', [('markup', 0.1, 100, 100)])
+        slowest = self.profile.report()['slowest_pages']
+        self.assertEqual([(page['topic'], page['seconds'], page['bytes']) 
+                          for page in slowest],
+                         [('Slower', 0.4, 100), ('Slow', 0.3, 100)])
+
+    def test_outliers(self):
+        # backtracking: fifty times slower than the median
+        self.profile.add('Backtracking', [('markup', 0.05, 10000, 9000)])
+        # slow per byte, but too quick to matter
+        self.profile.add('Quick', [('markup', 0.009, 10000, 9000)])
+        # a tiny page is rated as MIN_RATE_BYTES long
+        self.profile.add('Tiny', [('markup', 0.02, 10, 10)])
+        outliers = self.profile.outliers(10)
+        self.assertEqual([(page['topic'], page['stage'], 
+                           page['times_median']) for page in outliers],
+                         [('Tiny', 'markup', 195.3), 
+                          ('Backtracking', 'markup', 50.0)])
+        self.assertEqual(len(self.profile.outliers(1)), 1)
+
+    def test_zero_median(self):
+        # every page took no time in tables; any time at all isn't a 
+        # multiple of the median
+        self.profile.add('Other', [('tables', 1.0, 10000, 10000)])
+        self.assertEqual(self.profile.outliers(10), [])
+
+    def test_log_report(self):
+        self.profile.add('Backtracking', [('markup', 0.05, 10000, 9000)])
+        handler = _Records()
+        tp.log.addHandler(handler)
+        level = tp.log.level
+        tp.log.setLevel(logging.INFO)
+        try:
+            self.profile.log_report()
+        finally:
+            tp.log.removeHandler(handler)
+            tp.log.setLevel(level)
+        self.assertEqual(handler.messages[0], 
+                         "Conversion profile for 21 pages:")
+        self.assertTrue("  Backtracking 0.050s 10000 bytes" in 
+                        handler.messages)
+        self.assertEqual(handler.messages[-1], 
+                         "  Backtracking markup 0.050s, 50.0 times the median")
+
+    def test_write_json(self):
+        root = tempfile.mkdtemp()
+        try:
+            path = os.path.join(root, 'profile.json')
+            self.profile.write_json(path)
+            with open(path) as f:
+                report = json.load(f)
+        finally:
+            shutil.rmtree(root)
+        self.assertEqual(report, json.loads(json.dumps(
+            self.profile.report())))
+
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(ProfileTests)
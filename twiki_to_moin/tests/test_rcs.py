@@ -0,0 +1,134 @@
+#
+#   Copyright 2013 La Honda Research Center, Inc.
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import twiki_to_moin.rcs as rcs
+
+# three revisions, in the layout TWiki writes
+TOPIC_V = b"""head	1.3;
+access;
+symbols;
+locks; strict;
+comment	@# @;
+expand	@o@;
+
+
+1.3
+date	2013.02.01.09.30.00;	author PeterSmith;	state Exp;
+branches;
+next	1.2;
+
+1.2
+date	2013.01.15.12.00.00;	author JaneDoe;	state Exp;
+branches;
+next	1.1;
+
+1.1
+date	2013.01.01.08.00.00;	author JaneDoe;	state Exp;
+branches;
+next	;
+
+
+desc
+@none
+@
+
+
+1.3
+log
+@@
+text
+@---+ Topic
+first line
+mail me@@example.com
+third line
+@
+
+
+1.2
+log
+@@
+text
+@d3 1
+a3 1
+second line
+@
+
+
+1.1
+log
+@@
+text
+@d2 3
+a4 1
+only line
+@
+"""
+
+class RcsTests(unittest.TestCase):
+    "Tests for reading RCS history"
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, 'Topic.txt,v')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def archive(self, data=TOPIC_V):
+        with open(self.path, 'wb') as f:
+            f.write(data)
+        return rcs.RcsFile(self.path)
+
+    def test_revisions(self):
+        archive = self.archive()
+        self.assertEqual(list(archive.revisions()), [
+            ('1.3', b'---+ Topic\nfirst line\nmail me@example.com\n'
+                    b'third line\n'),
+            ('1.2', b'---+ Topic\nfirst line\nsecond line\nthird line\n'),
+            ('1.1', b'---+ Topic\nonly line\n'),
+        ])
+
+    def test_deltas(self):
+        archive = self.archive()
+        self.assertEqual(archive.trunk, ['1.3', '1.2', '1.1'])
+        self.assertEqual(archive.deltas['1.2']['author'], 'JaneDoe')
+        self.assertEqual(archive.deltas['1.3']['date'], '2013.02.01.09.30.00')
+
+    def test_apply_delta(self):
+        lines = rcs.split_lines(b'a\nb\nc')
+        self.assertEqual(rcs.apply_delta(lines, b'a0 1\nz\nd3 1\na3 1\nC\n',
+                                         None), [b'z\n', b'a\n', b'b\n', b'C\n'])
+
+    def test_truncated(self):
+        archive = self.archive(TOPIC_V[:TOPIC_V.rindex(b'1.1\nlog')])
+        revisions = archive.revisions()
+        self.assertEqual(next(revisions)[0], '1.3')
+        self.assertEqual(next(revisions)[0], '1.2')
+        self.assertRaises(rcs.RcsError, next, revisions)
+
+    def test_bad_file(self):
+        self.assertRaises(rcs.RcsError, self.archive, b'head 1.1; @oops')
+
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(RcsTests)
@@ -0,0 +1,138 @@
+#
+#   Copyright 2013 La Honda Research Center, Inc.
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+import twiki_to_moin as ttm
+import twiki_to_moin.topicindex as tt
+from twiki_to_moin.config import single_web
+
+class TopicIndexTests(unittest.TestCase):
+    "Tests for the topic index and link checking"
+
+    def setUp(self):
+        self.index = tt.TopicIndex(size=4)
+        for name in ['WebHome', 'Main/FrontPage', 'Main/Sub/ChildTopic',
+                     'Main/FrontPage/Notes', 'Main/ReleaseNotes2']:
+            self.index.add(name)
+
+    def test_lookup(self):
+        self.assertTrue('Main/FrontPage' in self.index)
+        self.assertFalse('Main/Frontpage' in self.index)
+        self.assertTrue(self.index.find_folded('main/frontpage'))
+        self.assertFalse(self.index.find_folded('Main/Other'))
+        # grown from size 4, without losing names or counting twice
+        self.index.add('WebHome')
+        self.assertEqual(len(self.index), 5)
+        self.assertTrue('Main/Sub/ChildTopic' in self.index)
+
+    def test_save_load(self):
+        root = tempfile.mkdtemp()
+        try:
+            path = os.path.join(root, 'topics.idx')
+            self.index.save(path)
+            index = tt.TopicIndex.load(path)
+        finally:
+            shutil.rmtree(root)
+        self.assertEqual(len(index), 5)
+        self.assertTrue('Main/Sub/ChildTopic' in index)
+        self.assertTrue(index.find_folded('WEBHOME'))
+        self.assertFalse('Main/Missing' in index)
+
+    def test_check_links(self):
+        txt = ("[[Main/FrontPage|front]] WebHome MissingTopic\n"
+               "[[Main/ReleaseNotes2]] MissingTopic3\n"
+               "[[Main/frontpage]] [[Main/FrontPage#Notes]] [[/Notes]]\n"
+               "[[http://example.com/]] [[attachment:x.png]] [[#top]]\n"
+               "{{{\nNotATopic\n}}} `AlsoNotATopic`\n")
+        new_txt, dangling = tt.check_links(txt, 'Main/FrontPage', 
+                                           self.index)
+        self.assertEqual(new_txt, txt)
+        self.assertEqual(dangling, [
+            ('MissingTopic', ''), ('MissingTopic3', ''),
+            ('Main/frontpage', 'Main/frontpage (differs in case)')])
+
+    def test_resolve_case(self):
+        dangling = [('Main/FrontPage', 'Main/frontpage', 
+                     'Main/frontpage (differs in case)'),
+                    ('WebHome', 'MAIN/FRONTPAGE', 
+                     'MAIN/FRONTPAGE (differs in case)'),
+                    ('WebHome', 'Gone', 'gone (differs in case)'),
+                    ('WebHome', 'Missing', '')]
+        names = ['WebHome', 'Main/FrontPage', 'Main/Sub/ChildTopic']
+        self.assertEqual(tt.resolve_case(dangling, names), [
+            ('Main/FrontPage', 'Main/frontpage', 
+             'Main/FrontPage (differs in case)'),
+            ('WebHome', 'MAIN/FRONTPAGE', 'Main/FrontPage (differs in case)'),
+            # not found in the names, the link is kept
+            ('WebHome', 'Gone', 'gone (differs in case)'),
+            ('WebHome', 'Missing', '')])
+
+    def test_suggest_web(self):
+        new_txt, dangling = tt.check_links('[[ChildTopic]]', 
+                                           'Main/Sub/Other', self.index)
+        self.assertEqual(dangling, [('ChildTopic', 'Main/Sub/ChildTopic')])
+
+    def test_mark(self):
+        new_txt, dangling = tt.check_links('See MissingTopic, WebHome', 
+                                           'Main/FrontPage', self.index, 
+                                           mark=True)
+        self.assertEqual(new_txt, 'See MissingTopic /!\\, WebHome')
+
+    def test_saved_index(self):
+        root = tempfile.mkdtemp()
+        try:
+            data = os.path.join(root, 'data')
+            os.mkdir(data)
+            with open(os.path.join(data, 'AnIndex.txt'), 'w') as f:
+                f.write('See NewTopic and OldTopic\n')
+            with open(os.path.join(data, 'OldTopic.txt'), 'w') as f:
+                f.write('Old\n')
+            path = os.path.join(root, 'topics.idx')
+            index = ttm._load_topic_index([single_web(data)], path)
+            index.save(path)
+            self.assertTrue(ttm._index_current(tt.TopicIndex.load(path), 
+                                               [single_web(data)]))
+            # a topic added and one removed since the index was saved
+            with open(os.path.join(data, 'NewTopic.txt'), 'w') as f:
+                f.write('New\n')
+            os.remove(os.path.join(data, 'OldTopic.txt'))
+            # in case the changes fall in the same mtime tick as the scan
+            os.utime(data, (1, 1))
+            report = os.path.join(root, 'links')
+            level = ttm.log.level
+            ttm.log.setLevel(logging.CRITICAL)
+            try:
+                ttm.convert_directory([single_web(data)], 
+                                      os.path.join(root, 'pages'),
+                                      link_report=report, topic_index=path)
+            finally:
+                ttm.log.setLevel(level)
+            with open(report) as f:
+                self.assertEqual(f.read().splitlines()[1:], 
+                                 ['AnIndex\tOldTopic\t'])
+        finally:
+            shutil.rmtree(root)
+
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(TopicIndexTests)
@@ -0,0 +1,129 @@
+#
+#   Copyright 2013 La Honda Research Center, Inc.
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+import twiki_to_moin as ttm
+from twiki_to_moin.config import single_web
+from twiki_to_moin.conversion import twiki2moin
+from twiki_to_moin.profiling import StageOutputs
+from twiki_to_moin.verify import (verify_conversion, verify_topic, 
+                                  responsible_stage)
+
+class VerifyTests(unittest.TestCase):
+    "Tests for checking a conversion against an earlier one"
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.data = os.path.join(self.root, 'data')
+        self.pub = os.path.join(self.root, 'pub')
+        self.pages = os.path.join(self.root, 'pages')
+        os.mkdir(self.data)
+        os.mkdir(self.pub)
+        self.level = ttm.log.level
+        ttm.log.setLevel(logging.CRITICAL)
+        self.write_topic('WebHome', '---+ Welcome\nSee *OtherTopic*\n')
+        self.write_topic('OtherTopic', 'Numbers\n| 1 | 2 |\n')
+        ttm.convert_directory([single_web(self.data, self.pub)], 
+                              self.pages)
+
+    def tearDown(self):
+        ttm.log.setLevel(self.level)
+        shutil.rmtree(self.root)
+
+    def write_topic(self, name, txt):
+        with open(os.path.join(self.data, name + '.txt'), 'w') as f:
+            f.write(txt)
+
+    def change_page(self, topic, old, new):
+        path = os.path.join(self.pages, topic, 'revisions', '00000001')
+        with open(path) as f:
+            txt = f.read()
+        self.assertTrue(old in txt)
+        with open(path, 'w') as f:
+            f.write(txt.replace(old, new))
+
+    def verify(self, **options):
+        report_path = os.path.join(self.root, 'report.txt')
+        report = verify_conversion([single_web(self.data, self.pub)], 
+                                   self.pages, report_path, **options)
+        with open(report_path) as f:
+            return report, f.read()
+
+    def test_same(self):
+        report, text = self.verify()
+        self.assertEqual(report['counts'], 
+                         {'same': 2, 'different': 0, 'new': 0, 'failed': 0})
+        self.assertEqual(report['stages'], {})
+        self.assertEqual(report['removed'], [])
+
+    def test_different(self):
+        # as if the earlier conversion had left the bold as it was
+        self.change_page('WebHome', "'''OtherTopic'''", '*OtherTopic*')
+        self.change_page('OtherTopic', '|| 1 || 2 ||', '| 1 | 2 |')
+        report, text = self.verify()
+        self.assertEqual(report['counts']['different'], 2)
+        self.assertEqual(sorted(report['stages']), ['markup', 'tables'])
+        topic, diff = report['stages']['markup'][0]
+        self.assertEqual(topic, 'WebHome')
+        self.assertTrue("+See '''OtherTopic'''" in diff)
+        self.assertTrue('Stage tables: 1 pages' in text)
+
+    def test_new_and_removed(self):
+        self.write_topic('NewTopic', 'New text\n')
+        shutil.rmtree(os.path.join(self.pages, 'WebHome'))
+        os.mkdir(os.path.join(self.pages, 'GoneTopic'))
+        report, text = self.verify()
+        self.assertEqual(report['counts']['new'], 2)
+        self.assertEqual(report['new'], ['NewTopic', 'WebHome'])
+        self.assertEqual(report['removed'], ['GoneTopic'])
+
+    def test_jobs(self):
+        self.change_page('OtherTopic', '|| 1 || 2 ||', '| 1 | 2 |')
+        report, text = self.verify(jobs=2)
+        self.assertEqual(report['counts']['same'], 1)
+        self.assertEqual(list(report['stages']), ['tables'])
+
+    def test_failed(self):
+        item = (os.path.join(self.data, 'Missing.txt'), None, '', 'Missing')
+        topic, result, stage, detail = verify_topic(item, self.pages)
+        self.assertEqual(result, 'failed')
+        self.assertTrue(detail.startswith('IOError') or 
+                        detail.startswith('FileNotFoundError'))
+
+    def test_unconverted(self):
+        # the first difference is a line of TWiki text left as it was
+        golden = twiki2moin('*bold*\n', '').splitlines()
+        stage = responsible_stage('*bold*\n', '', 'multipass', 
+                                  ['*bold*'] + golden[1:])
+        self.assertEqual(stage, 'markup')
+        stage = responsible_stage('plain\n', '', 'multipass', ['other'])
+        self.assertEqual(stage, 'unconverted')
+
+    def test_stage_outputs(self):
+        outputs = StageOutputs()
+        result = twiki2moin('---+ Heading\n', '', outputs)
+        self.assertEqual(len(outputs), len(outputs.texts))
+        self.assertEqual(outputs.texts[-1], result)
+        self.assertEqual(outputs[0][0], 'variables')
+
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(VerifyTests)
@@ -0,0 +1,156 @@
+#
+#   Copyright 2013 La Honda Research Center, Inc.
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import functools
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+import twiki_to_moin as ttm
+from twiki_to_moin.config import single_web
+from twiki_to_moin.manifest import Manifest
+from twiki_to_moin import watch
+from twiki_to_moin.watch import Watcher, watch_directory
+
+class WatchTests(unittest.TestCase):
+    "Tests for converting TWiki changes with --watch"
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.data = os.path.join(self.root, 'data')
+        self.pub = os.path.join(self.root, 'pub')
+        self.pages = os.path.join(self.root, 'moin', 'pages')
+        self.manifest = os.path.join(self.root, 'manifest')
+        os.mkdir(self.data)
+        os.makedirs(os.path.join(self.pub, 'Home'))
+        self.save('Home', 'First text\n')
+        self.save('Other', 'Other text\n')
+        self.level = ttm.log.level
+        ttm.log.setLevel(logging.CRITICAL)
+        ttm.convert_directory([single_web(self.data, self.pub)], self.pages,
+                              manifest=self.manifest)
+
+    def tearDown(self):
+        ttm.log.setLevel(self.level)
+        shutil.rmtree(self.root)
+
+    def save(self, topic, txt, mtime=None):
+        path = os.path.join(self.data, topic + '.txt')
+        with open(path, 'w') as f:
+            f.write(txt)
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+
+    def read(self, *parts):
+        with open(os.path.join(self.pages, *parts)) as f:
+            return f.read()
+
+    def test_poll(self):
+        manifest = Manifest(self.manifest)
+        watcher = Watcher(self.data, self.pub, '', manifest)
+        manifest.close()
+        self.assertEqual(watcher.poll(), [])
+        self.save('Home', 'Changed\n', 1000000000)
+        self.save('New', 'New text\n', 1000000001)
+        changed = watcher.poll()
+        self.assertEqual([item[3] for item in changed], ['Home', 'New'])
+        # found again until it is converted
+        watcher.converted(changed[0][0])
+        self.assertEqual([item[3] for item in watcher.poll()], ['New'])
+        watcher.converted(changed[1][0])
+        self.assertEqual(watcher.poll(), [])
+
+    def test_retry(self):
+        self.save('Home', 'Second text\n', 1000000000)
+        convert_topic = ttm.convert_topic
+        calls = []
+        def fail_once(*args, **kwargs):
+            calls.append(args[0][3])
+            if len(calls) == 1:
+                return None
+            return convert_topic(*args, **kwargs)
+        ttm.convert_topic = fail_once
+        try:
+            failures = watch_directory(self.data, self.pub, self.pages, 
+                                       self.manifest, interval=0, polls=3)
+        finally:
+            ttm.convert_topic = convert_topic
+        # converted again by the next poll, and not after
+        self.assertEqual(failures, 1)
+        self.assertEqual(calls, ['Home', 'Home'])
+        self.assertEqual(self.read('Home', 'revisions', '00000002'), 
+                         'Second text\n')
+
+    def test_new_revisions(self):
+        with open(os.path.join(self.pub, 'Home', 'notes.txt'), 'w') as f:
+            f.write('the notes\n')
+        self.save('Home', '---+ Changed\n'
+                  '%META:FILEATTACHMENT{name="notes.txt" version="1.1"}%\n',
+                  1000000000)
+        # saved again, unchanged
+        self.save('Other', 'Other text\n', 1000000000)
+        failures = watch_directory(self.data, self.pub, self.pages, 
+                                   self.manifest, polls=1)
+        self.assertEqual(failures, 0)
+        self.assertEqual(self.read('Home', 'current'), '00000002')
+        self.assertEqual(self.read('Home', 'revisions', '00000001'), 
+                         'First text\n')
+        self.assertTrue(self.read('Home', 'revisions', '00000002')
+                        .startswith('= Changed =\n'))
+        self.assertEqual(self.read('Home', 'attachments', 'notes.txt'), 
+                         'the notes\n')
+        self.assertEqual(len(self.read('Home', 'edit-log').splitlines()), 2)
+        self.assertEqual(self.read('Other', 'current'), '00000001')
+        with open(os.path.join(self.root, 'moin', 'edit-log')) as f:
+            lines = [line.split('\t')[1:4] for line in f]
+        self.assertEqual(sorted(lines), [['00000001', 'SAVENEW', 'Home'], 
+                                         ['00000001', 'SAVENEW', 'Other'],
+                                         ['00000002', 'SAVE', 'Home']])
+
+    def test_restart(self):
+        self.save('Home', 'Second text\n', 1000000000)
+        watch_directory(self.data, self.pub, self.pages, self.manifest, 
+                        polls=1)
+        # edited while the watch was stopped
+        self.save('Home', 'Third text\n', 1000000100)
+        watch.watch_directory = functools.partial(watch_directory, polls=1)
+        try:
+            ttm.run(['twiki_to_moin', '--watch', '--manifest', 
+                     self.manifest, self.data, self.pub, self.pages])
+        except SystemExit as exit:
+            self.assertEqual(exit.code, 0)
+        finally:
+            watch.watch_directory = watch_directory
+        self.assertEqual(self.read('Home', 'current'), '00000003')
+        self.assertEqual(self.read('Home', 'revisions', '00000001'), 
+                         'First text\n')
+        self.assertEqual(self.read('Home', 'revisions', '00000002'), 
+                         'Second text\n')
+        self.assertEqual(self.read('Home', 'revisions', '00000003'), 
+                         'Third text\n')
+        self.assertEqual(len(self.read('Home', 'edit-log').splitlines()), 3)
+        with open(os.path.join(self.root, 'moin', 'edit-log')) as f:
+            lines = [line.split('\t')[1:4] for line in f]
+        self.assertEqual(sorted(lines), [['00000001', 'SAVENEW', 'Home'], 
+                                         ['00000001', 'SAVENEW', 'Other'],
+                                         ['00000002', 'SAVE', 'Home'],
+                                         ['00000003', 'SAVE', 'Home']])
+
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(WatchTests)
@@ -0,0 +1,165 @@
+#
+#   Copyright 2013 La Honda Research Center, Inc.
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import twiki_to_moin.writer as tw
+from twiki_to_moin.copying import make_directories
+
+class PageWriterTests(unittest.TestCase):
+    "Tests for the background page writer"
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.pages = os.path.join(self.root, 'pages')
+        os.mkdir(self.pages)
+        for topic in ['One', 'Two', 'Three']:
+            make_directories(self.pages, topic, attachments=False)
+        self.make_page = tw.make_page
+        self.fsync_file = tw.fsync_file
+        self.queue_per_thread = tw.QUEUE_PER_THREAD
+        self.fsync_batch = tw.FSYNC_BATCH
+        self.level = tw.log.level
+        tw.log.setLevel(logging.CRITICAL)
+
+    def tearDown(self):
+        tw.make_page = self.make_page
+        tw.fsync_file = self.fsync_file
+        tw.QUEUE_PER_THREAD = self.queue_per_thread
+        tw.FSYNC_BATCH = self.fsync_batch
+        tw.log.setLevel(self.level)
+        shutil.rmtree(self.root)
+
+    def read(self, topic, *parts):
+        with open(os.path.join(self.pages, topic, *parts)) as f:
+            return f.read()
+
+    def test_write(self):
+        writer = tw.PageWriter(threads=2)
+        writer.write(self.pages, 'One', 'first page\n')
+        writer.write(self.pages, 'Two', 'second page\n', revision=2)
+        writer.write_edit_log(self.pages, 'Two', ['one\n', 'two\n'])
+        self.assertEqual(writer.close(), [])
+        self.assertEqual(writer.written, 3)
+        self.assertEqual(self.read('One', 'revisions', '00000001'), 
+                         'first page\n')
+        self.assertEqual(self.read('Two', 'current'), '00000002')
+        self.assertEqual(self.read('Two', 'edit-log'), 'one\ntwo\n')
+
+    def test_unknown_policy(self):
+        self.assertRaises(ValueError, tw.PageWriter, 1, 'sometimes')
+
+    def test_fsync_each(self):
+        calls = []
+        def make_page(new_dir, topic, txt, fsync, revision, current):
+            calls.append(fsync)
+            return []
+        tw.make_page = make_page
+        for policy in ['none', 'batch', 'each']:
+            writer = tw.PageWriter(1, policy)
+            writer.write(self.pages, 'One', 'text\n')
+            writer.close()
+        self.assertEqual(calls, [False, False, True])
+
+    def test_fsync_batch(self):
+        synced = []
+        tw.fsync_file = synced.append
+        tw.FSYNC_BATCH = 2
+        writer = tw.PageWriter(1, 'batch')
+        for topic in ['One', 'Two', 'Three']:
+            writer.write(self.pages, topic, 'text\n')
+        # the first two pages, synced as a batch
+        writer.queue.join()
+        self.assertEqual(len(synced), 4)
+        # the last page, when the writer is closed
+        writer.close()
+        self.assertEqual(len(synced), 6)
+        self.assertEqual(synced[-1], 
+                         os.path.join(self.pages, 'Three', 'current'))
+        synced[:] = []
+        writer = tw.PageWriter(1, 'none')
+        writer.write(self.pages, 'One', 'text\n')
+        writer.close()
+        self.assertEqual(synced, [])
+
+    def test_bounded_queue(self):
+        tw.QUEUE_PER_THREAD = 2
+        release = threading.Event()
+        def make_page(*args):
+            release.wait()
+            return []
+        tw.make_page = make_page
+        writer = tw.PageWriter(1)
+        queued = []
+        def write():
+            # one page being written, and two waiting in the queue
+            for i in range(4):
+                writer.write(self.pages, 'One', 'text\n')
+                queued.append(i)
+        thread = threading.Thread(target=write)
+        thread.start()
+        thread.join(0.5)
+        self.assertTrue(thread.is_alive())
+        self.assertEqual(len(queued), 3)
+        release.set()
+        thread.join()
+        self.assertEqual(writer.close(), [])
+        self.assertEqual(writer.written, 4)
+
+    def test_end(self):
+        release = threading.Event()
+        def make_page(*args):
+            release.wait()
+            return []
+        tw.make_page = make_page
+        writer = tw.PageWriter(1)
+        writer.write(self.pages, 'One', 'text\n', key='One.txt')
+        writer.end('One.txt')
+        # a key with no pages queued is finished at once, one with a 
+        # page being written is not
+        writer.end('Two.txt')
+        self.assertEqual(writer.take_finished(), [('Two.txt', True)])
+        release.set()
+        writer.close()
+        self.assertEqual(writer.take_finished(), [('One.txt', True)])
+
+    def test_failures(self):
+        writer = tw.PageWriter(2)
+        writer.write(self.pages, 'One', 'text\n', key='One.txt')
+        # no topic directory
+        writer.write(self.pages, 'Missing', 'text\n', key='Missing.txt')
+        writer.write_edit_log(self.pages, 'Missing', ['line\n'], 
+                              key='Missing.txt')
+        for key in ['One.txt', 'Missing.txt']:
+            writer.end(key)
+        writer.queue.join()
+        self.assertEqual(sorted(writer.take_finished()), 
+                         [('Missing.txt', False), ('One.txt', True)])
+        self.assertEqual(writer.take_finished(), [])
+        # a failed page is returned once
+        self.assertEqual(writer.close(), ['Missing.txt'])
+        self.assertEqual(writer.written, 1)
+
+
+def suite():
+    return unittest.TestLoader().loadTestsFromTestCase(PageWriterTests)
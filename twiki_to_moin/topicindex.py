@@ -0,0 +1,255 @@
+#
+#   Copyright 2013 La Honda Research Center, Inc.
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Topic index and link checking
+
+TopicIndex holds the Moin page names of every topic being converted, so
+the links in the converted pages can be checked.  A pre-scan of the 
+TWiki directories fills it before the conversion starts, or it is loaded
+from the file saved by an earlier run, when none of the directories has
+been modified since; adding or removing a topic changes it's directory.
+
+The names themselves are not kept: each is reduced to a 64 bit 
+fingerprint, stored in an open addressing hash table in an array, which
+is a few tens of bytes per name and holds millions of topics.  A second
+table holds the fingerprints of the lower cased names, to find links
+that differ from a topic only in case.
+
+check_links() finds the links in a converted page, and looks up each
+target.  Since the names aren't kept, a link that differs from a topic
+only in case is named by resolve_case() from a list of the topics, once
+the dangling links are all found.
+
+"""
+from array import array
+import hashlib
+import json
+import re
+import sys
+
+MAGIC = b'twiki_to_moin topic index 1\n'
+
+# an unsigned 64 bit array; Python 2 has no 'Q', but it's 'L' is 64 bits
+# on 64 bit Linux and OS X
+try:
+    TYPECODE = 'Q'
+    array(TYPECODE)
+except ValueError:
+    TYPECODE = 'L'
+BITS = min(64, array(TYPECODE).itemsize * 8)
+
+def fingerprint(name):
+    """a non zero fingerprint of a name, as wide as the table entries"""
+    if not isinstance(name, bytes):
+        name = name.encode('utf8')
+    digest = hashlib.md5(name).hexdigest()
+    return int(digest[:BITS // 4], 16) or 1
+
+
+class TopicIndex(object):
+    """a set of Moin page names, with case insensitive lookups"""
+
+    def __init__(self, size=1024):
+        self.size = size
+        self.count = 0
+        self.exact = array(TYPECODE, [0]) * size
+        self.folded = array(TYPECODE, [0]) * size
+        self.folded_count = 0
+        # TWiki directory -> modification time when it was scanned
+        self.directories = {}
+
+    def __len__(self):
+        return self.count
+
+    def add(self, name):
+        if self._insert(self.exact, fingerprint(name)):
+            self.count += 1
+            if self._insert(self.folded, fingerprint(name.lower())):
+                self.folded_count += 1
+            if max(self.count, self.folded_count) * 2 > self.size:
+                self._grow()
+
+    def __contains__(self, name):
+        return self._find(self.exact, fingerprint(name))
+
+    def find_folded(self, name):
+        """True if a name differing only in case is in the index"""
+        return self._find(self.folded, fingerprint(name.lower()))
+
+    def _find(self, table, key):
+        mask = self.size - 1
+        i = key & mask
+        while True:
+            value = table[i]
+            if value == key:
+                return True
+            if not value:
+                return False
+            i = (i + 1) & mask
+
+    def _insert(self, table, key):
+        """add a key to a table; False if it was already there"""
+        mask = self.size - 1
+        i = key & mask
+        while True:
+            value = table[i]
+            if value == key:
+                return False
+            if not value:
+                table[i] = key
+                return True
+            i = (i + 1) & mask
+
+    def _grow(self):
+        old = [self.exact, self.folded]
+        self.size *= 2
+        self.exact = array(TYPECODE, [0]) * self.size
+        self.folded = array(TYPECODE, [0]) * self.size
+        for table, new in zip(old, [self.exact, self.folded]):
+            for key in table:
+                if key:
+                    self._insert(new, key)
+
+    def save(self, path):
+        header = {'size': self.size, 'count': self.count, 
+                  'folded_count': self.folded_count,
+                  'byteorder': sys.byteorder, 'bits': BITS, 
+                  'directories': self.directories}
+        with open(path, 'wb') as f:
+            f.write(MAGIC)
+            f.write(json.dumps(header).encode('ascii') + b'\n')
+            self.exact.tofile(f)
+            self.folded.tofile(f)
+
+    @classmethod
+    def load(cls, path):
+        """read an index written by save()"""
+        with open(path, 'rb') as f:
+            if f.readline() != MAGIC:
+                raise ValueError("{0} is not a topic index".format(path))
+            header = json.loads(f.readline().decode('ascii'))
+            if header['bits'] != BITS:
+                raise ValueError("{0} was written with {1} bit entries".format(
+                    path, header['bits']))
+            index = cls(header['size'])
+            index.count = header['count']
+            index.folded_count = header['folded_count']
+            index.directories = header.get('directories', {})
+            for table in [index.exact, index.folded]:
+                del table[:]
+                table.fromfile(f, header['size'])
+                if header['byteorder'] != sys.byteorder:
+                    table.byteswap()
+        return index
+
+
+# links in a converted page: [[target|text]], and Moin WikiWords, which
+# may end in digits; preformatted text and `fixed` text are skipped
+_link_re = re.compile(r"\{\{\{[\s\S]*?\}\}\}|`[^`\n]*`|"
+                      r"\[\[(?P<target>[^|\]]*)[^\]]*\]\]|"
+                      r"(?:(?<=\s)|^)(?P<word>[A-Z][a-z]+[A-Z]+[a-zA-Z0-9]+)",
+                      re.M)
+# interwiki, attachment: and URL targets are not topics
+_scheme_re = re.compile(r"[A-Za-z][\w+.-]*:")
+
+# appended to an unresolved link with mark
+DANGLING_MARK = " /!\\"
+# appended to a suggestion that differs from the link only in case
+CASE_NOTE = " (differs in case)"
+
+def check_links(txt, page, index, mark=False):
+    """look up the targets of the links in a converted page
+
+    page is the Moin name of the page
+    returns the page text, with the unresolved links marked when mark is
+    set, and a list of (target, suggestion) for the unresolved links; 
+    the suggestion is a topic that exists and differs only in the sub 
+    web, the link followed by CASE_NOTE when a topic differs from it only
+    in case (see resolve_case()), or ''
+    """
+    dangling = []
+    web = page.rpartition('/')[0]
+
+    def check(matchobj):
+        target = matchobj.group('target') or matchobj.group('word')
+        if target is None:
+            return matchobj.group(0)
+        target = target.partition('#')[0].strip()
+        if not target or _scheme_re.match(target):
+            return matchobj.group(0)
+        if target.startswith('../'):
+            target = (web + '/' + target[3:]).lstrip('/')
+        elif target.startswith('/'):
+            target = page + target
+        if target in index:
+            return matchobj.group(0)
+        dangling.append((target, suggest(target, web, index)))
+        if mark:
+            return matchobj.group(0) + DANGLING_MARK
+        return matchobj.group(0)
+
+    txt = _link_re.sub(check, txt)
+    return txt, dangling
+
+def suggest(target, web, index):
+    """a topic that exists and is probably what a broken link meant"""
+    candidates = [target]
+    if web and not target.startswith(web + '/'):
+        # TWiki links are to topics in the same web
+        candidates.insert(0, web + '/' + target)
+    for candidate in candidates:
+        if candidate in index:
+            return candidate
+    for candidate in candidates:
+        if index.find_folded(candidate):
+            return candidate + CASE_NOTE
+    return ''
+
+def resolve_case(dangling, names):
+    """name the topics in the suggestions that differ only in case
+
+    dangling is a list of (page, target, suggestion), and names the Moin
+    page names of the topics; returns the list with each suggestion
+    ending in CASE_NOTE naming the topic rather than the link
+    """
+    folded = {}
+    for page, target, suggestion in dangling:
+        if suggestion.endswith(CASE_NOTE):
+            folded[suggestion[:-len(CASE_NOTE)].lower()] = None
+    if not folded:
+        return dangling
+    for name in names:
+        if folded.get(name.lower(), name) is None:
+            folded[name.lower()] = name
+    resolved = []
+    for page, target, suggestion in dangling:
+        if suggestion.endswith(CASE_NOTE):
+            link = suggestion[:-len(CASE_NOTE)]
+            suggestion = (folded[link.lower()] or link) + CASE_NOTE
+        resolved.append((page, target, suggestion))
+    return resolved
+
+def write_report(path, dangling):
+    """write the dangling links, a tab separated line per link
+
+    dangling is a list of (page, target, suggestion)
+    """
+    dangling.sort()
+    with open(path, 'w') as f:
+        f.write("# page\tlink target\tsuggestion\n")
+        for entry in dangling:
+            f.write('\t'.join(entry) + '\n')
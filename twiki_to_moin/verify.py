@@ -0,0 +1,242 @@
+#
+#   Copyright 2013 La Honda Research Center, Inc.
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Checking a conversion against an earlier one (--verify-against)
+
+verify_conversion() converts every topic again, in worker processes,
+without writing anything, and compares each page with the current 
+revision of the same topic in an earlier Moin pages directory.  The 
+hashes are compared first; only a page that differs is looked at again.
+It is converted once more keeping the output of each conversion stage,
+and the first difference is put down to a stage: the last stage that 
+changed the first new line that differs, or 'unconverted' when that 
+line is the TWiki text left as it was.  The report lists the pages that
+differ by stage, with diffs for the first few.
+
+"""
+import difflib
+import hashlib
+import logging
+import multiprocessing
+import os
+import signal
+
+log = logging.getLogger('twiki_to_moin')
+
+# pages per stage shown with their diff in the report, and the diff
+# lines shown per page
+DIFF_PAGES = 20
+DIFF_LINES = 60
+
+# results of comparing a page
+SAME = 'same'
+DIFFERENT = 'different'
+NEW = 'new'
+FAILED = 'failed'
+
+def verify_conversion(webs, golden_dir, report_path=None, engine='multipass',
+                      jobs=1, charset='auto'):
+    """compare a new conversion of the webs with the pages in golden_dir
+
+    webs is a list of config.Web, see convert_directory(); charset is 
+    used for the webs that don't give their own
+    report_path is the file the report is written to, if any
+    returns a dict with the pages counted by result, the different 
+    pages by stage, the failed and new topics, and the Moin pages in 
+    golden_dir with no TWiki topic
+    """
+    from twiki_to_moin import find_topics
+
+    def topics():
+        for web in webs:
+            for item in find_topics(web.page_dir, web.data_dir, web.prefix):
+                yield item, web.charset or charset
+
+    worker_args = (golden_dir, engine)
+    if jobs > 1:
+        pool = multiprocessing.Pool(jobs, _init_worker)
+        results = pool.imap_unordered(_verify_in_worker, 
+                                      ((task, worker_args) 
+                                       for task in topics()), 
+                                      chunksize=16)
+    else:
+        pool = None
+        results = (verify_topic(item, golden_dir, engine, topic_charset) 
+                   for item, topic_charset in topics())
+
+    counts = {SAME: 0, DIFFERENT: 0, NEW: 0, FAILED: 0}
+    # stage -> [(topic, diff lines)], diffs for the first DIFF_PAGES
+    stages = {}
+    failed = []
+    new = []
+    seen = set()
+    try:
+        for topic, result, stage, detail in results:
+            seen.add(topic)
+            counts[result] += 1
+            if result == DIFFERENT:
+                pages = stages.setdefault(stage, [])
+                pages.append((topic, detail if len(pages) < DIFF_PAGES 
+                              else None))
+            elif result == FAILED:
+                failed.append((topic, detail))
+            elif result == NEW:
+                new.append(topic)
+    finally:
+        if pool:
+            pool.terminate()
+            pool.join()
+
+    removed = sorted(name for name in os.listdir(golden_dir) 
+                     if name not in seen and 
+                     os.path.isdir(os.path.join(golden_dir, name)))
+    report = {'counts': counts, 'stages': stages, 'failed': sorted(failed),
+              'new': sorted(new), 'removed': removed}
+    log_verification(report, golden_dir)
+    if report_path:
+        write_report(report_path, report, golden_dir)
+        msg = "Wrote the verification report to {0}".format(report_path)
+        log.info(msg)
+    return report
+
+def verify_topic(item, golden_dir, engine='multipass', charset='auto'):
+    """convert a topic, and compare it with the page in golden_dir
+
+    returns (topic, result, stage, detail); the stage and a diff are
+    given for a page that differs, and an error for one that failed
+    """
+    from twiki_to_moin.charset import decode_page, to_bytes
+    from twiki_to_moin.conversion import ENGINES
+    from twiki_to_moin.copying import current_revision
+    from twiki_to_moin.meta import parse_meta
+
+    twiki_path, pub_path, prefix, topic = item
+    try:
+        with open(twiki_path, 'rb') as f:
+            body = parse_meta(decode_page(f.read(), charset))[0]
+        new_txt = ENGINES[engine](body, prefix, meta=False)
+        revision = current_revision(golden_dir, topic)
+        if not revision:
+            return topic, NEW, None, None
+        golden_path = os.path.join(golden_dir, topic, "revisions", 
+                                   "{0:08d}".format(revision))
+        with open(golden_path, 'rb') as f:
+            golden = f.read()
+        new_data = to_bytes(new_txt)
+        if (hashlib.sha1(new_data).digest() == 
+            hashlib.sha1(golden).digest()):
+            return topic, SAME, None, None
+        golden_txt = decode_page(golden, 'utf-8')
+        stage = responsible_stage(body, prefix, engine, 
+                                  golden_txt.splitlines())
+        diff = list(difflib.unified_diff(
+            golden_txt.splitlines(), new_txt.splitlines(), 
+            'earlier/' + topic, 'new/' + topic, lineterm=''))
+        return topic, DIFFERENT, stage, diff[:DIFF_LINES]
+    except Exception as detail:
+        return topic, FAILED, None, "{0}: {1}".format(
+            detail.__class__.__name__, detail)
+
+def responsible_stage(body, prefix, engine, golden_lines):
+    """the conversion stage the first difference from golden_lines is
+    put down to, see the module docstring
+    """
+    from twiki_to_moin.conversion import ENGINES
+    from twiki_to_moin.profiling import StageOutputs
+
+    outputs = StageOutputs()
+    new_lines = ENGINES[engine](body, prefix, outputs, 
+                                meta=False).splitlines()
+    names = [timing[0] for timing in outputs]
+    # the lines of the text before and after each stage
+    texts = [set(body.splitlines())] + [set(text.splitlines()) 
+                                        for text in outputs.texts]
+    matcher = difflib.SequenceMatcher(None, golden_lines, new_lines)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag != 'equal':
+            break
+    else:
+        # only the line endings differ
+        return 'whitespace'
+    # for lines missing from the new page, the new lines around them
+    lines = new_lines[j1:j2] or new_lines[max(j1 - 1, 0):j1 + 1]
+    for line in lines:
+        if not line.strip():
+            continue
+        stage = len(texts) - 1
+        while stage > 0 and line in texts[stage - 1]:
+            stage -= 1
+        return names[stage - 1] if stage else 'unconverted'
+    return 'whitespace'
+
+def _by_size(entry):
+    # the stages with the most pages first
+    stage, pages = entry
+    return -len(pages), stage
+
+def _init_worker():
+    # an interrupt is handled by the parent, which stops the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def _verify_in_worker(task):
+    (item, charset), (golden_dir, engine) = task
+    return verify_topic(item, golden_dir, engine, charset)
+
+def log_verification(report, golden_dir):
+    counts = report['counts']
+    msg = ("Verified {0} pages against {1}: {2} the same, {3} different, "
+           "{4} new, {5} failed.").format(sum(counts.values()), golden_dir,
+           counts[SAME], counts[DIFFERENT], counts[NEW], counts[FAILED])
+    log.info(msg)
+    for stage, pages in sorted(report['stages'].items(), 
+                               key=_by_size):
+        msg = "  {0}: {1} pages differ".format(stage, len(pages))
+        log.info(msg)
+    if report['removed']:
+        msg = "{0} Moin pages in {1} have no TWiki topic.".format(
+            len(report['removed']), golden_dir)
+        log.info(msg)
+
+def write_report(path, report, golden_dir):
+    """write the pages that differ, by stage, with their diffs"""
+    from twiki_to_moin.charset import to_bytes
+    counts = report['counts']
+    lines = ["Verification against {0}".format(golden_dir),
+             "{0} the same, {1} different, {2} new, {3} failed".format(
+             counts[SAME], counts[DIFFERENT], counts[NEW], counts[FAILED])]
+    for stage, pages in sorted(report['stages'].items(), 
+                               key=_by_size):
+        lines += ["", "Stage {0}: {1} pages".format(stage, len(pages))]
+        pages = sorted(pages)
+        for topic, diff in pages:
+            lines.append("  " + topic)
+        for topic, diff in pages:
+            if diff:
+                lines += [""] + diff
+    if report['failed']:
+        lines += ["", "Failed: {0} pages".format(len(report['failed']))]
+        lines += ["  {0}: {1}".format(topic, error) 
+                  for topic, error in report['failed']]
+    if report['new']:
+        lines += ["", "New topics: {0}".format(len(report['new']))]
+        lines += ["  " + topic for topic in report['new']]
+    if report['removed']:
+        lines += ["", "Moin pages with no TWiki topic: {0}".format(
+                  len(report['removed']))]
+        lines += ["  " + topic for topic in report['removed']]
+    with open(path, 'wb') as f:
+        f.write(to_bytes('\n'.join(lines) + '\n'))
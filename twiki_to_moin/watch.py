@@ -0,0 +1,204 @@
+#
+#   Copyright 2013 La Honda Research Center, Inc.
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Converting TWiki changes as they are made (--watch)
+
+After the first conversion run, the TWiki web is polled for changed
+topics.  Each poll lists the TWiki directories, and compares the size 
+and modification time of each topic with the last poll; no pages are
+read unless they have changed.  The changed topics are converted in 
+batches, each page as a new Moin revision after the topic's current 
+one, with it's attachments that are new or changed (TWiki saves the 
+topic when an attachment is uploaded).
+
+The state of the topics is kept in the source manifest (see 
+manifest.py), so a page saved again without changes doesn't make a new
+revision, and a restarted watch carries on where it stopped.  For each 
+batch, the time from the TWiki save to the Moin page being written 
+(latency), and the changed topics still waiting (queue depth) are 
+logged.
+
+"""
+import logging
+import os
+import time
+
+log = logging.getLogger('twiki_to_moin')
+
+# seconds between polls
+WATCH_INTERVAL = 10.0
+# changed topics converted before the manifest and global edit-log are
+# updated, and the batch is reported
+WATCH_BATCH = 100
+
+def scan_topics(old_dir, data_dir, prefix=''):
+    """return {twiki_path: (item, size, mtime)} for the topics in old_dir
+
+    item is the topic's tuple from find_topics()
+    """
+    from twiki_to_moin import find_topics
+    topics = {}
+    # from the directory listing, see find_topics()
+    stats = {}
+    for item in find_topics(old_dir, data_dir, prefix, stats=stats):
+        st = stats.pop(item[0])
+        topics[item[0]] = (item, st.st_size, st.st_mtime)
+    return topics
+
+
+class Watcher(object):
+    """find the topics changed between polls of a TWiki web
+
+    the first poll compares the topics with their state in the manifest;
+    a changed topic is found again by each poll until converted() is 
+    called for it
+    """
+
+    def __init__(self, old_dir, data_dir, prefix, manifest):
+        self.old_dir = old_dir
+        self.data_dir = data_dir
+        self.prefix = prefix
+        # twiki path -> (size, mtime) when it was last converted, and 
+        # when the changed topics were last polled
+        self.state = {}
+        self.changed = {}
+        for path, entry in manifest.entries.items():
+            if path == entry[0]:
+                self.state[path] = tuple(entry[2:4])
+
+    def poll(self):
+        """return the items of the changed and new topics, oldest first
+
+        removed topics are logged
+        """
+        topics = scan_topics(self.old_dir, self.data_dir, self.prefix)
+        changed = []
+        self.changed = {}
+        for twiki_path, (item, size, mtime) in topics.items():
+            path = os.path.abspath(twiki_path)
+            if self.state.get(path) != (size, mtime):
+                self.changed[path] = (size, mtime)
+                changed.append((mtime, item))
+        root = os.path.join(os.path.abspath(self.old_dir), '')
+        found = set(os.path.abspath(path) for path in topics)
+        for path in [path for path in self.state 
+                     if path.startswith(root) and path not in found]:
+            msg = "TWiki page {0} was removed".format(path)
+            log.info(msg)
+            del self.state[path]
+        changed.sort(key=lambda change: change[0])
+        return [item for mtime, item in changed]
+
+    def converted(self, twiki_path):
+        """note a changed topic from the last poll as converted"""
+        path = os.path.abspath(twiki_path)
+        self.state[path] = self.changed.pop(path)
+
+
+def watch_directory(old_dir, data_dir, new_dir, manifest, prefix='',
+                    interval=WATCH_INTERVAL, polls=None, **options):
+    """convert the changed TWiki topics in old_dir until interrupted
+
+    manifest is the path of the source manifest, normally written by a 
+    convert_directory() run just before
+    polls limits the number of polls, mostly for testing
+    options are passed on to convert_topic(), see convert_directory()
+    returns the number of topics that could not be converted
+    """
+    from twiki_to_moin.editlog import GlobalEditLog
+    from twiki_to_moin.manifest import Manifest
+
+    manifest = Manifest(manifest)
+    msg = "Using source manifest {0} with {1} entries".format(
+        manifest.path, len(manifest.entries))
+    log.debug(msg)
+    watcher = Watcher(old_dir, data_dir, prefix, manifest)
+    edit_log = GlobalEditLog(os.path.join(
+        os.path.dirname(os.path.abspath(new_dir)), "edit-log"))
+    msg = "Watching {0} for changes every {1} seconds".format(old_dir, 
+                                                              interval)
+    log.info(msg)
+    failures = 0
+    count = 0
+    try:
+        while polls is None or count < polls:
+            if count:
+                time.sleep(interval)
+            count += 1
+            queue = watcher.poll()
+            while queue:
+                batch, queue = queue[:WATCH_BATCH], queue[WATCH_BATCH:]
+                failures += _convert_batch(batch, new_dir, manifest, 
+                                           watcher, edit_log, len(queue),
+                                           options)
+    except KeyboardInterrupt:
+        msg = "Stopped watching {0}".format(old_dir)
+        log.info(msg)
+    finally:
+        if edit_log.entries:
+            # from a batch that was interrupted
+            edit_log.append()
+        manifest.close()
+    return failures
+
+def _convert_batch(batch, new_dir, manifest, watcher, edit_log, depth, 
+                   options):
+    """convert a batch of changed topics as new Moin revisions
+
+    a topic that fails is converted again by the watcher's next poll
+    depth is the number of changed topics waiting after the batch
+    returns the number of topics that failed
+    """
+    from twiki_to_moin import convert_topic
+    from twiki_to_moin.manifest import conversion_settings
+    failures = revisions = 0
+    # seconds from the TWiki save to the new Moin revision
+    latencies = []
+    for item in batch:
+        settings = conversion_settings(options.get('engine', 'multipass'), 
+                                       item[2])
+        known = manifest.known(item[0], settings)
+        stats = {}
+        sources = convert_topic(item, new_dir, known, stats, 
+                                new_revision=True, **options)
+        if sources is None:
+            failures += 1
+            continue
+        manifest.record(item[0], item[3], sources, settings)
+        watcher.converted(item[0])
+        if 'edits' not in stats:
+            # saved again without changes
+            continue
+        edit_log.add(stats['edits'])
+        revisions += 1
+        try:
+            latencies.append(time.time() - os.path.getmtime(item[0]))
+        except OSError:
+            pass
+    manifest.commit()
+    if edit_log.entries:
+        edit_log.append()
+    if latencies:
+        latency = "{0:.1f}s average, {1:.1f}s longest".format(
+            sum(latencies) / len(latencies), max(latencies))
+    else:
+        latency = "none"
+    msg = ("Converted {0} changed TWiki pages, {1} new Moin revisions, {2} "
+           "failed; latency {3}; {4} more changes waiting").format(
+           len(batch) - failures, revisions, failures, latency, depth)
+    log.info(msg)
+    return failures
@@ -0,0 +1,231 @@
+#
+#   Copyright 2013 La Honda Research Center, Inc.
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Background writer for the converted Moin pages
+
+Converting a page is CPU work, writing it is I/O, which on a network file
+system is often the slower of the two.  PageWriter takes the converted 
+pages from the conversion loop through a bounded queue, and writes them
+with a small pool of threads, so the conversion doesn't wait for the
+file system.  A full queue blocks the conversion loop, which keeps the
+memory used by pending pages bounded.
+
+The fsync policy trades durability for speed:
+
+- none: leave flushing the files to the operating system (the default)
+- batch: each thread fsyncs the files it wrote every FSYNC_BATCH pages,
+  and when the writer is closed
+- each: fsync every file as it is written
+
+"""
+import logging
+import os
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from twiki_to_moin.copying import make_page, make_edit_log
+
+log = logging.getLogger('twiki_to_moin')
+
+FSYNC_POLICIES = ['none', 'batch', 'each']
+
+# pages written by a thread between fsyncs, for the batch policy
+FSYNC_BATCH = 200
+
+# pending pages allowed in the queue, per thread
+QUEUE_PER_THREAD = 16
+
+def fsync_file(path):
+    """flush a file that has already been written and closed to disk"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class PageWriter(object):
+    """write Moin pages in background threads
+
+    write(), write_edit_log() a page's edit-log, and close()
+    waits until all the queued files are written.  A page that can't be 
+    written is logged when the writer is closed, and returned by close().
+
+    end() marks the last page queued for a key; take_finished() then 
+    returns the keys whose pages have all been written, as the threads
+    finish them, without waiting for the queue.
+
+    """
+
+    def __init__(self, threads=4, fsync='none'):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError("unknown fsync policy {0}".format(fsync))
+        self.fsync = fsync
+        self.queue = queue.Queue(threads * QUEUE_PER_THREAD)
+        self.lock = threading.Lock()
+        # (key, topic, error) of the pages that could not be written
+        self.failures = []
+        self.written = 0
+        # pages queued and not yet written, and the keys that failed, by key
+        self.pending = {}
+        self.failed_keys = set()
+        # keys with no more pages to queue, and (key, written) of the keys
+        # whose pages are all done
+        self.ended = set()
+        self.finished = []
+        self.threads = []
+        for i in range(threads):
+            thread = threading.Thread(target=self._run, 
+                                      name="twiki_to_moin-writer-{0}".format(i))
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def write(self, new_dir, topic, txt, key=None, revision=1, current=True):
+        """queue a page to be written; blocks while the queue is full
+
+        key identifies the page to the caller in failures, the topic is 
+        used when it is not given.  revision and current are passed on
+        to copying.make_page().
+        """
+        self._put(key or topic, topic, make_page, 
+                  (new_dir, topic, txt, self.fsync == 'each', revision, 
+                   current))
+
+    def write_edit_log(self, new_dir, topic, lines, key=None):
+        """queue a page's edit-log to be written, see write()"""
+        self._put(key or topic, topic, make_edit_log,
+                  (new_dir, topic, lines, self.fsync == 'each'))
+
+    def _put(self, key, topic, function, args):
+        with self.lock:
+            self.pending[key] = self.pending.get(key, 0) + 1
+        self.queue.put((key, topic, function, args))
+
+    def end(self, key):
+        """note that all of key's pages are queued, see take_finished()"""
+        with self.lock:
+            if key in self.pending:
+                self.ended.add(key)
+            else:
+                self.finished.append((key, key not in self.failed_keys))
+
+    def take_finished(self):
+        """return the (key, written) of the keys ended and done since 
+        the last call; written is False if a page could not be written
+        """
+        with self.lock:
+            finished, self.finished = self.finished, []
+        return finished
+
+    def _run(self):
+        # files written by this thread, and not yet synced
+        unsynced = []
+        pages = 0
+        while True:
+            job = self.queue.get()
+            if job is None:
+                self.queue.task_done()
+                break
+            key, topic, function, args = job
+            try:
+                paths = function(*args)
+                if self.fsync == 'batch':
+                    unsynced.extend(paths)
+                    pages += 1
+                    if pages >= FSYNC_BATCH:
+                        self._sync(unsynced)
+                        unsynced = []
+                        pages = 0
+                with self.lock:
+                    self.written += 1
+            except Exception as detail:
+                with self.lock:
+                    self.failures.append((key, topic, detail))
+                    self.failed_keys.add(key)
+            self._done(key)
+            self.queue.task_done()
+        self._sync(unsynced)
+
+    def _sync(self, paths):
+        for path in paths:
+            try:
+                fsync_file(path)
+            except (IOError, OSError) as detail:
+                msg = "Could not fsync {0}: {1}".format(path, detail)
+                log.warning(msg)
+
+    def _done(self, key):
+        with self.lock:
+            if key not in self.pending:
+                return
+            self.pending[key] -= 1
+            if self.pending[key]:
+                return
+            del self.pending[key]
+            if key in self.ended:
+                self.ended.remove(key)
+                self.finished.append((key, key not in self.failed_keys))
+
+    def close(self):
+        """write the remaining pages, and stop the threads
+
+        returns the keys of the pages that could not be written
+        """
+        for thread in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+        self.failures.sort(key=lambda failure: failure[1])
+        keys = []
+        for key, topic, detail in self.failures:
+            msg = "Could not write Moin topic {0}: {1}".format(topic, detail)
+            log.error(msg)
+            if key not in keys:
+                keys.append(key)
+        return keys
+
+
+class PageBuffer(object):
+    """stands in for a PageWriter in a worker process
+
+    the pages are held, and returned to the parent process with the
+    topic's result to be written there, as a list of (method, arguments,
+    keyword arguments)
+    """
+
+    def __init__(self):
+        self.pages = []
+
+    def write(self, new_dir, topic, txt, key=None, revision=1, current=True):
+        self.pages.append(('write', (topic, txt), 
+                           dict(revision=revision, current=current)))
+
+    def write_edit_log(self, new_dir, topic, lines, key=None):
+        self.pages.append(('write_edit_log', (topic, lines), {}))
+
+    def write_attachment(self, new_dir, topic, name, src, key=None):
+        self.pages.append(('write_attachment', (topic, name, src), {}))
+
+    def take(self):
+        pages, self.pages = self.pages, []
+        return pages